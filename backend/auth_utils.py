@@ -1,13 +1,19 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Generator
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 import bcrypt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from database import get_db
+from database import get_db, get_async_db
 import models
+from principal_cache import Principal, resolve_principal
 
 # Security configuration
 SECRET_KEY = "your-secret-key-here"  # In production, use environment variable
@@ -16,13 +22,42 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
+# bcrypt work factor; existing hashes with a different cost are rehashed on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt releases the GIL, so hashing scales with the number of worker threads
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+# Limits in-flight hashes so a login rush queues here instead of in the executor
+_password_semaphore = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash"""
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 def get_password_hash(password: str) -> str:
     """Generate password hash"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Check whether a bcrypt hash was made with a different cost than BCRYPT_ROUNDS"""
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+async def _run_in_password_pool(func, *args):
+    async with _password_semaphore:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_password_executor, func, *args)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password in the bcrypt worker pool without blocking the event loop"""
+    return await _run_in_password_pool(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Generate a password hash in the bcrypt worker pool without blocking the event loop"""
+    return await _run_in_password_pool(get_password_hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
@@ -39,7 +74,12 @@ def get_user(db: Session, email: str) -> models.Users:
     """Get user by email"""
     return db.query(models.Users).filter(models.Users.email == email).first()
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> models.Users:
+async def get_user_async(db: AsyncSession, email: str) -> models.Users:
+    """Get user by email without blocking the event loop"""
+    result = await db.execute(select(models.Users).where(models.Users.email == email))
+    return result.scalars().first()
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> Principal:
     """Get current authenticated user from JWT token"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -56,18 +96,18 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         print(f"JWT Error: {str(e)}")
         raise credentials_exception
     
-    user = get_user(db, email=email)
+    user = await resolve_principal(db, email)
     if user is None:
         raise credentials_exception
     return user
 
-async def get_current_teacher(current_user: models.Users = Depends(get_current_user)) -> models.Users:
+async def get_current_teacher(current_user: Principal = Depends(get_current_user)) -> Principal:
     """Get current user if they are a teacher"""
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Teacher access required")
     return current_user
 
-async def get_current_student(current_user: models.Users = Depends(get_current_user)) -> models.Users:
+async def get_current_student(current_user: Principal = Depends(get_current_user)) -> Principal:
     """Get current user if they are a student"""
     if current_user.role != "student":
         raise HTTPException(status_code=403, detail="Student access required")
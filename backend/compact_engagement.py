@@ -0,0 +1,21 @@
+import sys
+from database import SessionLocal
+from services.engagement_rollups import compact_engagement_logs, purge_engagement_logs
+
+def compact(purge=True):
+    db = SessionLocal()
+    try:
+        compacted = compact_engagement_logs(db)
+        print(f"Compacted {compacted} engagement log(s) into rollups.")
+        if purge:
+            purged = purge_engagement_logs(db)
+            print(f"Purged {purged['raw_logs']} raw log(s) and {purged['hourly_rollups']} hourly rollup(s).")
+    except Exception as e:
+        db.rollback()
+        print(f"Error: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    # Run periodically (e.g. hourly from cron); --no-purge only compacts
+    compact(purge="--no-purge" not in sys.argv[1:])
@@ -0,0 +1,36 @@
+"""
+pytest setup: every test runs against a fresh SQLite database in a temporary
+directory, which also holds the cache stamp files.
+"""
+import os
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="amep-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["CACHE_STAMP_DIR"] = _tmp
+
+import pytest
+
+import database
+import models
+
+# Manual scripts that call a running server, not pytest tests
+collect_ignore = ["test_adaptive.py", "test_ai.py", "test_api.py"]
+
+@pytest.fixture
+def db():
+    from services.adaptive_learning import concept_tracers, recommendation_cache
+    from services.assignment_index import assignment_index
+    from services.concept_graph import concept_graph
+    from services.mastery_matrix import mastery_matrices
+
+    models.Base.metadata.drop_all(database.engine)
+    models.Base.metadata.create_all(database.engine)
+    # In-process caches would otherwise outlive the previous test's database
+    for cache in (concept_graph, assignment_index, recommendation_cache, mastery_matrices, concept_tracers):
+        cache.invalidate()
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
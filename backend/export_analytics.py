@@ -0,0 +1,19 @@
+import sys
+from database import SessionLocal
+from services.analytics_export import export_analytics, ANALYTICS_EXPORT_DIR
+
+def export(tables=None):
+    db = SessionLocal()
+    try:
+        written = export_analytics(db, tables=tables)
+        for table, rows in written.items():
+            print(f"Exported {rows} row(s) from {table}.")
+        print(f"Manifest: {ANALYTICS_EXPORT_DIR}/manifest.json")
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    # Optional table names to export; exports every analytics table by default
+    export(sys.argv[1:] or None)
@@ -0,0 +1,30 @@
+import sys
+from database import SessionLocal
+from services.bkt_fitting import fit_bkt_parameters
+from recompute_mastery import recompute
+
+def fit(concept_ids=None, recompute_after=False):
+    db = SessionLocal()
+    try:
+        results = fit_bkt_parameters(db, concept_ids=concept_ids)
+        db.commit()
+        for result in results:
+            print(f"Concept {result['concept_id']}: prior={result['init_prior']:.3f} "
+                  f"learn={result['learn_rate']:.3f} guess={result['guess_rate']:.3f} "
+                  f"slip={result['slip_rate']:.3f} ({result['student_count']} students, "
+                  f"{result['response_count']} responses)")
+        print(f"Fitted BKT parameters for {len(results)} concept(s).")
+    except Exception as e:
+        db.rollback()
+        print(f"Error: {e}")
+        return
+    finally:
+        db.close()
+    if recompute_after:
+        recompute()
+
+if __name__ == "__main__":
+    # Optional concept ids to fit; --recompute replays every student's mastery afterwards
+    args = sys.argv[1:]
+    ids = [int(arg) for arg in args if arg != "--recompute"] or None
+    fit(ids, recompute_after="--recompute" in args)
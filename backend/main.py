@@ -15,6 +15,13 @@ from database import get_db
 
 # Import routers
 from routers import auth, student, teacher, classes, notifications
+from services.engagement_buffer import engagement_buffer, ENGAGEMENT_WRITE_BEHIND
+from services.confusion_window import warm_confusion_windows, CONFUSION_WINDOW_ENABLED
+from services.concept_graph import load_concept_graph
+from starlette.concurrency import run_in_threadpool
+
+# Import middleware
+from middleware.query_stats import QueryStatsMiddleware
 
 # Import auth utilities
 from auth_utils import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, oauth2_scheme, get_current_user, get_current_teacher, get_current_student
@@ -37,8 +44,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-DB-Query-Count", "X-DB-Time-Ms", "X-DB-N-Plus-One"],
 )
 
+# Per-request SQL query counts and N+1 detection
+app.add_middleware(QueryStatsMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["authentication"])
 app.include_router(teacher.router, prefix="", tags=["teacher"])
@@ -46,6 +57,27 @@ app.include_router(student.router, prefix="", tags=["student"])
 app.include_router(notifications.router, prefix="", tags=["notifications"])
 app.include_router(classes.router, prefix="", tags=["classes"])
 
+@app.on_event("startup")
+async def load_confusion_windows():
+    # Live confusion detection reads the database only here, to warm its windows
+    if CONFUSION_WINDOW_ENABLED:
+        await run_in_threadpool(warm_confusion_windows)
+
+@app.on_event("startup")
+async def build_concept_graph():
+    # Learning paths read prerequisites from this in-memory graph
+    await run_in_threadpool(load_concept_graph)
+
+@app.on_event("startup")
+async def start_engagement_buffer():
+    if ENGAGEMENT_WRITE_BEHIND:
+        await engagement_buffer.start()
+
+@app.on_event("shutdown")
+async def flush_engagement_buffer():
+    # Persist every acknowledged engagement event before the worker exits
+    await engagement_buffer.stop()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the EduAI Platform API! Visit /docs for API documentation."}
@@ -1,10 +1,11 @@
 from fastapi import HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 import models
 import database
+from principal_cache import Principal, resolve_principal
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
@@ -27,7 +28,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -42,12 +43,12 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
     
-    user = db.query(models.Users).filter(models.Users.email == email).first()
+    user = await resolve_principal(db, email)
     if user is None:
         raise credentials_exception
     return user
 
-async def get_current_student(user: models.Users = Depends(get_current_user)):
+async def get_current_student(user: Principal = Depends(get_current_user)):
     if user.role != "student":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -55,7 +56,7 @@ async def get_current_student(user: models.Users = Depends(get_current_user)):
         )
     return user
 
-async def get_current_teacher(user: models.Users = Depends(get_current_user)):
+async def get_current_teacher(user: Principal = Depends(get_current_user)):
     if user.role != "teacher":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
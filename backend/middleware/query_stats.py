@@ -0,0 +1,95 @@
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+
+load_dotenv()
+
+QUERY_STATS_ENABLED = os.getenv("QUERY_STATS_ENABLED", "true").lower() == "true"
+# A statement shape repeated more than this many times in one request is flagged as N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+logger = logging.getLogger("amep.query_stats")
+
+_WHITESPACE = re.compile(r"\s+")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+class RequestQueryStats:
+    """SQL statistics collected for a single request"""
+
+    def __init__(self):
+        self.query_count = 0
+        self.total_time = 0.0  # seconds
+        self.shapes = Counter()
+
+    def record(self, statement: str, elapsed: float):
+        self.query_count += 1
+        self.total_time += elapsed
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated_shapes(self, threshold: int = N_PLUS_ONE_THRESHOLD):
+        """Statement shapes executed more than threshold times, most frequent first"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+_current_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("query_stats", default=None)
+
+def statement_shape(statement: str) -> str:
+    """Normalize a statement so repeated executions with different literals compare equal"""
+    return _LITERALS.sub("?", _WHITESPACE.sub(" ", statement).strip())
+
+def current_query_stats() -> Optional[RequestQueryStats]:
+    return _current_stats.get()
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_start_time"].pop()
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(statement, time.perf_counter() - started)
+
+class QueryStatsMiddleware(BaseHTTPMiddleware):
+    """
+    Count the SQL statements issued while handling each request, expose the totals
+    as response headers and log a warning when a statement shape repeats often
+    enough to look like an N+1 query.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        if not QUERY_STATS_ENABLED:
+            return await call_next(request)
+
+        stats = RequestQueryStats()
+        token = _current_stats.set(stats)
+        try:
+            response = await call_next(request)
+        finally:
+            _current_stats.reset(token)
+
+        repeated = stats.repeated_shapes()
+        response.headers["X-DB-Query-Count"] = str(stats.query_count)
+        response.headers["X-DB-Time-Ms"] = f"{stats.total_time * 1000:.2f}"
+        response.headers["X-DB-N-Plus-One"] = str(len(repeated))
+
+        logger.info(
+            "%s %s queries=%d db_time_ms=%.2f",
+            request.method, request.url.path, stats.query_count, stats.total_time * 1000,
+        )
+        for shape, count in repeated:
+            logger.warning(
+                "Possible N+1 on %s %s: %d executions of %s",
+                request.method, request.url.path, count, shape,
+            )
+        return response
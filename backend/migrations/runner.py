@@ -0,0 +1,218 @@
+"""
+Versioned migration runner.
+
+Migrations live in migrations/versions/ as NNNN_description.py modules exposing
+upgrade(conn) and optionally downgrade(conn). Applied versions are recorded in
+the schema_migrations table, so running the runner repeatedly only applies new
+migrations. Usage (from the backend directory):
+
+    python -m migrations.runner upgrade
+    python -m migrations.runner status
+    python -m migrations.runner check
+"""
+import importlib.util
+import os
+import re
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+VERSIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "versions")
+VERSION_PATTERN = re.compile(r"^(\d{4})_(\w+)\.py$")
+
+# Hot query shapes and the index each one is expected to use
+HOT_QUERIES = [
+    (
+        "ix_engagement_logs_student_project_time",
+        "SELECT * FROM engagement_logs WHERE student_id = 1 AND project_id = 1 AND timestamp >= '2024-01-01'",
+    ),
+    (
+        "ix_engagement_logs_confusion_time",
+        "SELECT COUNT(*) FROM engagement_logs WHERE confusion_flag = true AND timestamp >= '2024-01-01'",
+    ),
+    (
+        "ix_notifications_user_read_created",
+        "SELECT * FROM notifications WHERE user_id = 1 AND is_read = false ORDER BY created_at DESC",
+    ),
+    (
+        "ix_student_assignments_student_status",
+        "SELECT * FROM student_assignments WHERE student_id = 1 AND status = 'SUBMITTED'",
+    ),
+    (
+        "ux_class_enrollments_class_student",
+        "SELECT * FROM class_enrollments WHERE class_id = 1 AND student_id = 1",
+    ),
+    (
+        "ux_class_assignments_class_assignment",
+        "SELECT * FROM class_assignments WHERE class_id = 1 AND assignment_id = 1",
+    ),
+]
+
+def get_engine():
+    from database import engine
+    return engine
+
+def is_postgres(conn) -> bool:
+    return conn.dialect.name == "postgresql"
+
+def create_index(conn, name: str, table: str, columns: List[str], unique: bool = False):
+    """Create an index if it does not exist, without blocking writes on PostgreSQL"""
+    unique_sql = "UNIQUE " if unique else ""
+    # CONCURRENTLY requires the migration to run outside a transaction
+    concurrently = "CONCURRENTLY " if is_postgres(conn) else ""
+    conn.execute(text(
+        f"CREATE {unique_sql}INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+    ))
+
+def drop_index(conn, name: str):
+    concurrently = "CONCURRENTLY " if is_postgres(conn) else ""
+    conn.execute(text(f"DROP INDEX {concurrently}IF EXISTS {name}"))
+
+def delete_duplicates(conn, table: str, columns: List[str]):
+    """Delete duplicate rows on the given columns, keeping the lowest id"""
+    column_list = ", ".join(columns)
+    conn.execute(text(
+        f"DELETE FROM {table} WHERE id NOT IN "
+        f"(SELECT MIN(id) FROM {table} GROUP BY {column_list})"
+    ))
+
+def load_migrations() -> List[Dict]:
+    """Load migration modules from the versions directory, ordered by version"""
+    migrations = []
+    for filename in sorted(os.listdir(VERSIONS_DIR)):
+        match = VERSION_PATTERN.match(filename)
+        if not match:
+            continue
+        spec = importlib.util.spec_from_file_location(
+            f"migrations.versions.{filename[:-3]}", os.path.join(VERSIONS_DIR, filename)
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        migrations.append({
+            "version": int(match.group(1)),
+            "name": match.group(2),
+            "module": module,
+            # Online index builds cannot run inside a transaction block
+            "transactional": getattr(module, "TRANSACTIONAL", True),
+        })
+    return migrations
+
+def ensure_version_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, "
+            "name VARCHAR NOT NULL, "
+            "applied_at TIMESTAMP NOT NULL)"
+        ))
+
+def applied_versions(engine) -> Dict[int, datetime]:
+    ensure_version_table(engine)
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT version, applied_at FROM schema_migrations")).all()
+    return {row[0]: row[1] for row in rows}
+
+def record_version(conn, migration: Dict):
+    conn.execute(
+        text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+        {"version": migration["version"], "name": migration["name"], "applied_at": datetime.utcnow()},
+    )
+
+def upgrade(engine=None, target: Optional[int] = None) -> List[int]:
+    """Apply all pending migrations up to target (inclusive)"""
+    engine = engine or get_engine()
+    done = applied_versions(engine)
+    applied = []
+    for migration in load_migrations():
+        if migration["version"] in done:
+            continue
+        if target is not None and migration["version"] > target:
+            break
+        print(f"Applying migration {migration['version']:04d}_{migration['name']}...")
+        if migration["transactional"]:
+            with engine.begin() as conn:
+                migration["module"].upgrade(conn)
+                record_version(conn, migration)
+        else:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                migration["module"].upgrade(conn)
+                record_version(conn, migration)
+        applied.append(migration["version"])
+    return applied
+
+def downgrade(engine=None, target: int = 0) -> List[int]:
+    """Revert applied migrations newer than target, newest first"""
+    engine = engine or get_engine()
+    done = applied_versions(engine)
+    reverted = []
+    for migration in reversed(load_migrations()):
+        if migration["version"] <= target or migration["version"] not in done:
+            continue
+        print(f"Reverting migration {migration['version']:04d}_{migration['name']}...")
+        options = {} if migration["transactional"] else {"isolation_level": "AUTOCOMMIT"}
+        with engine.connect().execution_options(**options) as conn:
+            migration["module"].downgrade(conn)
+            conn.execute(
+                text("DELETE FROM schema_migrations WHERE version = :version"),
+                {"version": migration["version"]},
+            )
+            conn.commit()
+        reverted.append(migration["version"])
+    return reverted
+
+def explain(conn, sql: str) -> str:
+    """Return the query plan for a statement as a single string"""
+    if is_postgres(conn):
+        rows = conn.execute(text(f"EXPLAIN {sql}")).all()
+        return "\n".join(row[0] for row in rows)
+    rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+    return "\n".join(str(row[-1]) for row in rows)
+
+def check_query_plans(engine=None) -> Dict[str, bool]:
+    """Verify that each hot query shape is planned against its index"""
+    engine = engine or get_engine()
+    results = {}
+    with engine.connect() as conn:
+        if is_postgres(conn):
+            # Small tables would otherwise be planned as sequential scans
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+        for index_name, sql in HOT_QUERIES:
+            results[index_name] = index_name in explain(conn, sql)
+        conn.rollback()
+    return results
+
+def status(engine=None):
+    engine = engine or get_engine()
+    done = applied_versions(engine)
+    for migration in load_migrations():
+        applied_at = done.get(migration["version"])
+        state = f"applied {applied_at}" if applied_at else "pending"
+        print(f"{migration['version']:04d}_{migration['name']}: {state}")
+
+def main(argv: List[str]) -> int:
+    command = argv[1] if len(argv) > 1 else "upgrade"
+    if command == "upgrade":
+        target = int(argv[2]) if len(argv) > 2 else None
+        applied = upgrade(target=target)
+        print(f"Applied {len(applied)} migration(s).")
+    elif command == "downgrade":
+        target = int(argv[2]) if len(argv) > 2 else 0
+        reverted = downgrade(target=target)
+        print(f"Reverted {len(reverted)} migration(s).")
+    elif command == "status":
+        status()
+    elif command == "check":
+        results = check_query_plans()
+        for index_name, used in results.items():
+            print(f"{index_name}: {'used' if used else 'NOT USED'}")
+        if not all(results.values()):
+            return 1
+    else:
+        print(f"Unknown command: {command}")
+        return 2
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,26 @@
+"""
+Composite indexes for the hot query shapes, plus unique constraints on class
+enrollments and class assignments. Indexes are built with CREATE INDEX
+CONCURRENTLY on PostgreSQL so the tables stay writable during the migration.
+"""
+from migrations.runner import create_index, drop_index, delete_duplicates
+
+TRANSACTIONAL = False
+
+def upgrade(conn):
+    create_index(conn, "ix_engagement_logs_student_project_time", "engagement_logs", ["student_id", "project_id", "timestamp"])
+    create_index(conn, "ix_notifications_user_read_created", "notifications", ["user_id", "is_read", "created_at"])
+    create_index(conn, "ix_student_assignments_student_status", "student_assignments", ["student_id", "status"])
+
+    # Duplicates were possible before; remove them so the unique indexes can be built
+    delete_duplicates(conn, "class_enrollments", ["class_id", "student_id"])
+    create_index(conn, "ux_class_enrollments_class_student", "class_enrollments", ["class_id", "student_id"], unique=True)
+    delete_duplicates(conn, "class_assignments", ["class_id", "assignment_id"])
+    create_index(conn, "ux_class_assignments_class_assignment", "class_assignments", ["class_id", "assignment_id"], unique=True)
+
+def downgrade(conn):
+    drop_index(conn, "ux_class_assignments_class_assignment")
+    drop_index(conn, "ux_class_enrollments_class_student")
+    drop_index(conn, "ix_student_assignments_student_status")
+    drop_index(conn, "ix_notifications_user_read_created")
+    drop_index(conn, "ix_engagement_logs_student_project_time")
@@ -0,0 +1,11 @@
+"""
+Per-student engagement aggregates maintained incrementally by log_engagement.
+Run rebuild_engagement_aggregates.py afterwards to backfill existing history.
+"""
+import models
+
+def upgrade(conn):
+    models.EngagementAggregates.__table__.create(conn, checkfirst=True)
+
+def downgrade(conn):
+    models.EngagementAggregates.__table__.drop(conn, checkfirst=True)
@@ -0,0 +1,15 @@
+"""
+Hourly and daily engagement rollup tables and the compaction watermark.
+Run compact_engagement.py afterwards to fold existing logs into the rollups.
+"""
+import models
+
+def upgrade(conn):
+    models.EngagementRollupHourly.__table__.create(conn, checkfirst=True)
+    models.EngagementRollupDaily.__table__.create(conn, checkfirst=True)
+    models.EngagementRollupState.__table__.create(conn, checkfirst=True)
+
+def downgrade(conn):
+    models.EngagementRollupState.__table__.drop(conn, checkfirst=True)
+    models.EngagementRollupDaily.__table__.drop(conn, checkfirst=True)
+    models.EngagementRollupHourly.__table__.drop(conn, checkfirst=True)
@@ -0,0 +1,137 @@
+"""
+Structured engagement metadata: metadata_json becomes a JSON column and its hot
+keys (confusion_flag, assignment_id, action) are promoted to indexed columns.
+Existing rows are normalized to JSON objects (submissions used to be logged as
+Python reprs) and backfilled chunk by chunk.
+
+On PostgreSQL, changing the column type in place would rewrite the table under
+an ACCESS EXCLUSIVE lock, so the JSON values are written to a new column and
+swapped in: writes are only blocked while the rows logged during the backfill
+are caught up, and the swap itself is a catalog change.
+"""
+import ast
+import json
+
+from sqlalchemy import inspect, text
+
+from migrations.runner import create_index, drop_index, is_postgres
+
+TRANSACTIONAL = False
+
+CHUNK_SIZE = 5000
+
+def normalize_metadata(raw):
+    """Parse a legacy metadata string into a JSON object (or None)"""
+    if raw is None or raw == "":
+        return None
+    if isinstance(raw, dict):
+        return raw
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        try:
+            value = ast.literal_eval(raw)
+        except (ValueError, SyntaxError):
+            value = {"raw": raw}
+    return value if isinstance(value, dict) else {"value": value}
+
+def add_columns(conn):
+    existing = {column["name"] for column in inspect(conn).get_columns("engagement_logs")}
+    # SQLite cannot drop a column that takes part in a foreign key, so only PostgreSQL gets the constraint
+    references = " REFERENCES assignments (id)" if is_postgres(conn) else ""
+    columns = {
+        "confusion_flag": "BOOLEAN NOT NULL DEFAULT false",
+        "assignment_id": f"INTEGER{references}",
+        "action": "VARCHAR",
+    }
+    for name, definition in columns.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE engagement_logs ADD COLUMN {name} {definition}"))
+
+def backfill_chunk(conn, last_id: int, target: str):
+    """Normalize the next chunk of metadata into target; returns the last id, or None when done"""
+    rows = conn.execute(text(
+        "SELECT id, metadata_json FROM engagement_logs "
+        "WHERE id > :last_id AND metadata_json IS NOT NULL ORDER BY id LIMIT :limit"
+    ), {"last_id": last_id, "limit": CHUNK_SIZE}).all()
+    if not rows:
+        return None
+    updates = []
+    for log_id, raw in rows:
+        metadata = normalize_metadata(raw)
+        assignment_id = (metadata or {}).get("assignment_id")
+        action = (metadata or {}).get("action")
+        updates.append({
+            "id": log_id,
+            "metadata_json": json.dumps(metadata, default=str) if metadata is not None else None,
+            "confusion_flag": bool((metadata or {}).get("confusion_flag")),
+            "assignment_id": assignment_id if isinstance(assignment_id, int) else None,
+            "action": str(action) if action is not None else None,
+        })
+    value = "CAST(:metadata_json AS JSON)" if is_postgres(conn) else ":metadata_json"
+    conn.execute(text(
+        f"UPDATE engagement_logs SET {target} = {value}, confusion_flag = :confusion_flag, "
+        "assignment_id = :assignment_id, action = :action WHERE id = :id"
+    ), updates)
+    return rows[-1][0]
+
+def backfill(conn, target: str = "metadata_json") -> int:
+    last_id = 0
+    while True:
+        # One transaction per chunk; the migration connection itself autocommits
+        with conn.engine.begin() as chunk_conn:
+            next_id = backfill_chunk(chunk_conn, last_id, target)
+        if next_id is None:
+            return last_id
+        last_id = next_id
+
+def copy_as_text(conn, source: str, target: str) -> int:
+    last_id = 0
+    while True:
+        with conn.engine.begin() as chunk_conn:
+            next_id = chunk_conn.execute(text(
+                "SELECT MAX(id) FROM (SELECT id FROM engagement_logs WHERE id > :last_id ORDER BY id LIMIT :limit) chunk"
+            ), {"last_id": last_id, "limit": CHUNK_SIZE}).scalar()
+            if next_id is None:
+                return last_id
+            chunk_conn.execute(text(
+                f"UPDATE engagement_logs SET {target} = {source}::text WHERE id > :last_id AND id <= :next_id"
+            ), {"last_id": last_id, "next_id": next_id})
+        last_id = next_id
+
+def swap_columns(swap_conn, new_column: str):
+    swap_conn.execute(text("ALTER TABLE engagement_logs DROP COLUMN metadata_json"))
+    swap_conn.execute(text(f"ALTER TABLE engagement_logs RENAME COLUMN {new_column} TO metadata_json"))
+
+def upgrade(conn):
+    add_columns(conn)
+    if not is_postgres(conn):
+        backfill(conn)
+    else:
+        conn.execute(text("ALTER TABLE engagement_logs ADD COLUMN IF NOT EXISTS metadata_json_new JSON"))
+        last_id = backfill(conn, target="metadata_json_new")
+        with conn.engine.begin() as swap_conn:
+            # Readers carry on; writers wait for the catch-up and the swap
+            swap_conn.execute(text("LOCK TABLE engagement_logs IN EXCLUSIVE MODE"))
+            while last_id is not None:
+                last_id = backfill_chunk(swap_conn, last_id, "metadata_json_new")
+            swap_columns(swap_conn, "metadata_json_new")
+    create_index(conn, "ix_engagement_logs_confusion_time", "engagement_logs", ["confusion_flag", "timestamp"])
+    create_index(conn, "ix_engagement_logs_action_time", "engagement_logs", ["action", "timestamp"])
+    create_index(conn, "ix_engagement_logs_assignment", "engagement_logs", ["assignment_id"])
+
+def downgrade(conn):
+    drop_index(conn, "ix_engagement_logs_assignment")
+    drop_index(conn, "ix_engagement_logs_action_time")
+    drop_index(conn, "ix_engagement_logs_confusion_time")
+    if is_postgres(conn):
+        conn.execute(text("ALTER TABLE engagement_logs ADD COLUMN IF NOT EXISTS metadata_json_text VARCHAR"))
+        last_id = copy_as_text(conn, "metadata_json", "metadata_json_text")
+        with conn.engine.begin() as swap_conn:
+            swap_conn.execute(text("LOCK TABLE engagement_logs IN EXCLUSIVE MODE"))
+            swap_conn.execute(text(
+                "UPDATE engagement_logs SET metadata_json_text = metadata_json::text WHERE id > :last_id"
+            ), {"last_id": last_id})
+            swap_columns(swap_conn, "metadata_json_text")
+    for name in ("action", "assignment_id", "confusion_flag"):
+        conn.execute(text(f"ALTER TABLE engagement_logs DROP COLUMN {name}"))
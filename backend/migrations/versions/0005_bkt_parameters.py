@@ -0,0 +1,11 @@
+"""
+Per-concept BKT parameters estimated by fit_bkt_parameters.py.
+Concepts without a row keep the default tracer parameters.
+"""
+import models
+
+def upgrade(conn):
+    models.BKTParameters.__table__.create(conn, checkfirst=True)
+
+def downgrade(conn):
+    models.BKTParameters.__table__.drop(conn, checkfirst=True)
@@ -0,0 +1,10 @@
+"""
+Concept prerequisite edges used by the concept graph for learning paths.
+"""
+import models
+
+def upgrade(conn):
+    models.ConceptPrerequisites.__table__.create(conn, checkfirst=True)
+
+def downgrade(conn):
+    models.ConceptPrerequisites.__table__.drop(conn, checkfirst=True)
@@ -0,0 +1,14 @@
+"""
+Append-only mastery event log and per-student mastery snapshots.
+Run snapshot_mastery.py afterwards to record a baseline snapshot of the
+existing scores, so history queries start from them.
+"""
+import models
+
+def upgrade(conn):
+    models.MasteryEvents.__table__.create(conn, checkfirst=True)
+    models.MasterySnapshots.__table__.create(conn, checkfirst=True)
+
+def downgrade(conn):
+    models.MasterySnapshots.__table__.drop(conn, checkfirst=True)
+    models.MasteryEvents.__table__.drop(conn, checkfirst=True)
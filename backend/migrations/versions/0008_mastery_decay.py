@@ -0,0 +1,24 @@
+"""
+Forgetting-curve inputs: when each mastery score was last practiced and an
+optional per-concept decay rate. last_practiced_at is backfilled from the
+mastery event log; 0010 falls back to the latest graded submission for the rest.
+"""
+from sqlalchemy import inspect, text
+
+def add_column(conn, table: str, name: str, definition: str):
+    if name not in {column["name"] for column in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {definition}"))
+
+def upgrade(conn):
+    add_column(conn, "concepts", "decay_rate", "FLOAT")
+    add_column(conn, "student_mastery", "last_practiced_at", "TIMESTAMP")
+    conn.execute(text(
+        "UPDATE student_mastery SET last_practiced_at = ("
+        "SELECT MAX(e.created_at) FROM mastery_events e "
+        "WHERE e.student_id = student_mastery.student_id AND e.concept_id = student_mastery.concept_id) "
+        "WHERE last_practiced_at IS NULL"
+    ))
+
+def downgrade(conn):
+    conn.execute(text("ALTER TABLE student_mastery DROP COLUMN last_practiced_at"))
+    conn.execute(text("ALTER TABLE concepts DROP COLUMN decay_rate"))
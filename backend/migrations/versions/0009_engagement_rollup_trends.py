@@ -0,0 +1,30 @@
+"""
+Per-student moving averages over compacted engagement logs, so aggregate rebuilds
+reproduce the incrementally maintained trend exactly. Logs compacted before this
+migration are gone from the order the average needs, so students with existing
+rollups are seeded with the approximation from their hourly buckets.
+"""
+from sqlalchemy import text
+
+import models
+from services.engagement_tracking import ENGAGEMENT_TREND_ALPHA, ewma_bucket
+
+def upgrade(conn):
+    models.EngagementRollupTrend.__table__.create(conn, checkfirst=True)
+    seeded = {row[0] for row in conn.execute(text("SELECT student_id FROM engagement_rollup_trends"))}
+    averages = {}
+    rows = conn.execute(text(
+        "SELECT student_id, event_count, value_sum FROM engagement_rollups_hourly "
+        "WHERE event_count > 0 ORDER BY student_id, bucket_start"
+    ))
+    for student_id, count, value_sum in rows:
+        if student_id not in seeded:
+            averages[student_id] = ewma_bucket(averages.get(student_id), count, value_sum / count)
+    if averages:
+        conn.execute(models.EngagementRollupTrend.__table__.insert(), [
+            {"student_id": student_id, "recent_value_avg": average, "trend_alpha": ENGAGEMENT_TREND_ALPHA}
+            for student_id, average in averages.items()
+        ])
+
+def downgrade(conn):
+    models.EngagementRollupTrend.__table__.drop(conn, checkfirst=True)
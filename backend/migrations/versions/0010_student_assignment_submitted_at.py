@@ -0,0 +1,32 @@
+"""
+student_assignments.submitted_at for databases created before it existed.
+Submission times are recovered from the submission engagement logs that are
+still raw, and last_practiced_at is then backfilled from them where the
+mastery event log had nothing (0008 could only use the event log there).
+"""
+from sqlalchemy import inspect, text
+
+def add_column(conn, table: str, name: str, definition: str):
+    if name not in {column["name"] for column in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {definition}"))
+
+def upgrade(conn):
+    add_column(conn, "student_assignments", "submitted_at", "TIMESTAMP")
+    conn.execute(text(
+        "UPDATE student_assignments SET submitted_at = ("
+        "SELECT MAX(e.timestamp) FROM engagement_logs e "
+        "WHERE e.assignment_id = student_assignments.assignment_id "
+        "AND e.student_id = student_assignments.student_id AND e.action = 'submission') "
+        "WHERE submitted_at IS NULL AND status IN ('SUBMITTED', 'GRADED')"
+    ))
+    conn.execute(text(
+        "UPDATE student_mastery SET last_practiced_at = ("
+        "SELECT MAX(sa.submitted_at) FROM student_assignments sa JOIN assignments a ON a.id = sa.assignment_id "
+        "WHERE sa.student_id = student_mastery.student_id AND a.concept_id = student_mastery.concept_id "
+        "AND sa.score IS NOT NULL) "
+        "WHERE last_practiced_at IS NULL"
+    ))
+
+def downgrade(conn):
+    # submitted_at is part of the base schema; only databases that predate it lacked the column
+    pass
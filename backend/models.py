@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum, Boolean, JSON, Index, LargeBinary
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime
 from typing import Optional, Dict, Any
@@ -53,23 +53,77 @@ class Concepts(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     description = Column(String, nullable=False)
+    decay_rate = Column(Float, nullable=True)  # mastery forgetting rate per day; NULL uses MASTERY_DECAY_RATE
     
     # Relationships
     student_mastery = relationship("StudentMastery", back_populates="concept")
     assignments = relationship("Assignments", back_populates="concept")
     concept_progress = relationship("ConceptProgress", back_populates="concept")
 
+class ConceptPrerequisites(Base):
+    __tablename__ = "concept_prerequisites"
+    __table_args__ = (
+        Index("ux_concept_prerequisites_pair", "concept_id", "prerequisite_id", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    concept_id = Column(Integer, ForeignKey("concepts.id"), nullable=False)
+    prerequisite_id = Column(Integer, ForeignKey("concepts.id"), nullable=False)
+
 class StudentMastery(Base):
     __tablename__ = "student_mastery"
     
     student_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     concept_id = Column(Integer, ForeignKey("concepts.id"), primary_key=True)
-    mastery_score = Column(Float, default=0.0)  # 0-100
+    mastery_score = Column(Float, default=0.0)  # 0-100, as of last_practiced_at
+    last_practiced_at = Column(DateTime, nullable=True)  # NULL: unknown, no decay
     
     # Relationships
     student = relationship("Users", back_populates="student_mastery")
     concept = relationship("Concepts", back_populates="student_mastery")
 
+class MasteryEvents(Base):
+    """Append-only log of every change to a StudentMastery score"""
+    __tablename__ = "mastery_events"
+    __table_args__ = (
+        Index("ix_mastery_events_student_time", "student_id", "created_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    concept_id = Column(Integer, ForeignKey("concepts.id"), nullable=False)
+    mastery_before = Column(Float, nullable=True)  # NULL when the score was first created
+    mastery_after = Column(Float, nullable=False)
+    cause = Column(String, nullable=False)  # "assignment", "recompute", ...
+    assignment_id = Column(Integer, ForeignKey("assignments.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class MasterySnapshots(Base):
+    """A student's mastery scores after every event up to last_event_id"""
+    __tablename__ = "mastery_snapshots"
+    __table_args__ = (
+        Index("ix_mastery_snapshots_student_time", "student_id", "taken_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    taken_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_event_id = Column(Integer, nullable=False, default=0)
+    scores = Column(JSON, nullable=False)  # {concept_id: mastery_score}
+
+class BKTParameters(Base):
+    __tablename__ = "bkt_parameters"
+    
+    concept_id = Column(Integer, ForeignKey("concepts.id"), primary_key=True)
+    init_prior = Column(Float, nullable=False)
+    learn_rate = Column(Float, nullable=False)
+    guess_rate = Column(Float, nullable=False)
+    slip_rate = Column(Float, nullable=False)
+    log_likelihood = Column(Float)
+    student_count = Column(Integer, default=0)
+    response_count = Column(Integer, default=0)
+    fitted_at = Column(DateTime, default=datetime.utcnow)
+
 class Assignments(Base):
     __tablename__ = "assignments"
     
@@ -87,6 +141,9 @@ class Assignments(Base):
 
 class StudentAssignments(Base):
     __tablename__ = "student_assignments"
+    __table_args__ = (
+        Index("ix_student_assignments_student_status", "student_id", "status"),
+    )
     
     student_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     assignment_id = Column(Integer, ForeignKey("assignments.id"), primary_key=True)
@@ -126,6 +183,12 @@ class ProjectTeams(Base):
 
 class EngagementLogs(Base):
     __tablename__ = "engagement_logs"
+    __table_args__ = (
+        Index("ix_engagement_logs_student_project_time", "student_id", "project_id", "timestamp"),
+        Index("ix_engagement_logs_confusion_time", "confusion_flag", "timestamp"),
+        Index("ix_engagement_logs_action_time", "action", "timestamp"),
+        Index("ix_engagement_logs_assignment", "assignment_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     student_id = Column(Integer, ForeignKey("users.id"))
@@ -133,12 +196,79 @@ class EngagementLogs(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     engagement_type = Column(Enum(EngagementType), nullable=False)
     value = Column(Float)  # e.g., time spent, clicks, etc.
-    metadata_json = Column(String)  # For additional data like confusion index
+    metadata_json = Column(JSON(none_as_null=True))  # Free-form event metadata
+    # Hot metadata keys, promoted to columns so they can be filtered in SQL
+    confusion_flag = Column(Boolean, default=False, nullable=False)
+    assignment_id = Column(Integer, ForeignKey("assignments.id"), nullable=True)
+    action = Column(String, nullable=True)
     
     # Relationships
     student = relationship("Users", back_populates="engagement_logs")
     project = relationship("Projects", back_populates="engagement_logs")
 
+class EngagementAggregates(Base):
+    __tablename__ = "engagement_aggregates"
+    
+    student_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    event_count = Column(Integer, default=0)
+    value_sum = Column(Float, default=0.0)
+    hour_counts = Column(JSON, default=list)  # 24 event counts by hour of day
+    active_day_bitmap = Column(LargeBinary)  # bit i set = active on first_timestamp's date + i days
+    active_days = Column(Integer, default=0)
+    first_timestamp = Column(DateTime)
+    last_timestamp = Column(DateTime)
+    recent_value_avg = Column(Float)  # Exponentially weighted mean of recent values
+    
+    # Relationships
+    student = relationship("Users")
+
+class EngagementRollupHourly(Base):
+    __tablename__ = "engagement_rollups_hourly"
+    __table_args__ = (
+        Index("ux_engagement_rollups_hourly_bucket", "student_id", "project_id", "bucket_start", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=True)
+    bucket_start = Column(DateTime, nullable=False)
+    event_count = Column(Integer, default=0)
+    value_sum = Column(Float, default=0.0)
+    value_min = Column(Float)
+    value_max = Column(Float)
+    confusion_flag_count = Column(Integer, default=0)
+
+class EngagementRollupDaily(Base):
+    __tablename__ = "engagement_rollups_daily"
+    __table_args__ = (
+        Index("ux_engagement_rollups_daily_bucket", "student_id", "project_id", "bucket_start", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=True)
+    bucket_start = Column(DateTime, nullable=False)
+    event_count = Column(Integer, default=0)
+    value_sum = Column(Float, default=0.0)
+    value_min = Column(Float)
+    value_max = Column(Float)
+    confusion_flag_count = Column(Integer, default=0)
+
+class EngagementRollupTrend(Base):
+    """Each student's recent-engagement moving average over their compacted logs"""
+    __tablename__ = "engagement_rollup_trends"
+    
+    student_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    recent_value_avg = Column(Float)  # EWMA of every compacted event, in log id order
+    trend_alpha = Column(Float)  # ENGAGEMENT_TREND_ALPHA the average was computed with
+
+class EngagementRollupState(Base):
+    __tablename__ = "engagement_rollup_state"
+    
+    id = Column(Integer, primary_key=True)
+    last_log_id = Column(Integer, default=0)  # Highest EngagementLogs.id folded into the rollups
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
 class SoftSkillScores(Base):
     __tablename__ = "soft_skill_scores"
     
@@ -231,6 +361,9 @@ class Classes(Base):
 
 class ClassEnrollments(Base):
     __tablename__ = "class_enrollments"
+    __table_args__ = (
+        Index("ux_class_enrollments_class_student", "class_id", "student_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     class_id = Column(Integer, ForeignKey("classes.id"))
@@ -243,6 +376,9 @@ class ClassEnrollments(Base):
 
 class ClassAssignments(Base):
     __tablename__ = "class_assignments"
+    __table_args__ = (
+        Index("ux_class_assignments_class_assignment", "class_id", "assignment_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     class_id = Column(Integer, ForeignKey("classes.id"))
@@ -256,6 +392,9 @@ class ClassAssignments(Base):
 
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (
+        Index("ix_notifications_user_read_created", "user_id", "is_read", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
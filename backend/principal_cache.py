@@ -0,0 +1,135 @@
+"""
+Bounded TTL/LRU cache of authenticated principals keyed by the token subject.
+
+get_current_user resolves the JWT subject (email) through this cache so that
+authenticated requests don't query the users table every time. Cached entries
+are lightweight Principal objects, not ORM instances.
+
+Entries are invalidated when a change to a user's role or email is committed
+through any SQLAlchemy session, and the commit touches a stamp file that every
+process (e.g. the API workers, after update_role.py) checks before serving from
+its cache. Changes made outside the ORM call invalidate_principal().
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from services.cache_invalidation import PendingChanges, StampFile
+
+load_dotenv()
+
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "300"))
+PRINCIPAL_CACHE_MAX_SIZE = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", "10000"))
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user's identity, detached from any DB session"""
+    id: int
+    email: str
+    name: str
+    role: models.UserRole
+
+    @classmethod
+    def from_user(cls, user: models.Users) -> "Principal":
+        return cls(id=user.id, email=user.email, name=user.name, role=user.role)
+
+class PrincipalCache:
+    def __init__(self, max_size: int = PRINCIPAL_CACHE_MAX_SIZE, ttl: float = PRINCIPAL_CACHE_TTL_SECONDS,
+                 stamp_dir: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stamp = StampFile(".principal_cache_stamp", stamp_dir)
+        self._entries = OrderedDict()  # subject -> (expires_at, Principal)
+        self._lock = threading.Lock()
+        self._stamp = self.stamp.read()
+
+    def _check_stamp(self):
+        # Another process changed a user: drop everything we have cached
+        stamp = self.stamp.read()
+        if stamp != self._stamp:
+            self._stamp = stamp
+            self._entries.clear()
+
+    def get(self, subject: str) -> Optional[Principal]:
+        with self._lock:
+            self._check_stamp()
+            entry = self._entries.get(subject)
+            if entry is None:
+                return None
+            expires_at, principal = entry
+            if expires_at < time.monotonic():
+                del self._entries[subject]
+                return None
+            self._entries.move_to_end(subject)
+            return principal
+
+    def put(self, subject: str, principal: Principal):
+        with self._lock:
+            self._entries[subject] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, subject: Optional[str] = None):
+        """Drop one subject, or the whole cache when subject is None"""
+        with self._lock:
+            if subject is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(subject, None)
+
+    def touch_stamp(self):
+        """Signal other processes to drop their cached principals"""
+        stamp = self.stamp.touch()
+        with self._lock:
+            self._stamp = stamp
+
+principal_cache = PrincipalCache()
+
+def invalidate_principal(email: Optional[str] = None):
+    """Invalidate a cached principal here and in every other process"""
+    principal_cache.invalidate(email)
+    principal_cache.touch_stamp()
+
+async def resolve_principal(db: AsyncSession, email: str) -> Optional[Principal]:
+    """Return the principal for a token subject, querying the DB only on a cache miss"""
+    principal = principal_cache.get(email)
+    if principal is not None:
+        return principal
+    result = await db.execute(select(models.Users).where(models.Users.email == email))
+    user = result.scalars().first()
+    if user is None:
+        return None
+    principal = Principal.from_user(user)
+    principal_cache.put(email, principal)
+    return principal
+
+def _collect_changed_users(session):
+    changed = set()
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, models.Users):
+            continue
+        state = inspect(obj)
+        email_history = state.attrs.email.history
+        if obj in session.deleted or email_history.has_changes() or state.attrs.role.history.has_changes():
+            changed.update(email_history.deleted or [])
+            changed.add(obj.email)
+    return changed or None
+
+def _invalidate_changed_users(changed):
+    # Only once committed, so a concurrent request cannot re-cache the old role
+    for email in changed:
+        principal_cache.invalidate(email)
+    principal_cache.touch_stamp()
+
+changed_principals = PendingChanges(
+    "changed_principals", apply=_invalidate_changed_users, merge=set.union, collect=_collect_changed_users
+)
@@ -0,0 +1,20 @@
+import sys
+from database import SessionLocal
+from services.engagement_tracking import rebuild_engagement_aggregates
+
+def rebuild(student_ids=None):
+    db = SessionLocal()
+    try:
+        aggregates = rebuild_engagement_aggregates(db, student_ids=student_ids)
+        db.commit()
+        print(f"Rebuilt engagement aggregates for {len(aggregates)} student(s).")
+    except Exception as e:
+        db.rollback()
+        print(f"Error: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    # Optional student ids to rebuild; rebuilds everyone by default
+    ids = [int(arg) for arg in sys.argv[1:]] or None
+    rebuild(ids)
@@ -0,0 +1,30 @@
+import sys
+from database import SessionLocal
+import models
+from services.adaptive_learning import recompute_mastery
+
+# Students replayed and committed per transaction
+CHUNK_SIZE = 5000
+
+def recompute(student_ids=None):
+    db = SessionLocal()
+    try:
+        if student_ids is None:
+            student_ids = [row[0] for row in db.query(models.StudentAssignments.student_id).filter(
+                models.StudentAssignments.score.isnot(None)
+            ).distinct().order_by(models.StudentAssignments.student_id).all()]
+        total = 0
+        for i in range(0, len(student_ids), CHUNK_SIZE):
+            total += len(recompute_mastery(db, student_ids=student_ids[i:i + CHUNK_SIZE]))
+            db.commit()
+        print(f"Recomputed {total} mastery score(s) for {len(student_ids)} student(s).")
+    except Exception as e:
+        db.rollback()
+        print(f"Error: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    # Optional student ids to recompute; recomputes everyone with graded work by default
+    ids = [int(arg) for arg in sys.argv[1:]] or None
+    recompute(ids)
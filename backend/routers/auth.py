@@ -1,21 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 from typing import Optional
 from pydantic import BaseModel
 
-from database import get_db
+from database import get_async_db
 import models
 from auth_utils import (
     SECRET_KEY,
     ALGORITHM,
     ACCESS_TOKEN_EXPIRE_MINUTES,
-    get_password_hash,
+    get_password_hash_async,
     create_access_token,
     get_current_user,
-    verify_password,
-    get_user
+    verify_password_async,
+    password_needs_rehash,
+    get_user_async
 )
 
 router = APIRouter(tags=["auth"])
@@ -26,20 +27,24 @@ class UserCreate(BaseModel):
     name: str
     role: str = "student"
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = get_user(db, email)
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await get_user_async(db, email)
     if not user:
         return False
-    if not verify_password(password, user.password_hash):
+    if not await verify_password_async(password, user.password_hash):
         return False
+    # Upgrade hashes made with a different bcrypt cost while we know the password
+    if password_needs_rehash(user.password_hash):
+        user.password_hash = await get_password_hash_async(password)
+        await db.commit()
     return user
 
 @router.post("/token")
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -57,18 +62,18 @@ async def login_for_access_token(
 @router.post("/register")
 async def register_user(
     user_data: UserCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     email = user_data.email
     password = user_data.password
     name = user_data.name
     role = user_data.role
     print(f"DEBUG: Registering user {email} with role '{role}'")
-    db_user = get_user(db, email=email)
+    db_user = await get_user_async(db, email=email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = get_password_hash(password)
+    hashed_password = await get_password_hash_async(password)
     db_user = models.Users(
         name=name,
         email=email,
@@ -76,8 +81,8 @@ async def register_user(
         role=role
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return {"message": "User created successfully", "id": db_user.id}
 
 @router.get("/me")
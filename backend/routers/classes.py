@@ -149,6 +149,14 @@ def assign_assignment_to_class(class_id: int, assignment_data: schemas.ClassAssi
     if not class_obj:
         raise HTTPException(status_code=404, detail="Class not found")
     
+    # Check if already assigned to this class
+    existing = db.query(models.ClassAssignments).filter(
+        models.ClassAssignments.class_id == class_id,
+        models.ClassAssignments.assignment_id == assignment_data.assignment_id
+    ).first()
+    if existing:
+        raise HTTPException(status_code=400, detail="Assignment already assigned to this class")
+    
     # Create class-assignment assignment
     class_assignment = models.ClassAssignments(
         class_id=class_id,
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
+from datetime import datetime
 import models, schemas
 database = __import__('database', fromlist=['get_db'])
 from services.notification_service import NotificationService
@@ -14,34 +16,35 @@ async def get_notifications(
     limit: int = 10,
     unread: bool = False,
     current_user: models.Users = Depends(get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """
     Get notifications for the current user
     """
-    query = db.query(models.Notification).filter(
+    query = select(models.Notification).where(
         models.Notification.user_id == current_user.id
     )
     
     if unread:
-        query = query.filter(models.Notification.is_read == False)
+        query = query.where(models.Notification.is_read == False)
         
-    notifications = query.offset(skip).limit(limit).all()
-    return notifications
+    result = await db.execute(query.offset(skip).limit(limit))
+    return result.scalars().all()
 
 @router.get("/{notification_id}", response_model=schemas.NotificationResponse)
 async def get_notification(
     notification_id: int,
     current_user: models.Users = Depends(get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """
     Get a specific notification by ID
     """
-    notification = db.query(models.Notification).filter(
+    result = await db.execute(select(models.Notification).where(
         models.Notification.id == notification_id,
         models.Notification.user_id == current_user.id
-    ).first()
+    ))
+    notification = result.scalars().first()
     
     if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
@@ -52,58 +55,62 @@ async def get_notification(
 async def mark_as_read(
     notification_id: int,
     current_user: models.Users = Depends(get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """
     Mark a notification as read
     """
-    notification = db.query(models.Notification).filter(
+    result = await db.execute(select(models.Notification).where(
         models.Notification.id == notification_id,
         models.Notification.user_id == current_user.id
-    ).first()
+    ))
+    notification = result.scalars().first()
     
     if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
         
     notification.is_read = True
     notification.read_at = datetime.utcnow()
-    db.commit()
-    db.refresh(notification)
+    await db.commit()
+    await db.refresh(notification)
     
     return notification
 
 @router.post("/read-all", response_model=List[schemas.NotificationResponse])
 async def mark_all_as_read(
     current_user: models.Users = Depends(get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """
     Mark all notifications as read for the current user
     """
-    notifications = db.query(models.Notification).filter(
+    result = await db.execute(select(models.Notification).where(
         models.Notification.user_id == current_user.id,
         models.Notification.is_read == False
-    ).all()
+    ))
+    notifications = result.scalars().all()
     
     for notification in notifications:
         notification.is_read = True
         notification.read_at = datetime.utcnow()
     
-    db.commit()
+    await db.commit()
     
     return notifications
 
 @router.get("/unread/count", response_model=int)
 async def get_unread_count(
     current_user: models.Users = Depends(get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """
     Get the count of unread notifications for the current user
     """
-    count = db.query(models.Notification).filter(
-        models.Notification.user_id == current_user.id,
-        models.Notification.is_read == False
-    ).count()
+    count = await db.scalar(
+        select(func.count()).select_from(models.Notification).where(
+            models.Notification.user_id == current_user.id,
+            models.Notification.is_read == False
+        )
+    )
     
     return count
@@ -1,12 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime
 import schemas
 import models
 import database
-from services import adaptive_learning, engagement_tracking, gamification, ai_content_generation
-from sqlalchemy import and_
+from services import adaptive_learning, engagement_tracking, gamification, ai_content_generation, mastery_history
+from services.concept_graph import concept_graph
+from services.mastery_decay import effective_mastery
+from services.engagement_buffer import engagement_buffer, EngagementBufferFull
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import and_, select
 from auth_utils import get_current_student, get_current_user
 
 router = APIRouter(
@@ -15,6 +20,7 @@ router = APIRouter(
 )
 
 get_db = database.get_db
+get_async_db = database.get_async_db
 
 @router.post("/signup", response_model=schemas.UserResponse)
 def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
@@ -49,58 +55,72 @@ def login_user(user: schemas.UserLogin, db: Session = Depends(get_db)):
 
 @router.get("/mastery", response_model=List[schemas.MasteryResponse])
 def get_mastery(
+    as_of: Optional[datetime] = None,
     db: Session = Depends(get_db),
     current_user: models.Users = Depends(get_current_student)
 ):
-    # Get student mastery records
+    # Get student mastery records, or the scores at a past time (as_of, UTC) from the mastery history
     student_id = current_user.id
+    if as_of is not None:
+        graph = concept_graph.get(db)
+        return [
+            {
+                "concept_id": concept_id,
+                "concept_name": graph.nodes[concept_id].name if concept_id in graph.nodes else "Unknown",
+                "mastery_score": score,
+                "level": int(score / 20) + 1
+            }
+            for concept_id, score in sorted(mastery_history.mastery_at(db, student_id, as_of).items())
+        ]
+    
     mastery_records = db.query(models.StudentMastery).filter(
         models.StudentMastery.student_id == student_id
     ).all()
     
+    graph = concept_graph.get(db)
+    now = datetime.utcnow()
     results = []
     for record in mastery_records:
+        # Level reflects mastery after forgetting since the concept was last practiced
+        effective_score = effective_mastery(
+            record.mastery_score, record.last_practiced_at,
+            adaptive_learning.concept_decay_rate(graph, record.concept_id), now
+        )
         results.append({
             "concept_id": record.concept_id,
-            "concept_name": record.concept.name if record.concept else "Unknown",
+            "concept_name": graph.nodes[record.concept_id].name if record.concept_id in graph.nodes else "Unknown",
             "mastery_score": record.mastery_score,
-            "level": int(record.mastery_score / 20) + 1
+            "level": int(effective_score / 20) + 1,
+            "effective_mastery_score": effective_score,
+            "last_practiced_at": record.last_practiced_at
         })
     return results
 
+@router.get("/mastery/history", response_model=List[schemas.MasteryEventResponse])
+def get_mastery_history(
+    concept_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_student)
+):
+    """Every change to the student's mastery scores, oldest first (for progress charts)"""
+    return mastery_history.mastery_timeline(db, current_user.id, concept_id, since, until)
+
+@router.get("/learning-path", response_model=List[schemas.LearningPathRecommendation])
+def get_learning_path(
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_student)
+):
+    return adaptive_learning.recommend_learning_path(current_user.id, db)
+
 @router.get("/assignments/adaptive", response_model=List[schemas.AdaptiveAssignmentResponse])
 def get_adaptive_assignments(
     db: Session = Depends(get_db),
     current_user: models.Users = Depends(get_current_student)
 ):
-    # Get adaptive assignments based on student's mastery levels and class enrollment
-    student_id = current_user.id
-    # First get classes the student is enrolled in
-    enrolled_classes = db.query(models.Classes.id)\
-        .join(models.ClassEnrollments)\
-        .filter(models.ClassEnrollments.student_id == student_id)\
-        .all()
-    
-    class_ids = [c.id for c in enrolled_classes]
-    
-    # Get assignments assigned to those classes
-    class_assignments = db.query(models.Assignments)\
-        .join(models.ClassAssignments)\
-        .filter(models.ClassAssignments.class_id.in_(class_ids))\
-        .all()
-    
-    # Convert to adaptive assignment response format
-    adaptive_assignments = []
-    for assignment in class_assignments:
-        adaptive_assignments.append(schemas.AdaptiveAssignmentResponse(
-            assignment_id=assignment.id,
-            title=assignment.title,
-            description=assignment.description,
-            difficulty_level=assignment.difficulty_level or 1,
-            estimated_time=30  # Default value
-        ))
-    
-    return adaptive_assignments
+    # Assignments for the student's weakest concepts that they don't have yet
+    return adaptive_learning.get_adaptive_assignments(current_user.id, db)
 
 @router.get("/assignments/{assignment_id}/info", response_model=schemas.AssignmentResponse)
 def get_assignment_by_id(
@@ -114,12 +134,38 @@ def get_assignment_by_id(
         raise HTTPException(status_code=404, detail="Assignment not found")
     return assignment
 
-@router.post("/engagement")
-def log_engagement(engagement: schemas.EngagementLogCreate, db: Session = Depends(get_db)):
-    # Log engagement and optionally award XP
-    engagement_tracking.log_engagement(engagement, db)
+def _log_engagement_now(engagement: schemas.EngagementLogCreate):
+    # Opened, used and closed on the worker thread, never on the event loop
+    db = database.SessionLocal()
+    try:
+        engagement_tracking.log_engagement(engagement, db)
+    finally:
+        db.close()
+
+@router.post("/engagement", status_code=status.HTTP_202_ACCEPTED)
+async def log_engagement(engagement: schemas.EngagementLogCreate):
+    # Acknowledge immediately and let the write-behind buffer persist the event
+    if engagement_buffer.running:
+        try:
+            engagement_buffer.submit(engagement)
+        except EngagementBufferFull:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Engagement buffer is full, retry later",
+                headers={"Retry-After": "1"}
+            )
+        return {"message": "Engagement accepted"}
+    
+    # Buffer disabled: log engagement synchronously
+    await run_in_threadpool(_log_engagement_now, engagement)
     return {"message": "Engagement logged successfully"}
 
+@router.post("/engagement/batch")
+def log_engagement_batch(batch: schemas.EngagementLogBatch, db: Session = Depends(get_db)):
+    # Log many engagement events (e.g. activity heartbeats) in one transaction
+    result = engagement_tracking.log_engagement_batch(batch.events, db)
+    return {"message": f"Logged {result['logged']} engagement events", "count": result["logged"]}
+
 @router.get("/projects", response_model=List[schemas.ProjectResponse])
 def get_projects(
     db: Session = Depends(get_db),
@@ -154,45 +200,45 @@ def get_badges(
 @router.get("/assignments", response_model=List[schemas.StudentAssignmentDetail])
 async def get_student_assignments(
     status: Optional[schemas.AssignmentStatus] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.Users = Depends(get_current_student)
 ):
     # Get all assignments for the student with their status
     student_id = current_user.id
-    query = db.query(models.StudentAssignments).filter(models.StudentAssignments.student_id == student_id)
+    query = select(models.StudentAssignments, models.Assignments).join(
+        models.Assignments,
+        models.Assignments.id == models.StudentAssignments.assignment_id
+    ).where(models.StudentAssignments.student_id == student_id)
     
     if status:
-        query = query.filter(models.StudentAssignments.status == status)
+        query = query.where(models.StudentAssignments.status == status)
     
-    student_assignments = query.all()
+    student_assignments = (await db.execute(query)).all()
     
-    result = []
-    for sa in student_assignments:
-        assignment = db.query(models.Assignments).filter(models.Assignments.id == sa.assignment_id).first()
-        if not assignment: continue
-        
-        # Find due date based on the class the student is enrolled in
-        due_date = None
-        student_classes = db.query(models.ClassEnrollments.class_id).filter(
+    # Find due dates based on the classes the student is enrolled in
+    due_dates = {}
+    if student_assignments:
+        student_class_ids = select(models.ClassEnrollments.class_id).where(
             models.ClassEnrollments.student_id == student_id
-        ).all()
-        student_class_ids = [c.class_id for c in student_classes]
-        
-        if student_class_ids:
-            class_assignment = db.query(models.ClassAssignments).filter(
-                models.ClassAssignments.assignment_id == sa.assignment_id,
+        )
+        class_assignments = await db.execute(
+            select(models.ClassAssignments.assignment_id, models.ClassAssignments.due_date).where(
+                models.ClassAssignments.assignment_id.in_([sa.assignment_id for sa, _ in student_assignments]),
                 models.ClassAssignments.class_id.in_(student_class_ids)
-            ).first()
-            if class_assignment:
-                due_date = class_assignment.due_date
-        
+            )
+        )
+        for assignment_id, due_date in class_assignments:
+            due_dates.setdefault(assignment_id, due_date)
+    
+    result = []
+    for sa, assignment in student_assignments:
         # Add to result list
         result.append({
             **assignment.__dict__,
             "status": sa.status,
             "score": sa.score,
             "submitted_at": sa.submitted_at,
-            "due_date": due_date
+            "due_date": due_dates.get(sa.assignment_id)
         })
     
     return result
@@ -200,12 +246,12 @@ async def get_student_assignments(
 @router.get("/assignments/{assignment_id}", response_model=schemas.StudentAssignmentDetail)
 async def get_assignment_details(
     assignment_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.Users = Depends(get_current_student)
 ):
     # Get assignment details with student's submission status
     student_id = current_user.id
-    assignment = db.query(
+    result = await db.execute(select(
         models.Assignments,
         models.StudentAssignments.status,
         models.StudentAssignments.score,
@@ -220,9 +266,10 @@ async def get_assignment_details(
     ).outerjoin(
         models.ClassAssignments,
         models.Assignments.id == models.ClassAssignments.assignment_id
-    ).filter(
+    ).where(
         models.Assignments.id == assignment_id
-    ).first()
+    ))
+    assignment = result.first()
     
     if not assignment:
         raise HTTPException(
@@ -242,16 +289,17 @@ async def get_assignment_details(
 async def submit_assignment(
     assignment_id: int,
     submission: schemas.AssignmentSubmissionCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.Users = Depends(get_current_student)
 ):
     # Check if assignment exists and is assigned to student
     student_id = current_user.id
     
-    student_assignment = db.query(models.StudentAssignments).filter(
+    result = await db.execute(select(models.StudentAssignments).where(
         models.StudentAssignments.assignment_id == assignment_id,
         models.StudentAssignments.student_id == student_id
-    ).first()
+    ))
+    student_assignment = result.scalars().first()
     
     if not student_assignment:
         raise HTTPException(
@@ -266,19 +314,25 @@ async def submit_assignment(
     student_assignment.submitted_at = datetime.utcnow()
     
     # Log engagement
+    metadata = {"assignment_id": assignment_id, "action": "submission"}
     engagement_log = models.EngagementLogs(
         student_id=student_id,
         engagement_type=schemas.EngagementType.ASSIGNMENT,
         value=1,  # Count as one engagement
-        metadata_json=f"{{'assignment_id': {assignment_id}, 'action': 'submission'}}"
+        metadata_json=metadata,
+        **engagement_tracking.promoted_metadata_columns(metadata)
     )
     
     db.add(engagement_log)
-    db.commit()
-    db.refresh(student_assignment)
+    await db.flush()
+    await db.run_sync(lambda sync_db: engagement_tracking.update_engagement_aggregate(
+        student_id, [(engagement_log.value, engagement_log.timestamp)], sync_db
+    ))
+    await db.commit()
+    await db.refresh(student_assignment)
     
     # Update student progress, XP, streaks, badges
-    gamification.update_after_submission(student_id, assignment_id, db)
+    await db.run_sync(lambda sync_db: gamification.update_after_submission(student_id, assignment_id, sync_db))
     
     # TODO: Send notification to teacher
     
@@ -287,12 +341,12 @@ async def submit_assignment(
 @router.get("/assignments/{assignment_id}/status", response_model=schemas.StudentAssignmentDetail)
 async def get_assignment_status(
     assignment_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.Users = Depends(get_current_student)
 ):
     # Get assignment status for student
     student_id = current_user.id
-    assignment = db.query(
+    result = await db.execute(select(
         models.Assignments,
         models.StudentAssignments.status,
         models.StudentAssignments.score,
@@ -307,9 +361,10 @@ async def get_assignment_status(
     ).outerjoin(
         models.ClassAssignments,
         models.Assignments.id == models.ClassAssignments.assignment_id
-    ).filter(
+    ).where(
         models.Assignments.id == assignment_id
-    ).first()
+    ))
+    assignment = result.first()
     
     if not assignment:
         raise HTTPException(
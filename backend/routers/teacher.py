@@ -1,12 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime
 import schemas
 import models
 import database
-from services import ai_content_generation, teacher_interventions
+from services import ai_content_generation, teacher_interventions, engagement_tracking, analytics_export
+from services.grading import grade_assignment
+from services.concept_graph import concept_graph
+from services.concept_search import concept_search
+from services.mastery_matrix import mastery_matrices
 import asyncio
+import os
 from auth_utils import get_current_teacher
 
 router = APIRouter(
@@ -15,6 +23,7 @@ router = APIRouter(
 )
 
 get_db = database.get_db
+get_async_db = database.get_async_db
 
 @router.get("/ai/assignments", response_model=List[schemas.AIGeneratedAssignment])
 def get_ai_assignments(concept_id: int, api_key: Optional[str] = None, db: Session = Depends(get_db)):
@@ -59,7 +68,7 @@ def create_and_assign_assignment(
     db.refresh(db_assignment)
     
     # Assign to classes and students
-    for class_id in assignment_data.class_ids:
+    for class_id in dict.fromkeys(assignment_data.class_ids):
         # Create class assignment
         class_assignment = models.ClassAssignments(
             class_id=class_id,
@@ -120,6 +129,152 @@ def get_teacher_assignments(
         
     return result
 
+@router.get("/classes/{class_id}/confusion")
+def get_class_confusion(
+    class_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_teacher)
+):
+    """Confusion index over the last hour for every student/project pair in a class"""
+    return engagement_tracking.calculate_class_confusion_indices(class_id, db)
+
+@router.get("/classes/{class_id}/mastery")
+def get_class_mastery(
+    class_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_teacher)
+):
+    """Mastery averages, percentiles and histograms per concept, plus per-student averages, for a class"""
+    if not db.query(models.Classes.id).filter(models.Classes.id == class_id).first():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Class not found")
+    return mastery_matrices.summary(class_id, db)
+
+@router.post("/concepts", response_model=schemas.ConceptResponse, status_code=status.HTTP_201_CREATED)
+def create_concept(
+    concept: schemas.ConceptCreate,
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_teacher)
+):
+    db_concept = models.Concepts(**concept.dict())
+    db.add(db_concept)
+    db.commit()
+    db.refresh(db_concept)
+    return db_concept
+
+@router.get("/concepts/search", response_model=List[schemas.ConceptSearchResult])
+def search_concepts(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_teacher)
+):
+    """Search concept names and descriptions, best matches first"""
+    text_index = concept_search.get(db)
+    results = []
+    for concept_id, score in text_index.search(q, limit):
+        node = text_index.graph.nodes[concept_id]
+        results.append({
+            "id": node.id,
+            "name": node.name,
+            "description": node.description,
+            "decay_rate": node.decay_rate,
+            "score": round(score, 4)
+        })
+    return results
+
+def _prerequisites_response(concept_id: int, db: Session) -> dict:
+    graph = concept_graph.get(db)
+    if concept_id not in graph.nodes:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Concept not found")
+    return {
+        "concept_id": concept_id,
+        "prerequisites": [
+            {"id": node.id, "name": node.name, "description": node.description, "decay_rate": node.decay_rate}
+            for node in (graph.nodes[prerequisite_id] for prerequisite_id in graph.nodes[concept_id].prerequisite_ids)
+        ],
+        "all_prerequisite_ids": graph.ids(graph.ancestors[concept_id])
+    }
+
+@router.get("/concepts/{concept_id}/prerequisites", response_model=schemas.ConceptPrerequisitesResponse)
+def get_concept_prerequisites(
+    concept_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_teacher)
+):
+    return _prerequisites_response(concept_id, db)
+
+@router.post("/concepts/{concept_id}/prerequisites", response_model=schemas.ConceptPrerequisitesResponse,
+             status_code=status.HTTP_201_CREATED)
+def add_concept_prerequisite(
+    concept_id: int,
+    prerequisite: schemas.ConceptPrerequisiteCreate,
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_teacher)
+):
+    """Make one concept a prerequisite of another; edges that would create a cycle are rejected"""
+    graph = concept_graph.get(db)
+    if concept_id not in graph.nodes or prerequisite.prerequisite_id not in graph.nodes:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Concept not found")
+    if prerequisite.prerequisite_id in graph.nodes[concept_id].prerequisite_ids:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Prerequisite already exists")
+    if graph.would_create_cycle(concept_id, prerequisite.prerequisite_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="A concept cannot depend on itself or on a concept that depends on it"
+        )
+
+    db.add(models.ConceptPrerequisites(concept_id=concept_id, prerequisite_id=prerequisite.prerequisite_id))
+    db.commit()
+    return _prerequisites_response(concept_id, db)
+
+@router.delete("/concepts/{concept_id}/prerequisites/{prerequisite_id}", status_code=status.HTTP_204_NO_CONTENT)
+def remove_concept_prerequisite(
+    concept_id: int,
+    prerequisite_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_teacher)
+):
+    deleted = db.query(models.ConceptPrerequisites).filter(
+        models.ConceptPrerequisites.concept_id == concept_id,
+        models.ConceptPrerequisites.prerequisite_id == prerequisite_id
+    ).first()
+    if not deleted:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Prerequisite not found")
+    db.delete(deleted)
+    db.commit()
+
+@router.post("/analytics/export")
+def export_analytics(
+    tables: Optional[List[str]] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_teacher)
+):
+    """Append new engagement logs and refresh mastery/assignment snapshots in the columnar export"""
+    try:
+        written = analytics_export.export_analytics(db, tables=tables)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except analytics_export.ExportInProgress as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {"written": written, "manifest": analytics_export.load_manifest()}
+
+@router.get("/analytics/export/manifest")
+def get_export_manifest(current_user: models.Users = Depends(get_current_teacher)):
+    return analytics_export.load_manifest()
+
+@router.get("/analytics/export/{table}/{part}/{column}")
+def download_export_column(
+    table: str,
+    part: str,
+    column: str,
+    current_user: models.Users = Depends(get_current_teacher)
+):
+    """Download one exported column file (.npy) listed in the manifest"""
+    path = analytics_export.export_file_path(table, part, column)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Export file not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{column}.npy")
+
 @router.get("/ai/projects", response_model=List[schemas.AIGeneratedProject])
 def get_ai_projects(skill_area: str, api_key: Optional[str] = None, db: Session = Depends(get_db)):
     # Get AI-suggested projects for a skill area
@@ -155,15 +310,15 @@ def score_soft_skills(scores: List[schemas.SoftSkillScoreCreate], db: Session =
 @router.get("/classes", response_model=List[schemas.ClassResponse])
 async def get_teacher_classes(
     current_user: models.Users = Depends(get_current_teacher),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get all classes for the current teacher
     """
-    classes = db.query(models.Classes).filter(
+    result = await db.execute(select(models.Classes).where(
         models.Classes.teacher_id == current_user.id
-    ).all()
-    return classes
+    ))
+    return result.scalars().all()
 
 @router.get("/students", response_model=List[schemas.UserResponse])
 def get_all_students(
@@ -298,18 +453,18 @@ async def generate_quiz(topic: str, difficulty: int = 3, question_count: int = 5
         )
 
 @router.get("/interventions", response_model=List[schemas.TeacherInterventionResponse])
-async def get_interventions(teacher_id: int, db: Session = Depends(get_db)):
-    interventions = teacher_interventions.get_interventions(teacher_id, db)
+async def get_interventions(teacher_id: int, db: AsyncSession = Depends(get_async_db)):
+    interventions = await teacher_interventions.get_interventions(teacher_id, db)
     return interventions
 
 @router.post("/assignments/class/{class_id}", status_code=status.HTTP_201_CREATED)
 async def assign_to_class(
     class_id: int, 
     assignment_data: schemas.ClassAssignmentAssignment,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Check if class exists
-    db_class = db.query(models.Classes).filter(models.Classes.id == class_id).first()
+    db_class = await db.get(models.Classes, class_id)
     if not db_class:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -317,9 +472,7 @@ async def assign_to_class(
         )
     
     # Check if assignment exists
-    assignment = db.query(models.Assignments).filter(
-        models.Assignments.id == assignment_data.assignment_id
-    ).first()
+    assignment = await db.get(models.Assignments, assignment_data.assignment_id)
     
     if not assignment:
         raise HTTPException(
@@ -327,6 +480,17 @@ async def assign_to_class(
             detail=f"Assignment with id {assignment_data.assignment_id} not found"
         )
     
+    # Check if already assigned to this class
+    existing = await db.scalar(select(models.ClassAssignments.id).where(
+        models.ClassAssignments.class_id == class_id,
+        models.ClassAssignments.assignment_id == assignment_data.assignment_id
+    ))
+    if existing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Assignment already assigned to this class"
+        )
+    
     # Create class assignment
     db_class_assignment = models.ClassAssignments(
         class_id=class_id,
@@ -335,9 +499,10 @@ async def assign_to_class(
     )
     
     # Get all students in the class
-    class_enrollments = db.query(models.ClassEnrollments).filter(
+    result = await db.execute(select(models.ClassEnrollments).where(
         models.ClassEnrollments.class_id == class_id
-    ).all()
+    ))
+    class_enrollments = result.scalars().all()
     
     # Assign to each student
     for enrollment in class_enrollments:
@@ -349,24 +514,25 @@ async def assign_to_class(
         db.add(student_assignment)
     
     db.add(db_class_assignment)
-    db.commit()
-    db.refresh(db_class_assignment)
+    await db.commit()
+    await db.refresh(db_class_assignment)
     
     return {"message": f"Assignment {assignment.title} assigned to class {db_class.name}"}
 
 @router.get("/classes/{class_id}/assignments", response_model=List[schemas.ClassAssignmentResponse])
-async def get_class_assignments(class_id: int, db: Session = Depends(get_db)):
+async def get_class_assignments(class_id: int, db: AsyncSession = Depends(get_async_db)):
     # Get all assignments for the class with their details
-    assignments = db.query(
+    result = await db.execute(select(
         models.Assignments,
         models.ClassAssignments.assigned_at,
         models.ClassAssignments.due_date
     ).join(
         models.ClassAssignments,
         models.Assignments.id == models.ClassAssignments.assignment_id
-    ).filter(
+    ).where(
         models.ClassAssignments.class_id == class_id
-    ).all()
+    ))
+    assignments = result.all()
     
     return [
         {
@@ -378,13 +544,26 @@ async def get_class_assignments(class_id: int, db: Session = Depends(get_db)):
         for assignment in assignments
     ]
 
+@router.post("/assignments/{assignment_id}/grades", response_model=schemas.BulkGradeResponse)
+def grade_assignment_submissions(
+    assignment_id: int,
+    request: schemas.BulkGradeRequest,
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_teacher)
+):
+    """Grade many students' submissions at once and update their mastery in the same transaction"""
+    assignment = db.query(models.Assignments).filter(models.Assignments.id == assignment_id).first()
+    if not assignment:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Assignment not found")
+    return grade_assignment(db, assignment, [(grade.student_id, grade.score) for grade in request.grades])
+
 @router.get("/assignments/{assignment_id}/submissions", response_model=List[schemas.AssignmentSubmissionResponse])
 async def get_assignment_submissions(
     assignment_id: int,
     class_id: Optional[int] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(models.StudentAssignments).filter(
+    query = select(models.StudentAssignments).where(
         models.StudentAssignments.assignment_id == assignment_id
     )
     
@@ -393,9 +572,9 @@ async def get_assignment_submissions(
         query = query.join(
             models.ClassEnrollments,
             models.StudentAssignments.student_id == models.ClassEnrollments.student_id
-        ).filter(
+        ).where(
             models.ClassEnrollments.class_id == class_id
         )
     
-    submissions = query.all()
-    return submissions
\ No newline at end of file
+    result = await db.execute(query)
+    return result.scalars().all()
\ No newline at end of file
@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field
+import json
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -40,6 +41,7 @@ class UserResponse(UserBase):
 class ConceptBase(BaseModel):
     name: str
     description: str
+    decay_rate: Optional[float] = Field(None, ge=0)  # per day; None uses the default rate
 
 class ConceptCreate(ConceptBase):
     pass
@@ -50,6 +52,17 @@ class ConceptResponse(ConceptBase):
     class Config:
         from_attributes = True
 
+class ConceptSearchResult(ConceptResponse):
+    score: float  # cosine similarity of TF-IDF vectors, 0-1
+
+class ConceptPrerequisiteCreate(BaseModel):
+    prerequisite_id: int
+
+class ConceptPrerequisitesResponse(BaseModel):
+    concept_id: int
+    prerequisites: List[ConceptResponse]  # direct prerequisites
+    all_prerequisite_ids: List[int]  # transitive closure, in learning order
+
 class StudentMasteryBase(BaseModel):
     student_id: int
     concept_id: int
@@ -91,6 +104,27 @@ class StudentAssignmentResponse(StudentAssignmentBase):
     class Config:
         from_attributes = True
 
+class GradeEntry(BaseModel):
+    student_id: int
+    score: float = Field(ge=0, le=100)
+
+class BulkGradeRequest(BaseModel):
+    grades: List[GradeEntry] = Field(min_length=1, max_length=5000)
+
+    @field_validator("grades")
+    @classmethod
+    def unique_students(cls, grades):
+        if len({grade.student_id for grade in grades}) != len(grades):
+            raise ValueError("Each student can only be graded once per request")
+        return grades
+
+class BulkGradeResponse(BaseModel):
+    assignment_id: int
+    graded: int
+    regraded: int  # already graded before; mastery replayed from their history
+    missing_student_ids: List[int]  # not given this assignment, skipped
+    mastery_updates: int
+
 class ProjectBase(BaseModel):
     title: str
     description: str
@@ -119,16 +153,39 @@ class ProjectTeamResponse(ProjectTeamBase):
     class Config:
         from_attributes = True
 
+class EngagementMetadata(BaseModel):
+    # Free-form keys are kept; these are typed and stored in indexed columns
+    confusion_flag: Optional[bool] = None
+    assignment_id: Optional[int] = None
+    action: Optional[str] = None
+    
+    class Config:
+        extra = "allow"
+
 class EngagementLogBase(BaseModel):
     student_id: int
     project_id: Optional[int]
     engagement_type: EngagementType
     value: float
-    metadata_json: Optional[str]
+    metadata_json: Optional[EngagementMetadata]
+    
+    @field_validator("metadata_json", mode="before")
+    @classmethod
+    def parse_metadata_json(cls, value):
+        # Older clients send the metadata as a JSON-encoded string
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise ValueError("metadata_json must be a JSON object")
+        return value
 
 class EngagementLogCreate(EngagementLogBase):
     pass
 
+class EngagementLogBatch(BaseModel):
+    events: List[EngagementLogCreate] = Field(min_length=1, max_length=1000)
+
 class EngagementLogResponse(EngagementLogBase):
     id: int
     timestamp: datetime
@@ -231,6 +288,19 @@ class MasteryResponse(BaseModel):
     concept_name: str
     mastery_score: float
     level: int
+    effective_mastery_score: Optional[float] = None  # mastery_score decayed since last practice
+    last_practiced_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+class MasteryEventResponse(BaseModel):
+    concept_id: int
+    mastery_before: Optional[float]
+    mastery_after: float
+    cause: str
+    assignment_id: Optional[int]
+    created_at: datetime
     
     class Config:
         from_attributes = True
@@ -245,6 +315,13 @@ class AdaptiveAssignmentResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class LearningPathRecommendation(BaseModel):
+    concept_id: int
+    concept_name: str
+    reason: str
+    priority: str
+    estimated_time: int  # in minutes
+
 class LeaderboardEntry(BaseModel):
     student_id: int
     student_name: str
@@ -297,7 +374,8 @@ class NotificationResponse(BaseModel):
     title: str
     message: str
     notification_type: str
-    metadata: Dict[str, Any]
+    # The ORM attribute is meta_data (metadata is reserved on declarative models)
+    metadata: Dict[str, Any] = Field(default_factory=dict, validation_alias="meta_data")
     is_read: bool
     created_at: datetime
     read_at: Optional[datetime] = None
@@ -1,15 +1,58 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
 import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import func, update
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import schemas
 import models
+from services.assignment_index import MAX_DIFFICULTY, assignment_index
+from services.cache_invalidation import PendingChanges
+from services.concept_graph import ConceptGraph, concept_graph
+from services.concept_search import concept_search
+from services.mastery_decay import effective_mastery, resolve_decay_rate
+from services.mastery_history import record_mastery_event, record_mastery_events
+from services.mastery_matrix import invalidate_matrices_after_commit, mastery_matrices
+
+load_dotenv()
+
+# Scores at or above this percentage count as a correct response
+MASTERY_CORRECT_THRESHOLD = 70
+# Mastery assumed before a student's first graded response on a concept
+INITIAL_MASTERY_CORRECT = 0.5
+INITIAL_MASTERY_INCORRECT = 0.2
+# How long fitted per-concept parameters are cached before being reloaded
+BKT_PARAMETERS_TTL_SECONDS = int(os.getenv("BKT_PARAMETERS_TTL_SECONDS", "300"))
+# Per-student cache of computed recommendations
+RECOMMENDATION_CACHE_TTL_SECONDS = float(os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", "300"))
+RECOMMENDATION_CACHE_MAX_SIZE = int(os.getenv("RECOMMENDATION_CACHE_MAX_SIZE", "10000"))
+# Text similarity a concept needs to count as related to a mastered one
+RELATED_CONCEPT_MIN_SCORE = 0.1
+# Number of assignments get_adaptive_assignments picks (one per weak concept)
+ADAPTIVE_ASSIGNMENT_LIMIT = int(os.getenv("ADAPTIVE_ASSIGNMENT_LIMIT", "3"))
+# Concepts at or above this (decayed) mastery are not offered adaptive assignments
+MASTERED_SCORE = 70
 
 class BayesianKnowledgeTracer:
-    def __init__(self, init_prior=0.5, learn_rate=0.3, guess_rate=0.1, slip_rate=0.1):
+    def __init__(self, init_prior=0.5, learn_rate=0.3, guess_rate=0.1, slip_rate=0.1, fitted=False):
         self.init_prior = init_prior
         self.learn_rate = learn_rate
         self.guess_rate = guess_rate
         self.slip_rate = slip_rate
+        self.fitted = fitted
+    
+    def initial_mastery(self, correctness):
+        """
+        Mastery before a student's first response: the fitted prior, or a guess
+        from the first response for the default parameters
+        """
+        if self.fitted:
+            return self.init_prior
+        return INITIAL_MASTERY_CORRECT if correctness else INITIAL_MASTERY_INCORRECT
     
     def update_mastery(self, prev_mastery, correctness):
         """
@@ -40,58 +83,303 @@ class BayesianKnowledgeTracer:
         
         return new_mastery
 
+class BatchKnowledgeTracer:
+    """
+    Vectorized Bayesian Knowledge Tracing over many (student, concept) groups.
+    
+    Parameters may be scalars or arrays with one value per group. Updates match
+    BayesianKnowledgeTracer.update_mastery element by element.
+    """
+    def __init__(self, init_prior=0.5, learn_rate=0.3, guess_rate=0.1, slip_rate=0.1):
+        self.init_prior = np.asarray(init_prior, dtype=np.float64)
+        self.learn_rate = np.asarray(learn_rate, dtype=np.float64)
+        self.guess_rate = np.asarray(guess_rate, dtype=np.float64)
+        self.slip_rate = np.asarray(slip_rate, dtype=np.float64)
+    
+    @staticmethod
+    def _param(param: np.ndarray, groups: Optional[np.ndarray]) -> np.ndarray:
+        # Per-group parameters are indexed down to the groups being updated
+        return param if param.ndim == 0 or groups is None else param[groups]
+    
+    def update(self, prev_mastery: np.ndarray, correct: np.ndarray,
+               groups: Optional[np.ndarray] = None) -> np.ndarray:
+        """One BKT step for every element; groups selects per-group parameters"""
+        slip = self._param(self.slip_rate, groups)
+        guess = self._param(self.guess_rate, groups)
+        learn = self._param(self.learn_rate, groups)
+        
+        p_obs_given_knowledge = np.where(correct, 1 - slip, slip)
+        p_obs_given_no_knowledge = np.where(correct, guess, 1 - guess)
+        numerator = prev_mastery * p_obs_given_knowledge
+        denominator = numerator + (1 - prev_mastery) * p_obs_given_no_knowledge
+        
+        posterior = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+        new_mastery = np.minimum(1.0, posterior + learn * (1 - posterior))
+        return np.where(denominator == 0, prev_mastery, new_mastery)
+    
+    def replay(self, group_starts: np.ndarray, correct: np.ndarray,
+               prior: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Replay whole response histories and return the final mastery of each group.
+        
+        correct holds every group's responses back to back, each group in order;
+        group_starts holds the offset of each group's first response. Without a
+        prior, mastery starts from the first-response rule used by
+        update_mastery_score. Each step updates every group that still has
+        responses left, so the loop runs once per position, not once per response.
+        """
+        group_starts = np.asarray(group_starts, dtype=np.int64)
+        correct = np.asarray(correct, dtype=bool)
+        counts = np.diff(np.append(group_starts, len(correct)))
+        
+        if prior is None:
+            first = correct[group_starts]
+            mastery = np.where(first, INITIAL_MASTERY_CORRECT, INITIAL_MASTERY_INCORRECT)
+        else:
+            mastery = np.array(prior, dtype=np.float64)
+        
+        # Visit groups longest first, so the groups active at step t are a prefix
+        order = np.argsort(-counts, kind="stable")
+        sorted_counts = counts[order]
+        sorted_starts = group_starts[order]
+        for t in range(int(sorted_counts[0]) if len(counts) else 0):
+            active = order[:np.searchsorted(-sorted_counts, -t, side="left")]
+            responses = correct[sorted_starts[:len(active)] + t]
+            mastery[active] = self.update(mastery[active], responses, active)
+        return mastery
+
 # Initialize BKT model
 bkt_model = BayesianKnowledgeTracer()
 
+class ConceptTracerCache:
+    """
+    Per-concept tracers built from the fitted BKTParameters table. The whole table
+    is reloaded once the TTL expires, so a fitting job run elsewhere is picked up
+    without a restart. Concepts without fitted parameters use bkt_model.
+    """
+    def __init__(self, ttl_seconds: int = BKT_PARAMETERS_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._tracers: Dict[int, BayesianKnowledgeTracer] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    def _ensure_loaded(self, db: Session):
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+                return
+            self._tracers = {
+                row.concept_id: BayesianKnowledgeTracer(
+                    init_prior=row.init_prior,
+                    learn_rate=row.learn_rate,
+                    guess_rate=row.guess_rate,
+                    slip_rate=row.slip_rate,
+                    fitted=True
+                )
+                for row in db.query(models.BKTParameters).all()
+            }
+            self._loaded_at = time.monotonic()
+    
+    def get(self, concept_id: int, db: Session) -> BayesianKnowledgeTracer:
+        self._ensure_loaded(db)
+        return self._tracers.get(concept_id, bkt_model)
+    
+    def batch_tracer(self, concept_ids: List[int], db: Session) -> Tuple[BatchKnowledgeTracer, np.ndarray]:
+        """
+        A BatchKnowledgeTracer with one parameter set per group (given each group's
+        concept), plus each group's fitted prior (NaN where the concept is unfitted)
+        """
+        tracers = [self.get(concept_id, db) for concept_id in concept_ids]
+        batch = BatchKnowledgeTracer(
+            init_prior=[t.init_prior for t in tracers],
+            learn_rate=[t.learn_rate for t in tracers],
+            guess_rate=[t.guess_rate for t in tracers],
+            slip_rate=[t.slip_rate for t in tracers]
+        )
+        priors = np.array([t.init_prior if t.fitted else np.nan for t in tracers], dtype=np.float64)
+        return batch, priors
+    
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+concept_tracers = ConceptTracerCache()
+
+class RecommendationCache:
+    """
+    Bounded TTL/LRU cache of computed recommendations per student. Each entry
+    remembers the snapshot it was computed against (the concept graph, plus the
+    assignment index version for assignments), so a rebuilt graph or a changed
+    assignment catalog (here or in another process) misses.
+    Mastery changes made through update_mastery_score, recompute_mastery or any
+    committed StudentMastery row invalidate the student's entry; other processes
+    catch up within the TTL.
+    """
+    def __init__(self, max_size: int = RECOMMENDATION_CACHE_MAX_SIZE, ttl: float = RECOMMENDATION_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (student_id, kind) -> (expires_at, snapshot, value)
+        self._lock = threading.Lock()
+    
+    def get(self, student_id: int, kind: str, snapshot):
+        key = (student_id, kind)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, cached_snapshot, value = entry
+            if expires_at < time.monotonic() or cached_snapshot != snapshot:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def put(self, student_id: int, kind: str, snapshot, value):
+        key = (student_id, kind)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, snapshot, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, student_ids: Optional[List[int]] = None):
+        """Drop the given students' entries, or the whole cache when student_ids is None"""
+        with self._lock:
+            if student_ids is None:
+                self._entries.clear()
+                return
+            student_ids = set(student_ids)
+            for key in [key for key in self._entries if key[0] in student_ids]:
+                del self._entries[key]
+
+recommendation_cache = RecommendationCache()
+
+def _collect_changed_mastery(session):
+    # Mastery written outside update_mastery_score (seed scripts, admin fixes), and
+    # assignments handed out or withdrawn, which adaptive selection excludes
+    student_ids = {
+        obj.student_id for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if isinstance(obj, models.StudentMastery)
+    }
+    student_ids.update(
+        obj.student_id for obj in list(session.new) + list(session.deleted)
+        if isinstance(obj, models.StudentAssignments)
+    )
+    return {"student_ids": student_ids, "patches": []} if student_ids else None
+
+def _merge_mastery_cache_changes(pending: Dict, changes: Dict) -> Dict:
+    if pending["student_ids"] is None or changes["student_ids"] is None:
+        pending["student_ids"] = None
+    else:
+        pending["student_ids"].update(changes["student_ids"])
+    pending["patches"].extend(changes["patches"])
+    return pending
+
+def _apply_mastery_cache_changes(pending: Dict):
+    student_ids = pending["student_ids"]
+    recommendation_cache.invalidate(None if student_ids is None else list(student_ids))
+    for student_id, concept_id, score, practiced_at in pending["patches"]:
+        mastery_matrices.patch(student_id, concept_id, score, practiced_at)
+
+mastery_cache_changes = PendingChanges(
+    "mastery_cache_changes", apply=_apply_mastery_cache_changes,
+    merge=_merge_mastery_cache_changes, collect=_collect_changed_mastery
+)
+
+def defer_mastery_cache_changes(db: Session, student_ids: Optional[List[int]],
+                                patches: List[Tuple[int, int, float, datetime]] = ()):
+    """
+    Invalidate the students' recommendations (everyone's when student_ids is None)
+    and patch (student_id, concept_id, score, practiced_at) into the class
+    matrices once db's transaction commits
+    """
+    mastery_cache_changes.defer(db, {
+        "student_ids": None if student_ids is None else set(student_ids),
+        "patches": list(patches),
+    })
+
+def effective_mastery_scores(student_id: int, graph: ConceptGraph, db: Session,
+                             now: Optional[datetime] = None) -> Dict[int, float]:
+    """A student's mastery per concept, decayed since each concept was last practiced"""
+    now = now or datetime.utcnow()
+    rows = db.query(
+        models.StudentMastery.concept_id, models.StudentMastery.mastery_score, models.StudentMastery.last_practiced_at
+    ).filter(models.StudentMastery.student_id == student_id).all()
+    return {
+        concept_id: effective_mastery(score, last_practiced_at, concept_decay_rate(graph, concept_id), now)
+        for concept_id, score, last_practiced_at in rows
+    }
+
+def concept_decay_rate(graph: ConceptGraph, concept_id: int) -> float:
+    node = graph.nodes.get(concept_id)
+    return resolve_decay_rate(node.decay_rate if node else None)
+
 def get_adaptive_assignments(student_id: int, db: Session) -> List[schemas.AdaptiveAssignmentResponse]:
     """
-    Get adaptive assignments based on student's mastery levels using BKT model.
-    Returns empty list for students who haven't completed any assignments yet.
+    Get adaptive assignments based on student's mastery levels using BKT model:
+    real assignments for the weakest concepts not yet mastered, then for concepts
+    the student hasn't practiced whose prerequisites are mastered, near the
+    difficulty matching the student's mastery, that the student doesn't already have.
     """
-    # Get student's current mastery levels
-    mastery_records = db.query(models.StudentMastery).filter(
-        models.StudentMastery.student_id == student_id
-    ).all()
+    snapshot = (concept_graph.get(db), assignment_index.snapshot_version(db))
+    cached = recommendation_cache.get(student_id, "assignments", snapshot)
+    if cached is not None:
+        return list(cached)
+    
+    assignments = _compute_adaptive_assignments(student_id, snapshot[0], db)
+    recommendation_cache.put(student_id, "assignments", snapshot, tuple(assignments))
+    return assignments
+
+def target_difficulty(mastery_score: float) -> int:
+    """Assignment difficulty (1-5) matching a mastery percentage"""
+    return min(MAX_DIFFICULTY, int(mastery_score / 20) + 1)
+
+def _compute_adaptive_assignments(student_id: int, graph: ConceptGraph, db: Session) -> List[schemas.AdaptiveAssignmentResponse]:
+    # Get student's current (decayed) mastery levels
+    mastery_by_concept = effective_mastery_scores(student_id, graph, db)
+    mastered_mask = graph.mask(
+        concept_id for concept_id, score in mastery_by_concept.items() if score >= MASTERED_SCORE
+    )
     
-    # For students who haven't completed any assignments, return empty list
-    if not mastery_records:
+    # Weakest unmastered concepts first, then new concepts the student is ready for
+    targets = sorted(
+        ((concept_id, score) for concept_id, score in mastery_by_concept.items() if score < MASTERED_SCORE),
+        key=lambda x: x[1]
+    )
+    targets.extend(
+        (concept_id, 0.0) for concept_id in graph.order
+        if concept_id not in mastery_by_concept and graph.prerequisites_met(concept_id, mastered_mask)
+    )
+    if not targets:
         return []
     
-    # For students with existing mastery records, return assignments based on lowest mastery concepts
-    assignments = []
+    # Assignments the student already has
+    assigned_ids = {
+        assignment_id for assignment_id, in db.query(models.StudentAssignments.assignment_id).filter(
+            models.StudentAssignments.student_id == student_id
+        ).all()
+    }
     
-    # Sort by mastery score to find weakest concepts
-    sorted_mastery = sorted(mastery_records, key=lambda x: x.mastery_score)
-    weakest_concept = sorted_mastery[0] if sorted_mastery else None
-    
-    if weakest_concept and weakest_concept.mastery_score < 70:
-        # Focus on weak areas
-        assignments = [
-            schemas.AdaptiveAssignmentResponse(
-                assignment_id=weakest_concept.concept_id * 10 + 1,
-                title=f"Reinforcement: {weakest_concept.concept.name}",
-                description=f"Additional practice for {weakest_concept.concept.name}",
-                difficulty_level=max(1, int(weakest_concept.mastery_score / 20)),
+    # One assignment per concept
+    assignments = []
+    for concept_id, mastery_score in targets:
+        for entry in assignment_index.candidates(db, concept_id, target_difficulty(mastery_score), assigned_ids):
+            assignments.append(schemas.AdaptiveAssignmentResponse(
+                assignment_id=entry.id,
+                title=entry.title,
+                description=entry.description,
+                difficulty_level=entry.difficulty_level,
                 estimated_time=30
-            )
-        ]
-    else:
-        # Advance to next level
-        assignments = [
-            schemas.AdaptiveAssignmentResponse(
-                assignment_id=2,
-                title="Intermediate Challenge",
-                description="Apply your knowledge in new contexts",
-                difficulty_level=3,
-                estimated_time=45
-            )
-        ]
+            ))
+        if len(assignments) >= ADAPTIVE_ASSIGNMENT_LIMIT:
+            break
     
-    return assignments
+    return assignments[:ADAPTIVE_ASSIGNMENT_LIMIT]
 
-def update_mastery_score(student_id: int, concept_id: int, score: float, db: Session):
+def update_mastery_score(student_id: int, concept_id: int, score: float, db: Session,
+                         cause: str = "assignment", assignment_id: Optional[int] = None):
     """
     Update student's mastery score for a concept after assignment submission using BKT.
+    The change is appended to the mastery event log in the same transaction.
     """
     # Get current mastery record
     mastery_record = db.query(models.StudentMastery).filter(
@@ -100,52 +388,252 @@ def update_mastery_score(student_id: int, concept_id: int, score: float, db: Ses
     ).first()
     
     # Convert percentage score to correctness (1 if >= 70%, 0 otherwise)
-    correctness = 1 if score >= 70 else 0
+    correctness = 1 if score >= MASTERY_CORRECT_THRESHOLD else 0
+    tracer = concept_tracers.get(concept_id, db)
     
+    now = datetime.utcnow()
+    previous_score = mastery_record.mastery_score if mastery_record else None
     if mastery_record:
-        # Update existing mastery using BKT
-        prev_mastery = mastery_record.mastery_score / 100.0
-        new_mastery = bkt_model.update_mastery(prev_mastery, correctness)
+        # Update existing mastery using BKT, starting from what is left after forgetting
+        prev_mastery = effective_mastery(
+            mastery_record.mastery_score, mastery_record.last_practiced_at,
+            concept_decay_rate(concept_graph.get(db), concept_id), now
+        ) / 100.0
+        new_mastery = tracer.update_mastery(prev_mastery, correctness)
         mastery_record.mastery_score = new_mastery * 100
+        mastery_record.last_practiced_at = now
     else:
         # Create new mastery record
-        initial_mastery = 0.5 if correctness else 0.2
-        new_mastery = bkt_model.update_mastery(initial_mastery, correctness)
+        initial_mastery = tracer.initial_mastery(correctness)
+        new_mastery = tracer.update_mastery(initial_mastery, correctness)
         mastery_record = models.StudentMastery(
             student_id=student_id,
             concept_id=concept_id,
-            mastery_score=new_mastery * 100
+            mastery_score=new_mastery * 100,
+            last_practiced_at=now
         )
         db.add(mastery_record)
+    record_mastery_event(db, student_id, concept_id, previous_score, mastery_record.mastery_score, cause, assignment_id)
     
     db.commit()
+    recommendation_cache.invalidate([student_id])
+    mastery_matrices.patch(student_id, concept_id, mastery_record.mastery_score, now)
     print(f"Updated mastery for student {student_id} in concept {concept_id} to {new_mastery * 100:.2f}%")
 
+def update_mastery_scores(updates: List[Tuple[int, int, float]], db: Session, cause: str = "assignment",
+                          assignment_id: Optional[int] = None, commit: bool = True) -> Dict[Tuple[int, int], float]:
+    """
+    Batch version of update_mastery_score for (student_id, concept_id, score)
+    updates, at most one per pair: one BKT step per pair, vectorized, written
+    with one bulk UPDATE and one bulk INSERT, logged as mastery events and
+    committed once (unless commit is False, when the caller commits).
+    """
+    if not updates:
+        return {}
+    now = datetime.utcnow()
+    graph = concept_graph.get(db)
+    student_ids = sorted({student_id for student_id, _, _ in updates})
+    concept_ids = sorted({concept_id for _, concept_id, _ in updates})
+    existing = {
+        (student_id, concept_id): (score, last_practiced_at)
+        for student_id, concept_id, score, last_practiced_at in db.query(
+            models.StudentMastery.student_id, models.StudentMastery.concept_id,
+            models.StudentMastery.mastery_score, models.StudentMastery.last_practiced_at
+        ).filter(
+            models.StudentMastery.student_id.in_(student_ids),
+            models.StudentMastery.concept_id.in_(concept_ids)
+        ).all()
+    }
+    
+    # Convert percentage scores to correctness, as update_mastery_score does
+    correct = np.array([score >= MASTERY_CORRECT_THRESHOLD for _, _, score in updates], dtype=bool)
+    tracer, fitted_priors = concept_tracers.batch_tracer([concept_id for _, concept_id, _ in updates], db)
+    has_record = np.array([(student_id, concept_id) in existing for student_id, concept_id, _ in updates], dtype=bool)
+    # Existing mastery after forgetting, or the first-response prior for new records
+    decayed = np.array([
+        effective_mastery(*existing[(student_id, concept_id)], concept_decay_rate(graph, concept_id), now) / 100.0
+        if (student_id, concept_id) in existing else np.nan
+        for student_id, concept_id, _ in updates
+    ], dtype=np.float64)
+    initial = np.where(
+        np.isnan(fitted_priors),
+        np.where(correct, INITIAL_MASTERY_CORRECT, INITIAL_MASTERY_INCORRECT),
+        fitted_priors
+    )
+    mastery = tracer.update(np.where(has_record, decayed, initial), correct) * 100
+    results = {(student_id, concept_id): score for (student_id, concept_id, _), score in zip(updates, mastery.tolist())}
+    
+    rows = [
+        {"student_id": student_id, "concept_id": concept_id, "mastery_score": score, "last_practiced_at": now}
+        for (student_id, concept_id), score in results.items()
+    ]
+    updated = [row for row in rows if (row["student_id"], row["concept_id"]) in existing]
+    inserted = [row for row in rows if (row["student_id"], row["concept_id"]) not in existing]
+    if updated:
+        db.execute(update(models.StudentMastery), updated)
+    if inserted:
+        db.bulk_insert_mappings(models.StudentMastery, inserted)
+    record_mastery_events(db, [
+        {"student_id": student_id, "concept_id": concept_id,
+         "mastery_before": existing[(student_id, concept_id)][0] if (student_id, concept_id) in existing else None,
+         "mastery_after": score, "cause": cause, "assignment_id": assignment_id}
+        for (student_id, concept_id), score in results.items()
+    ])
+    
+    # The caches only see the new scores once they are committed
+    defer_mastery_cache_changes(db, student_ids, [
+        (student_id, concept_id, score, now) for (student_id, concept_id), score in results.items()
+    ])
+    if commit:
+        db.commit()
+    return results
+
+def load_response_histories(db: Session, student_ids: Optional[List[int]] = None,
+                            concept_ids: Optional[List[int]] = None):
+    """
+    Graded responses grouped by (student, concept) in submission order.
+    Returns (keys, group_starts, correct) in the layout BatchKnowledgeTracer.replay takes.
+    """
+    query = db.query(
+        models.StudentAssignments.student_id,
+        models.Assignments.concept_id,
+        models.StudentAssignments.score
+    ).join(
+        models.Assignments, models.Assignments.id == models.StudentAssignments.assignment_id
+    ).filter(
+        models.StudentAssignments.score.isnot(None),
+        models.Assignments.concept_id.isnot(None)
+    ).order_by(
+        models.StudentAssignments.student_id,
+        models.Assignments.concept_id,
+        models.StudentAssignments.submitted_at.nullslast(),
+        models.StudentAssignments.assignment_id
+    )
+    if student_ids is not None:
+        query = query.filter(models.StudentAssignments.student_id.in_(student_ids))
+    if concept_ids is not None:
+        query = query.filter(models.Assignments.concept_id.in_(concept_ids))
+    rows = query.all()
+    
+    students = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    concepts = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    correct = np.fromiter((row[2] >= MASTERY_CORRECT_THRESHOLD for row in rows), dtype=bool, count=len(rows))
+    
+    key_changes = (students[1:] != students[:-1]) | (concepts[1:] != concepts[:-1])
+    group_starts = np.concatenate(([0], np.flatnonzero(key_changes) + 1)) if len(rows) else np.empty(0, dtype=np.int64)
+    keys = [(int(students[i]), int(concepts[i])) for i in group_starts]
+    return keys, group_starts, correct
+
+def recompute_mastery(db: Session, student_ids: Optional[List[int]] = None,
+                      tracer: Optional[BatchKnowledgeTracer] = None, cause: str = "recompute",
+                      assignment_id: Optional[int] = None,
+                      concept_ids: Optional[List[int]] = None) -> Dict[Tuple[int, int], float]:
+    """
+    Recompute mastery from the full graded history (e.g. after fitting new BKT
+    parameters, or a regrade) and write it to StudentMastery in bulk, for all
+    concepts or only the given ones. Each concept
+    uses its fitted parameters unless a tracer is given. Pairs without graded
+    history are left untouched; changed scores are logged as mastery events with
+    the given cause. The caller commits.
+    """
+    keys, group_starts, correct = load_response_histories(db, student_ids, concept_ids)
+    if not keys:
+        return {}
+    if tracer is None:
+        tracer, fitted_priors = concept_tracers.batch_tracer([concept_id for _, concept_id in keys], db)
+        first = correct[group_starts]
+        prior = np.where(
+            np.isnan(fitted_priors),
+            np.where(first, INITIAL_MASTERY_CORRECT, INITIAL_MASTERY_INCORRECT),
+            fitted_priors
+        )
+        mastery = tracer.replay(group_starts, correct, prior=prior) * 100
+    else:
+        mastery = tracer.replay(group_starts, correct) * 100
+    results = dict(zip(keys, mastery.tolist()))
+    
+    existing_query = db.query(
+        models.StudentMastery.student_id, models.StudentMastery.concept_id, models.StudentMastery.mastery_score
+    )
+    if student_ids is not None:
+        existing_query = existing_query.filter(models.StudentMastery.student_id.in_(student_ids))
+    if concept_ids is not None:
+        existing_query = existing_query.filter(models.StudentMastery.concept_id.in_(concept_ids))
+    existing = {(student_id, concept_id): score for student_id, concept_id, score in existing_query.all()}
+    
+    # Replayed scores are as of each pair's latest graded submission
+    practiced_query = db.query(
+        models.StudentAssignments.student_id,
+        models.Assignments.concept_id,
+        func.max(models.StudentAssignments.submitted_at)
+    ).join(
+        models.Assignments, models.Assignments.id == models.StudentAssignments.assignment_id
+    ).filter(
+        models.StudentAssignments.score.isnot(None)
+    ).group_by(models.StudentAssignments.student_id, models.Assignments.concept_id)
+    if student_ids is not None:
+        practiced_query = practiced_query.filter(models.StudentAssignments.student_id.in_(student_ids))
+    if concept_ids is not None:
+        practiced_query = practiced_query.filter(models.Assignments.concept_id.in_(concept_ids))
+    practiced = {(student_id, concept_id): at for student_id, concept_id, at in practiced_query.all()}
+    
+    rows = [
+        {"student_id": student_id, "concept_id": concept_id, "mastery_score": score,
+         "last_practiced_at": practiced.get((student_id, concept_id))}
+        for (student_id, concept_id), score in results.items()
+    ]
+    updates = [row for row in rows if (row["student_id"], row["concept_id"]) in existing]
+    inserts = [row for row in rows if (row["student_id"], row["concept_id"]) not in existing]
+    if updates:
+        # ORM bulk UPDATE by primary key (executemany)
+        db.execute(update(models.StudentMastery), updates)
+    if inserts:
+        db.bulk_insert_mappings(models.StudentMastery, inserts)
+    record_mastery_events(db, [
+        {"student_id": student_id, "concept_id": concept_id, "mastery_before": existing.get((student_id, concept_id)),
+         "mastery_after": score, "cause": cause, "assignment_id": assignment_id}
+        for (student_id, concept_id), score in results.items()
+        if existing.get((student_id, concept_id)) is None or abs(existing[(student_id, concept_id)] - score) > 1e-9
+    ])
+    # Every class the students are in may change; applied once the caller commits
+    defer_mastery_cache_changes(db, student_ids)
+    invalidate_matrices_after_commit(db)
+    return results
+
 def recommend_learning_path(student_id: int, db: Session) -> List[dict]:
     """
     Recommend a personalized learning path based on student's mastery levels and goals.
     """
-    # Get student's current mastery levels
-    mastery_records = db.query(models.StudentMastery).filter(
-        models.StudentMastery.student_id == student_id
-    ).all()
-    
-    # Get student's concept progress
-    progress_records = db.query(models.ConceptProgress).filter(
-        models.ConceptProgress.student_id == student_id
-    ).all()
+    graph = concept_graph.get(db)
+    cached = recommendation_cache.get(student_id, "learning_path", graph)
+    if cached is not None:
+        return list(cached)
     
-    # Get all concepts
-    all_concepts = db.query(models.Concepts).all()
+    recommendations = _compute_learning_path(student_id, graph, db)
+    recommendation_cache.put(student_id, "learning_path", graph, tuple(recommendations))
+    return recommendations
+
+def _compute_learning_path(student_id: int, graph: ConceptGraph, db: Session) -> List[dict]:
+    # Get student's current (decayed) mastery levels
+    mastery_by_concept = {
+        concept_id: score for concept_id, score in effective_mastery_scores(student_id, graph, db).items()
+        if concept_id in graph.nodes
+    }
     
     # Build recommendation
     recommendations = []
     
-    if not mastery_records:
+    if not mastery_by_concept:
         # New student - recommend foundational concepts
-        foundational_concepts = [c for c in all_concepts if "basic" in c.name.lower() or "intro" in c.name.lower()]
+        foundational_concepts = [
+            graph.nodes[concept_id] for concept_id in graph.order
+            if "basic" in graph.nodes[concept_id].name.lower() or "intro" in graph.nodes[concept_id].name.lower()
+        ]
         if not foundational_concepts:
-            foundational_concepts = all_concepts[:3]  # First 3 concepts as fallback
+            # Concepts without prerequisites as fallback
+            foundational_concepts = [
+                graph.nodes[concept_id] for concept_id in graph.order if not graph.nodes[concept_id].prerequisite_ids
+            ][:3]
         
         for concept in foundational_concepts:
             recommendations.append({
@@ -157,61 +645,61 @@ def recommend_learning_path(student_id: int, db: Session) -> List[dict]:
             })
     else:
         # Existing student - analyze gaps and suggest next steps
-        # 1. Find weak areas (mastery < 70%)
-        weak_areas = [m for m in mastery_records if m.mastery_score < 70]
+        recommended = set()
+        mastered_mask = graph.mask(
+            concept_id for concept_id, score in mastery_by_concept.items() if score >= 70
+        )
         
-        for mastery in weak_areas:
-            concept = next((c for c in all_concepts if c.id == mastery.concept_id), None)
-            if concept:
+        # 1. Find weak areas (mastery < 70%), prerequisites first
+        for concept_id in graph.order:
+            score = mastery_by_concept.get(concept_id)
+            if score is not None and score < 70:
                 recommendations.append({
-                    "concept_id": concept.id,
-                    "concept_name": concept.name,
-                    "reason": f"Reinforce weak area (current mastery: {mastery.mastery_score:.1f}%)",
+                    "concept_id": concept_id,
+                    "concept_name": graph.nodes[concept_id].name,
+                    "reason": f"Reinforce weak area (current mastery: {score:.1f}%)",
                     "priority": "high",
                     "estimated_time": 90
                 })
+                recommended.add(concept_id)
         
-        # 2. Find next concepts to learn (prerequisites met)
-        mastered_concepts = [m for m in mastery_records if m.mastery_score >= 70]
-        mastered_concept_ids = [m.concept_id for m in mastered_concepts]
-        
-        # Simple prerequisite logic (in a real system, this would be more complex)
-        for concept in all_concepts:
-            if concept.id not in mastered_concept_ids and concept.id not in [r["concept_id"] for r in recommendations]:
-                # Check if prerequisites are met (simplified)
-                # In a real system, you'd have a prerequisites table
-                prereq_met = True  # Simplified for demo
-                
-                if prereq_met:
-                    recommendations.append({
-                        "concept_id": concept.id,
-                        "concept_name": concept.name,
-                        "reason": "Next logical concept to learn",
-                        "priority": "medium",
-                        "estimated_time": 120
-                    })
+        # 2. Find next concepts to learn (every prerequisite, direct or transitive, mastered)
+        for concept_id in graph.order:
+            if concept_id in mastery_by_concept or concept_id in recommended:
+                continue
+            if graph.prerequisites_met(concept_id, mastered_mask):
+                recommendations.append({
+                    "concept_id": concept_id,
+                    "concept_name": graph.nodes[concept_id].name,
+                    "reason": "Next logical concept to learn",
+                    "priority": "medium",
+                    "estimated_time": 120
+                })
+                recommended.add(concept_id)
         
         # 3. Advanced topics for highly mastered concepts
-        advanced_concepts = [m for m in mastery_records if m.mastery_score >= 90]
-        
-        for mastery in advanced_concepts:
-            # Suggest related advanced topics
-            related_advanced = [c for c in all_concepts 
-                              if c.id != mastery.concept_id and 
-                                 c.name.lower().find(mastery.concept.name.lower()[:4]) != -1]
+        text_index = concept_search.get(db)
+        mastered = {concept_id for concept_id, score in mastery_by_concept.items() if score >= 70}
+        for concept_id, score in mastery_by_concept.items():
+            if score < 90:
+                continue
             
-            for concept in related_advanced[:2]:  # Max 2 related advanced topics
-                if concept.id not in [r["concept_id"] for r in recommendations]:
-                    recommendations.append({
-                        "concept_id": concept.id,
-                        "concept_name": concept.name,
-                        "reason": f"Advanced extension of mastered concept ({mastery.mastery_score:.1f}% mastery)",
-                        "priority": "low",
-                        "estimated_time": 150
-                    })
+            # Suggest related advanced topics
+            related_advanced = text_index.related(
+                concept_id, limit=2, min_score=RELATED_CONCEPT_MIN_SCORE, exclude=recommended | mastered
+            )  # Max 2 related advanced topics
+            for other_id, _ in related_advanced:
+                recommendations.append({
+                    "concept_id": other_id,
+                    "concept_name": graph.nodes[other_id].name,
+                    "reason": f"Advanced extension of mastered concept ({score:.1f}% mastery)",
+                    "priority": "low",
+                    "estimated_time": 150
+                })
+                recommended.add(other_id)
     
     # Sort by priority (high first) then by estimated time
     priority_order = {"high": 0, "medium": 1, "low": 2}
     recommendations.sort(key=lambda x: (priority_order[x["priority"]], x["estimated_time"]))
     
-    return recommendations
\ No newline at end of file
+    return recommendations
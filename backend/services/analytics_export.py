@@ -0,0 +1,279 @@
+"""
+Columnar analytics export.
+
+Streams engagement logs, mastery scores and assignment results out of the
+database in chunks into one NumPy .npy file per column, so offline analysis can
+np.load(..., mmap_mode="r") them without going through the ORM. Each table is a
+list of part directories described by manifest.json:
+
+    <export dir>/manifest.json
+    <export dir>/engagement_logs/part-000000/id.npy, student_id.npy, ...
+    <export dir>/student_mastery/snapshot-<time>/student_id.npy, ...
+
+engagement_logs is append-only: each export adds a part with the rows past the
+id watermark recorded in the manifest. student_mastery and student_assignments
+are updated in place and have no id/timestamp to track, so each export replaces
+them with a fresh snapshot part.
+
+Nullable integer columns use -1 for NULL, floats use NaN and datetimes NaT.
+Enum and string columns are stored as integer codes into the column's
+"categories" list in the manifest (the list only ever grows, so codes are
+stable across parts).
+"""
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+import models
+
+load_dotenv()
+
+ANALYTICS_EXPORT_DIR = os.getenv("ANALYTICS_EXPORT_DIR", "./analytics_export")
+ANALYTICS_EXPORT_CHUNK_SIZE = int(os.getenv("ANALYTICS_EXPORT_CHUNK_SIZE", "10000"))  # rows per query
+ANALYTICS_EXPORT_PART_ROWS = int(os.getenv("ANALYTICS_EXPORT_PART_ROWS", "1000000"))  # rows per part
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".export.lock"
+NULL_INT = -1
+
+# Column kinds and their on-disk dtypes
+DTYPES = {
+    "int": np.int64,
+    "float": np.float64,
+    "bool": np.bool_,
+    "datetime": "datetime64[us]",
+    "category": np.int32,
+}
+
+# name -> (mode, model, [(column name, kind)])
+TABLES = {
+    "engagement_logs": ("append", models.EngagementLogs, [
+        ("id", "int"),
+        ("student_id", "int"),
+        ("project_id", "int"),
+        ("timestamp", "datetime"),
+        ("engagement_type", "category"),
+        ("value", "float"),
+        ("confusion_flag", "bool"),
+        ("assignment_id", "int"),
+        ("action", "category"),
+    ]),
+    "student_mastery": ("snapshot", models.StudentMastery, [
+        ("student_id", "int"),
+        ("concept_id", "int"),
+        ("mastery_score", "float"),
+        ("last_practiced_at", "datetime"),
+    ]),
+    "student_assignments": ("snapshot", models.StudentAssignments, [
+        ("student_id", "int"),
+        ("assignment_id", "int"),
+        ("status", "category"),
+        ("score", "float"),
+        ("submitted_at", "datetime"),
+    ]),
+}
+
+class ExportInProgress(Exception):
+    """Another export is writing to the same directory"""
+
+def load_manifest(export_dir: str = ANALYTICS_EXPORT_DIR) -> Dict:
+    path = os.path.join(export_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"format": "npy", "version": 1, "tables": {}}
+    with open(path) as f:
+        return json.load(f)
+
+def _write_manifest(export_dir: str, manifest: Dict):
+    # Write then rename, so readers never see a half-written manifest
+    path = os.path.join(export_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def _column_manifest(kind: str, existing: Optional[Dict] = None) -> Dict:
+    column = existing or {"kind": kind, "dtype": np.dtype(DTYPES[kind]).str}
+    if kind == "int":
+        column["null"] = NULL_INT
+    elif kind == "category":
+        column.setdefault("categories", [])
+    return column
+
+def _to_array(values: List, kind: str, column: Dict) -> np.ndarray:
+    if kind == "int":
+        return np.fromiter((NULL_INT if v is None else v for v in values), dtype=np.int64, count=len(values))
+    if kind == "float":
+        return np.fromiter((np.nan if v is None else v for v in values), dtype=np.float64, count=len(values))
+    if kind == "bool":
+        return np.fromiter((bool(v) for v in values), dtype=np.bool_, count=len(values))
+    if kind == "datetime":
+        return np.array([np.datetime64("NaT") if v is None else v for v in values], dtype="datetime64[us]")
+
+    # Categories: NULL is -1, new values are appended to the manifest's list
+    categories = column["categories"]
+    codes = {category: code for code, category in enumerate(categories)}
+    result = np.empty(len(values), dtype=np.int32)
+    for i, v in enumerate(values):
+        if v is None:
+            result[i] = NULL_INT
+            continue
+        v = v.value if hasattr(v, "value") else str(v)
+        if v not in codes:
+            codes[v] = len(categories)
+            categories.append(v)
+        result[i] = codes[v]
+    return result
+
+def _write_part(export_dir: str, part_path: str, columns: Dict[str, List[np.ndarray]]) -> int:
+    """Write one part directory (atomically, via a temporary directory)"""
+    target = os.path.join(export_dir, part_path)
+    tmp = target + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    rows = 0
+    for name, chunks in columns.items():
+        array = np.concatenate(chunks)
+        np.save(os.path.join(tmp, f"{name}.npy"), array)
+        rows = len(array)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return rows
+
+def _stream(db: Session, model, column_specs, manifest_columns, query_filter=None, order_by=None):
+    """Yield dicts of column arrays, ANALYTICS_EXPORT_CHUNK_SIZE rows at a time"""
+    query = db.query(*[getattr(model, name) for name, _ in column_specs])
+    if query_filter is not None:
+        query = query.filter(query_filter)
+    if order_by is not None:
+        query = query.order_by(order_by)
+
+    def convert(rows):
+        return {
+            name: _to_array([row[i] for row in rows], kind, manifest_columns[name])
+            for i, (name, kind) in enumerate(column_specs)
+        }
+
+    batch = []
+    for row in query.yield_per(ANALYTICS_EXPORT_CHUNK_SIZE):
+        batch.append(row)
+        if len(batch) == ANALYTICS_EXPORT_CHUNK_SIZE:
+            yield convert(batch)
+            batch = []
+    if batch:
+        yield convert(batch)
+
+def _part_entry(part_path: str, rows: int, columns: Dict[str, List[np.ndarray]]) -> Dict:
+    entry = {"path": part_path, "rows": rows, "exported_at": datetime.utcnow().isoformat()}
+    if "id" in columns:
+        ids = np.concatenate(columns["id"])
+        entry["min_id"], entry["max_id"] = int(ids.min()), int(ids.max())
+    if "timestamp" in columns:
+        timestamps = np.concatenate(columns["timestamp"])
+        entry["min_timestamp"] = str(timestamps.min())
+        entry["max_timestamp"] = str(timestamps.max())
+    return entry
+
+def _export_append(db: Session, export_dir: str, name: str, model, column_specs, table: Dict) -> int:
+    """Append rows past the id watermark as new parts"""
+    watermark = table.get("watermark", 0)
+    # Fix the upper bound so rows inserted during the export go to the next one
+    upper = db.query(model.id).order_by(model.id.desc()).limit(1).scalar() or 0
+
+    exported = 0
+    pending, pending_rows = {}, 0
+
+    def flush():
+        part_path = f"{name}/part-{len(table['parts']):06d}"
+        rows = _write_part(export_dir, part_path, pending)
+        table["parts"].append(_part_entry(part_path, rows, pending))
+        return rows
+
+    chunks = _stream(
+        db, model, column_specs, table["columns"],
+        query_filter=(model.id > watermark) & (model.id <= upper), order_by=model.id
+    )
+    for chunk in chunks:
+        for column, array in chunk.items():
+            pending.setdefault(column, []).append(array)
+        pending_rows += len(chunk["id"])
+        if pending_rows >= ANALYTICS_EXPORT_PART_ROWS:
+            exported += flush()
+            pending, pending_rows = {}, 0
+    if pending_rows:
+        exported += flush()
+
+    table["watermark"] = max(watermark, upper)
+    return exported
+
+def _export_snapshot(db: Session, export_dir: str, name: str, model, column_specs, table: Dict) -> int:
+    """Replace the table with a fresh snapshot part"""
+    columns = {column: [np.empty(0, dtype=DTYPES[kind])] for column, kind in column_specs}
+    for chunk in _stream(db, model, column_specs, table["columns"]):
+        for column, array in chunk.items():
+            columns[column].append(array)
+
+    part_path = f"{name}/snapshot-{datetime.utcnow():%Y%m%dT%H%M%S%f}"
+    rows = _write_part(export_dir, part_path, columns)
+    table["parts"] = [_part_entry(part_path, rows, columns)]
+    return rows
+
+def export_analytics(db: Session, export_dir: str = ANALYTICS_EXPORT_DIR,
+                     tables: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Export the analytics tables (all of them by default) into export_dir and
+    update its manifest. Returns the number of rows written per table.
+    """
+    names = tables or list(TABLES)
+    unknown = set(names) - set(TABLES)
+    if unknown:
+        raise ValueError(f"Unknown analytics tables: {', '.join(sorted(unknown))}")
+
+    os.makedirs(export_dir, exist_ok=True)
+    lock_path = os.path.join(export_dir, LOCK_NAME)
+    try:
+        lock = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        raise ExportInProgress(f"An export is already running in {export_dir} (remove {lock_path} if it crashed)")
+
+    try:
+        manifest = load_manifest(export_dir)
+        written, stale_parts = {}, []
+        for name in names:
+            mode, model, column_specs = TABLES[name]
+            table = manifest["tables"].setdefault(name, {"mode": mode, "columns": {}, "parts": []})
+            for column, kind in column_specs:
+                table["columns"][column] = _column_manifest(kind, table["columns"].get(column))
+
+            if mode == "append":
+                written[name] = _export_append(db, export_dir, name, model, column_specs, table)
+            else:
+                stale_parts.extend(part["path"] for part in table["parts"])
+                written[name] = _export_snapshot(db, export_dir, name, model, column_specs, table)
+            table["rows"] = sum(part["rows"] for part in table["parts"])
+            table["exported_at"] = datetime.utcnow().isoformat()
+
+        manifest["exported_at"] = datetime.utcnow().isoformat()
+        _write_manifest(export_dir, manifest)
+
+        # Superseded snapshots are only removed once the new manifest is in place
+        for part_path in stale_parts:
+            shutil.rmtree(os.path.join(export_dir, part_path), ignore_errors=True)
+        return written
+    finally:
+        os.close(lock)
+        os.remove(lock_path)
+
+def export_file_path(table: str, part: str, column: str, export_dir: str = ANALYTICS_EXPORT_DIR) -> Optional[str]:
+    """Path of an exported column file listed in the manifest, or None"""
+    entry = load_manifest(export_dir)["tables"].get(table)
+    if not entry or column not in entry["columns"]:
+        return None
+    part_path = f"{table}/{part}"
+    if part_path not in {p["path"] for p in entry["parts"]}:
+        return None
+    return os.path.join(export_dir, part_path, f"{column}.npy")
@@ -0,0 +1,159 @@
+"""
+In-memory index of assignments keyed by (concept_id, difficulty_level).
+
+Adaptive assignment selection looks up real assignments for a concept near a
+target difficulty with dictionary lookups instead of scanning the assignments
+table. The index is loaded on first use and kept in sync with assignments
+created, changed or deleted through any session in this process once their
+transaction commits; a stamp file tells other processes to reload theirs.
+"""
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+import models
+from services.cache_invalidation import PendingChanges, StampFile
+
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 5
+
+@dataclass(frozen=True)
+class IndexedAssignment:
+    id: int
+    concept_id: int
+    difficulty_level: int
+    title: str
+    description: str
+
+    @classmethod
+    def from_assignment(cls, assignment: models.Assignments) -> "IndexedAssignment":
+        return cls(
+            id=assignment.id,
+            concept_id=assignment.concept_id,
+            difficulty_level=assignment.difficulty_level or MIN_DIFFICULTY,
+            title=assignment.title,
+            description=assignment.description or ""
+        )
+
+class AssignmentIndex:
+    def __init__(self, stamp_dir: Optional[str] = None):
+        self.stamp = StampFile(".assignment_index_stamp", stamp_dir)
+        self._buckets: Dict[Tuple[int, int], List[IndexedAssignment]] = {}  # sorted by id
+        self._by_id: Dict[int, IndexedAssignment] = {}
+        self._loaded = False
+        self._stamp = self.stamp.read()
+        self._lock = threading.Lock()
+        # Bumped on every change, so caches built from the index can tell they are stale
+        self.version = 0
+
+    def _ensure_loaded(self, db: Session):
+        stamp = self.stamp.read()
+        if self._loaded and stamp == self._stamp:
+            return
+        self._buckets, self._by_id = {}, {}
+        rows = db.query(models.Assignments).filter(
+            models.Assignments.concept_id.isnot(None)
+        ).order_by(models.Assignments.id).all()
+        for assignment in rows:
+            self._insert(IndexedAssignment.from_assignment(assignment))
+        self._loaded = True
+        self._stamp = stamp
+        self.version += 1
+
+    def _insert(self, entry: IndexedAssignment):
+        bucket = self._buckets.setdefault((entry.concept_id, entry.difficulty_level), [])
+        bucket.append(entry)
+        if len(bucket) > 1 and bucket[-2].id > entry.id:
+            bucket.sort(key=lambda e: e.id)
+        self._by_id[entry.id] = entry
+
+    def _remove(self, assignment_id: int):
+        entry = self._by_id.pop(assignment_id, None)
+        if entry is None:
+            return
+        key = (entry.concept_id, entry.difficulty_level)
+        bucket = [e for e in self._buckets[key] if e.id != assignment_id]
+        if bucket:
+            self._buckets[key] = bucket
+        else:
+            del self._buckets[key]
+
+    def apply(self, upserts: Iterable[IndexedAssignment], deleted_ids: Iterable[int]):
+        """Apply committed changes; a no-op until the index has been loaded"""
+        with self._lock:
+            if not self._loaded:
+                return
+            for assignment_id in deleted_ids:
+                self._remove(assignment_id)
+            for entry in upserts:
+                self._remove(entry.id)
+                if entry.concept_id is not None:
+                    self._insert(entry)
+            self.version += 1
+
+    def snapshot_version(self, db: Session) -> int:
+        with self._lock:
+            self._ensure_loaded(db)
+            return self.version
+
+    def candidates(self, db: Session, concept_id: int, target_difficulty: int,
+                   exclude_ids: Set[int] = frozenset(), limit: int = 1) -> List[IndexedAssignment]:
+        """
+        Up to limit assignments for a concept, closest to the target difficulty first
+        (ties go to the easier level, then the oldest assignment)
+        """
+        with self._lock:
+            self._ensure_loaded(db)
+            results = []
+            for distance in range(MAX_DIFFICULTY - MIN_DIFFICULTY + 1):
+                for difficulty in (target_difficulty - distance, target_difficulty + distance):
+                    for entry in self._buckets.get((concept_id, difficulty), ()):
+                        if entry.id not in exclude_ids:
+                            results.append(entry)
+                            if len(results) == limit:
+                                return results
+                    if distance == 0:
+                        break
+            return results
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def touch_stamp(self):
+        """Signal other processes to reload their index"""
+        stamp = self.stamp.touch()
+        with self._lock:
+            # Our own index is already up to date
+            self._stamp = stamp
+
+assignment_index = AssignmentIndex()
+
+def _collect_changed_assignments(session):
+    upserts, deleted_ids = {}, set()
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, models.Assignments):
+            upserts[obj.id] = IndexedAssignment.from_assignment(obj)
+    for obj in session.deleted:
+        if isinstance(obj, models.Assignments):
+            deleted_ids.add(obj.id)
+    return (upserts, deleted_ids) if upserts or deleted_ids else None
+
+def _merge_changed_assignments(pending, changes):
+    upserts, deleted_ids = pending
+    for assignment_id in changes[1]:
+        upserts.pop(assignment_id, None)
+    upserts.update(changes[0])
+    deleted_ids.update(changes[1])
+    return pending
+
+def _apply_changed_assignments(pending):
+    assignment_index.apply(pending[0].values(), pending[1])
+    assignment_index.touch_stamp()
+
+assignment_index_changes = PendingChanges(
+    "assignment_index_changes", apply=_apply_changed_assignments,
+    merge=_merge_changed_assignments, collect=_collect_changed_assignments
+)
@@ -0,0 +1,157 @@
+"""
+Offline fitting of per-concept BKT parameters.
+
+For each concept, every student's graded responses (from StudentAssignments, in
+submission order) are scored under a grid of (init_prior, learn_rate, guess_rate,
+slip_rate) candidates. The log-likelihood of all candidates is evaluated at once
+with NumPy: the forward pass keeps a (candidates x students) mastery matrix and
+advances every student that still has responses one position per step. The best
+candidate seeds a finer grid around it for a few refinement rounds.
+
+Concepts are fitted in parallel in a process pool; results are upserted into the
+bkt_parameters table, which update_mastery_score reads through its tracer cache.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+import models
+from services.adaptive_learning import concept_tracers, load_response_histories
+
+load_dotenv()
+
+BKT_FIT_WORKERS = int(os.getenv("BKT_FIT_WORKERS", str(os.cpu_count() or 1)))
+BKT_FIT_MIN_RESPONSES = int(os.getenv("BKT_FIT_MIN_RESPONSES", "50"))
+BKT_FIT_GRID_POINTS = int(os.getenv("BKT_FIT_GRID_POINTS", "5"))
+BKT_FIT_REFINE_ROUNDS = int(os.getenv("BKT_FIT_REFINE_ROUNDS", "2"))
+# Upper bound on the candidates x students matrix evaluated at once
+BKT_FIT_MAX_CELLS = int(os.getenv("BKT_FIT_MAX_CELLS", "2000000"))
+
+# (init_prior, learn_rate, guess_rate, slip_rate) search bounds; guess and slip stay
+# below 0.5 so "knows the concept" and "doesn't" remain distinguishable
+PARAMETER_BOUNDS = np.array([
+    (0.01, 0.99),
+    (0.01, 0.60),
+    (0.01, 0.45),
+    (0.01, 0.45),
+])
+
+def candidate_grid(lower: np.ndarray, upper: np.ndarray, points: int) -> np.ndarray:
+    """Cartesian grid of candidates, shape (points ** 4, 4)"""
+    axes = [np.linspace(lo, hi, points) for lo, hi in zip(lower, upper)]
+    return np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 4)
+
+def grid_log_likelihood(group_starts: np.ndarray, correct: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+    """
+    Log-likelihood of the response histories under each candidate parameter set.
+    Histories are laid out as in BatchKnowledgeTracer.replay.
+    """
+    counts = np.diff(np.append(group_starts, len(correct)))
+    order = np.argsort(-counts, kind="stable")
+    starts, counts = group_starts[order], counts[order]
+
+    # float32 halves the memory traffic of the forward pass; sums stay in float64
+    init_prior, learn, guess, slip = (candidates[:, i:i + 1].astype(np.float32) for i in range(4))
+    log_likelihood = np.zeros(len(candidates))
+    chunk = max(1, BKT_FIT_MAX_CELLS // len(candidates))
+
+    for chunk_start in range(0, len(starts), chunk):
+        chunk_starts = starts[chunk_start:chunk_start + chunk]
+        chunk_counts = counts[chunk_start:chunk_start + chunk]
+        mastery = np.repeat(init_prior, len(chunk_starts), axis=1)
+        for t in range(int(chunk_counts[0])):
+            # Groups are longest first, so the ones with a response at t are a prefix
+            active = np.searchsorted(-chunk_counts, -t, side="left")
+            observed = correct[chunk_starts[:active] + t].astype(np.float32)
+            known = mastery[:, :active]
+
+            # P(observation | known) and P(observation | not known), without branching on
+            # correctness; keeping P(observation) a convex mix keeps the posterior in [0, 1]
+            p_given_known = slip + observed * (1 - 2 * slip)
+            p_given_unknown = (1 - guess) + observed * (2 * guess - 1)
+            p_known_and_observed = known * p_given_known
+            p_observed = np.maximum(p_known_and_observed + (1 - known) * p_given_unknown, 1e-12)
+            log_likelihood += np.log(p_observed).sum(axis=1, dtype=np.float64)
+
+            posterior = p_known_and_observed / p_observed
+            mastery[:, :active] = posterior + (1 - posterior) * learn
+    return log_likelihood
+
+def fit_concept(task) -> Dict:
+    """Grid search with refinement for one concept (runs in a worker process)"""
+    concept_id, group_starts, correct = task
+    lower, upper = PARAMETER_BOUNDS[:, 0].copy(), PARAMETER_BOUNDS[:, 1].copy()
+    best, best_log_likelihood = None, -np.inf
+
+    for _ in range(BKT_FIT_REFINE_ROUNDS + 1):
+        candidates = candidate_grid(lower, upper, BKT_FIT_GRID_POINTS)
+        log_likelihood = grid_log_likelihood(group_starts, correct, candidates)
+        index = int(np.argmax(log_likelihood))
+        if log_likelihood[index] > best_log_likelihood:
+            best, best_log_likelihood = candidates[index], float(log_likelihood[index])
+        # Zoom in to one grid step around the best candidate
+        step = (upper - lower) / (BKT_FIT_GRID_POINTS - 1)
+        lower = np.maximum(PARAMETER_BOUNDS[:, 0], best - step)
+        upper = np.minimum(PARAMETER_BOUNDS[:, 1], best + step)
+
+    return {
+        "concept_id": concept_id,
+        "init_prior": float(best[0]),
+        "learn_rate": float(best[1]),
+        "guess_rate": float(best[2]),
+        "slip_rate": float(best[3]),
+        "log_likelihood": best_log_likelihood,
+        "student_count": len(group_starts),
+        "response_count": len(correct),
+    }
+
+def concept_tasks(db: Session, concept_ids: Optional[List[int]] = None,
+                  min_responses: int = BKT_FIT_MIN_RESPONSES) -> List[tuple]:
+    """Split the graded history into one (concept_id, group_starts, correct) task per concept"""
+    keys, group_starts, correct = load_response_histories(db, concept_ids=concept_ids)
+    if not keys:
+        return []
+    counts = np.diff(np.append(group_starts, len(correct)))
+    group_concepts = np.array([concept_id for _, concept_id in keys])
+
+    tasks = []
+    for concept_id in np.unique(group_concepts):
+        groups = np.flatnonzero(group_concepts == concept_id)
+        concept_counts = counts[groups]
+        if concept_counts.sum() < min_responses:
+            continue
+        # Gather the concept's histories back to back
+        new_starts = np.concatenate(([0], np.cumsum(concept_counts)[:-1]))
+        positions = np.arange(concept_counts.sum()) + np.repeat(group_starts[groups] - new_starts, concept_counts)
+        tasks.append((int(concept_id), new_starts, correct[positions]))
+    # Largest concepts first keeps the pool busy until the end
+    tasks.sort(key=lambda task: len(task[2]), reverse=True)
+    return tasks
+
+def fit_bkt_parameters(db: Session, concept_ids: Optional[List[int]] = None,
+                       workers: int = BKT_FIT_WORKERS,
+                       min_responses: int = BKT_FIT_MIN_RESPONSES) -> List[Dict]:
+    """
+    Fit BKT parameters for every concept with at least min_responses graded
+    responses and store them in bkt_parameters. The caller commits.
+    """
+    tasks = concept_tasks(db, concept_ids, min_responses)
+    if not tasks:
+        return []
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            results = list(pool.map(fit_concept, tasks))
+    else:
+        results = [fit_concept(task) for task in tasks]
+
+    fitted_at = datetime.utcnow()
+    for result in results:
+        db.merge(models.BKTParameters(**result, fitted_at=fitted_at))
+    db.flush()
+    concept_tracers.invalidate()
+    return results
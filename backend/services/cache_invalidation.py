@@ -0,0 +1,77 @@
+"""
+Keeping in-process caches in step with committed changes.
+
+PendingChanges collects a cache's changes in session.info as each flush (or an
+explicit defer) reports them, applies them once the transaction commits and
+drops them if it rolls back, so a concurrent request cannot re-cache the rows
+from before a commit. StampFile lets other processes notice: applying changes
+touches the file, and each process compares its mtime with the one it last saw.
+
+Stamp files are kept in CACHE_STAMP_DIR. Every process sharing a database must
+use the same directory.
+"""
+import os
+from typing import Any, Callable, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+load_dotenv()
+
+CACHE_STAMP_DIR = os.getenv("CACHE_STAMP_DIR", ".")
+
+class StampFile:
+    def __init__(self, name: str, directory: Optional[str] = None):
+        self.path = os.path.join(directory or CACHE_STAMP_DIR, name)
+
+    def read(self) -> Optional[int]:
+        """mtime of the stamp in nanoseconds, or None before it was first touched"""
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def touch(self) -> Optional[int]:
+        """Signal other processes, returning the new stamp"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a"):
+            pass
+        os.utime(self.path, None)
+        return self.read()
+
+class PendingChanges:
+    """
+    One cache's changes for each session, held until its transaction ends.
+    collect(session) returns the changes in a flush (or None); merge(pending, changes)
+    folds new changes into the pending ones; apply(pending) runs after the commit.
+    """
+    def __init__(self, key: str, apply: Callable[[Any], None], merge: Callable[[Any, Any], Any],
+                 collect: Optional[Callable[[Session], Any]] = None):
+        self.key = key
+        self.apply = apply
+        self.merge = merge
+        self.collect = collect
+        if collect is not None:
+            event.listen(Session, "after_flush", self._after_flush)
+        event.listen(Session, "after_commit", self._after_commit)
+        event.listen(Session, "after_rollback", self._after_rollback)
+
+    def defer(self, session: Session, changes: Any):
+        """Apply changes once session's transaction commits"""
+        if self.key in session.info:
+            session.info[self.key] = self.merge(session.info[self.key], changes)
+        else:
+            session.info[self.key] = changes
+
+    def _after_flush(self, session, flush_context):
+        changes = self.collect(session)
+        if changes is not None:
+            self.defer(session, changes)
+
+    def _after_commit(self, session):
+        if self.key in session.info:
+            self.apply(session.info.pop(self.key))
+
+    def _after_rollback(self, session):
+        session.info.pop(self.key, None)
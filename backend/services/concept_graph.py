@@ -0,0 +1,182 @@
+"""
+In-memory concept prerequisite graph.
+
+The concepts and their prerequisite edges are loaded into an immutable
+ConceptGraph snapshot: concepts in topological order (prerequisites first, ties
+by id) and, for every concept, the transitive closure of its prerequisites as a
+bitset (a Python int with one bit per concept in topological position). Checking
+whether a student has every prerequisite of a concept is then a single AND
+against the bitset of concepts they have mastered.
+
+The snapshot is built at startup and rebuilt after concepts or prerequisites
+change. Changes committed in this process mark the graph stale directly; a stamp
+file tells other processes to rebuild theirs.
+"""
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import database
+import models
+from services.cache_invalidation import PendingChanges, StampFile
+
+logger = logging.getLogger("amep.concept_graph")
+
+@dataclass(frozen=True)
+class ConceptNode:
+    id: int
+    name: str
+    description: str
+    prerequisite_ids: Tuple[int, ...]
+    decay_rate: Optional[float] = None
+
+class ConceptGraph:
+    """Immutable snapshot of the concept catalog and its prerequisite DAG"""
+
+    def __init__(self, concepts: Iterable[Tuple[int, str, str, Optional[float]]], edges: Iterable[Tuple[int, int]]):
+        prerequisites: Dict[int, List[int]] = {}
+        dependents: Dict[int, List[int]] = {}
+        rows = sorted(concepts)
+        for concept_id, _, _, _ in rows:
+            prerequisites[concept_id] = []
+            dependents[concept_id] = []
+        for concept_id, prerequisite_id in edges:
+            if concept_id in prerequisites and prerequisite_id in prerequisites and concept_id != prerequisite_id:
+                prerequisites[concept_id].append(prerequisite_id)
+                dependents[prerequisite_id].append(concept_id)
+
+        self.nodes: Dict[int, ConceptNode] = {
+            concept_id: ConceptNode(concept_id, name, description, tuple(sorted(prerequisites[concept_id])), decay_rate)
+            for concept_id, name, description, decay_rate in rows
+        }
+
+        # Kahn's algorithm; ids are visited in ascending order, so with no edges the
+        # order is simply by id
+        remaining = {concept_id: len(prereqs) for concept_id, prereqs in prerequisites.items()}
+        ready = deque(concept_id for concept_id, count in remaining.items() if count == 0)
+        order = []
+        while ready:
+            concept_id = ready.popleft()
+            order.append(concept_id)
+            for dependent in sorted(dependents[concept_id]):
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        if len(order) < len(rows):
+            # Cycles are rejected when edges are added; if one slipped in, keep the
+            # concepts on it reachable instead of failing
+            cyclic = sorted(concept_id for concept_id, count in remaining.items() if count > 0)
+            logger.warning("Concept prerequisite cycle among concepts %s", cyclic)
+            order.extend(cyclic)
+
+        self.order: Tuple[int, ...] = tuple(order)
+        self.position: Dict[int, int] = {concept_id: i for i, concept_id in enumerate(order)}
+
+        # Transitive closure in topological order: a concept's prerequisites have
+        # their closure computed before it
+        self.ancestors: Dict[int, int] = {}
+        for concept_id in order:
+            mask = 0
+            for prerequisite_id in prerequisites[concept_id]:
+                mask |= self.ancestors.get(prerequisite_id, 0) | (1 << self.position[prerequisite_id])
+            self.ancestors[concept_id] = mask
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def mask(self, concept_ids: Iterable[int]) -> int:
+        """Bitset of the given concepts (unknown ids are ignored)"""
+        mask = 0
+        for concept_id in concept_ids:
+            position = self.position.get(concept_id)
+            if position is not None:
+                mask |= 1 << position
+        return mask
+
+    def ids(self, mask: int) -> List[int]:
+        """Concept ids in a bitset, in topological order"""
+        result = []
+        while mask:
+            low = mask & -mask
+            result.append(self.order[low.bit_length() - 1])
+            mask ^= low
+        return result
+
+    def prerequisites_met(self, concept_id: int, mastered_mask: int) -> bool:
+        return self.ancestors.get(concept_id, 0) & ~mastered_mask == 0
+
+    def missing_prerequisites(self, concept_id: int, mastered_mask: int) -> List[int]:
+        return self.ids(self.ancestors.get(concept_id, 0) & ~mastered_mask)
+
+    def would_create_cycle(self, concept_id: int, prerequisite_id: int) -> bool:
+        """True if making prerequisite_id a prerequisite of concept_id closes a cycle"""
+        if concept_id == prerequisite_id:
+            return True
+        position = self.position.get(concept_id)
+        return position is not None and bool(self.ancestors.get(prerequisite_id, 0) >> position & 1)
+
+def build_concept_graph(db: Session) -> ConceptGraph:
+    concepts = db.query(
+        models.Concepts.id, models.Concepts.name, models.Concepts.description, models.Concepts.decay_rate
+    ).all()
+    edges = db.query(models.ConceptPrerequisites.concept_id, models.ConceptPrerequisites.prerequisite_id).all()
+    return ConceptGraph(concepts, edges)
+
+class ConceptGraphStore:
+    def __init__(self, stamp_dir: Optional[str] = None):
+        self.stamp = StampFile(".concept_graph_stamp", stamp_dir)
+        self._graph: Optional[ConceptGraph] = None
+        self._stamp = self.stamp.read()
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> ConceptGraph:
+        """The current snapshot, rebuilt first if concepts changed since it was built"""
+        with self._lock:
+            stamp = self.stamp.read()
+            if self._graph is None or stamp != self._stamp:
+                self._graph = build_concept_graph(db)
+                self._stamp = stamp
+            return self._graph
+
+    def refresh(self, db: Session) -> ConceptGraph:
+        self.invalidate()
+        return self.get(db)
+
+    def invalidate(self):
+        with self._lock:
+            self._graph = None
+
+    def touch_stamp(self):
+        """Signal other processes to rebuild their graphs"""
+        self.stamp.touch()
+
+concept_graph = ConceptGraphStore()
+
+def mark_concepts_changed():
+    """Rebuild the concept graph here and in every other process on next use"""
+    concept_graph.invalidate()
+    concept_graph.touch_stamp()
+
+def load_concept_graph():
+    db = database.SessionLocal()
+    try:
+        graph = concept_graph.refresh(db)
+        logger.info("Loaded concept graph with %d concepts", len(graph))
+    finally:
+        db.close()
+
+def _collect_changed_concepts(session):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (models.Concepts, models.ConceptPrerequisites)):
+            return True
+    return None
+
+# Only once committed, so a rebuild cannot pick up the old catalog under the new stamp
+concepts_changed = PendingChanges(
+    "concepts_changed", apply=lambda changed: mark_concepts_changed(),
+    merge=lambda pending, changed: True, collect=_collect_changed_concepts
+)
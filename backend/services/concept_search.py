@@ -0,0 +1,126 @@
+"""
+TF-IDF inverted index over concept names and descriptions.
+
+Concepts are tokenized into words plus character trigrams of each word (so
+"algebraic" still matches "algebra"), with name terms counted twice as much as
+description terms. Each concept is an L2-normalized TF-IDF vector, stored as
+posting lists (term -> [(concept_id, weight)], heaviest first). A query only
+walks the posting lists of its own terms, each cut to the heaviest
+CONCEPT_SEARCH_MAX_POSTINGS entries, so its cost does not grow with the size of
+the catalog.
+
+The index is rebuilt from the concept graph snapshot, so it is refreshed
+whenever concepts change.
+"""
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from services.concept_graph import ConceptGraph, concept_graph
+
+load_dotenv()
+
+CONCEPT_SEARCH_MAX_POSTINGS = int(os.getenv("CONCEPT_SEARCH_MAX_POSTINGS", "500"))
+
+NAME_WEIGHT = 2
+TRIGRAM_WEIGHT = 0.5
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in into is it of on or that the their this to with".split()
+)
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> Counter:
+    """Term counts for a piece of text: words, plus trigrams of each word"""
+    terms = Counter()
+    for word in _WORD.findall((text or "").lower()):
+        if word in STOPWORDS:
+            continue
+        terms["w:" + word] += 1
+        padded = f"#{word}#"
+        for i in range(len(padded) - 2):
+            terms["t:" + padded[i:i + 3]] += 1
+    return terms
+
+class ConceptTextIndex:
+    def __init__(self, graph: ConceptGraph, max_postings: int = CONCEPT_SEARCH_MAX_POSTINGS):
+        self.graph = graph
+        documents: Dict[int, Counter] = {}
+        for concept_id, node in graph.nodes.items():
+            terms = tokenize(node.description)
+            for term, count in tokenize(node.name).items():
+                terms[term] += NAME_WEIGHT * count
+            documents[concept_id] = terms
+
+        document_frequency = Counter(term for terms in documents.values() for term in terms)
+        total = len(documents)
+        self.idf: Dict[str, float] = {
+            term: math.log((1 + total) / (1 + frequency)) + 1 for term, frequency in document_frequency.items()
+        }
+
+        self.vectors: Dict[int, Dict[str, float]] = {}
+        postings: Dict[str, List[Tuple[int, float]]] = {}
+        for concept_id, terms in documents.items():
+            vector = self._weigh(terms)
+            self.vectors[concept_id] = vector
+            for term, weight in vector.items():
+                postings.setdefault(term, []).append((concept_id, weight))
+        for entries in postings.values():
+            entries.sort(key=lambda entry: (-entry[1], entry[0]))
+            del entries[max_postings:]
+        self.postings = postings
+
+    def _weigh(self, terms: Counter) -> Dict[str, float]:
+        """Normalized TF-IDF vector; terms unknown to the index are dropped"""
+        vector = {
+            term: (1 + math.log(count)) * self.idf[term] * (TRIGRAM_WEIGHT if term.startswith("t:") else 1)
+            for term, count in terms.items() if term in self.idf
+        }
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+    def _top(self, vector: Dict[str, float], limit: int, exclude=()) -> List[Tuple[int, float]]:
+        scores: Dict[int, float] = {}
+        for term, query_weight in vector.items():
+            for concept_id, weight in self.postings.get(term, ()):
+                scores[concept_id] = scores.get(concept_id, 0.0) + query_weight * weight
+        ranked = sorted(
+            ((concept_id, score) for concept_id, score in scores.items() if concept_id not in exclude),
+            key=lambda item: (-item[1], item[0])
+        )
+        return ranked[:limit]
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[int, float]]:
+        """(concept_id, cosine score) of the best matches for free text"""
+        return self._top(self._weigh(tokenize(query)), limit)
+
+    def related(self, concept_id: int, limit: int = 5, min_score: float = 0.0,
+                exclude=()) -> List[Tuple[int, float]]:
+        """Concepts whose text is most similar to the given concept's"""
+        vector = self.vectors.get(concept_id)
+        if not vector:
+            return []
+        results = self._top(vector, limit + 1, exclude)
+        return [(other_id, score) for other_id, score in results if other_id != concept_id and score >= min_score][:limit]
+
+class ConceptSearchStore:
+    """The text index for the current concept graph snapshot"""
+    def __init__(self):
+        self._index: Optional[ConceptTextIndex] = None
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> ConceptTextIndex:
+        graph = concept_graph.get(db)
+        with self._lock:
+            if self._index is None or self._index.graph is not graph:
+                self._index = ConceptTextIndex(graph)
+            return self._index
+
+concept_search = ConceptSearchStore()
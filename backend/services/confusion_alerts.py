@@ -0,0 +1,197 @@
+"""
+Real-time confusion alerts for teachers.
+
+After engagement is logged, the confusion index of each affected (student, project)
+pair is passed through a threshold with hysteresis: a pair alerts when its index
+reaches CONFUSION_ALERT_THRESHOLD and is only re-armed once it drops to
+CONFUSION_ALERT_RESET_THRESHOLD. Re-armed pairs are additionally debounced, so a
+pair oscillating around the threshold alerts at most once per
+CONFUSION_ALERT_COOLDOWN_SECONDS; a pair that re-crosses within the cooldown stays
+armed and alerts once the cooldown has passed. All alerts raised by one call are
+inserted as Notification rows in a single transaction, and a pair only counts as
+alerted once its notifications are committed.
+
+Alert state is per process, like the confusion windows it is usually fed from.
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+import models
+from services.notification_service import NotificationService
+
+load_dotenv()
+
+CONFUSION_ALERTS_ENABLED = os.getenv("CONFUSION_ALERTS_ENABLED", "true").lower() == "true"
+CONFUSION_ALERT_THRESHOLD = float(os.getenv("CONFUSION_ALERT_THRESHOLD", "60"))
+CONFUSION_ALERT_RESET_THRESHOLD = float(os.getenv("CONFUSION_ALERT_RESET_THRESHOLD", "40"))
+CONFUSION_ALERT_COOLDOWN_SECONDS = int(os.getenv("CONFUSION_ALERT_COOLDOWN_SECONDS", "900"))
+
+class ConfusionAlertState:
+    def __init__(self, threshold: float = CONFUSION_ALERT_THRESHOLD,
+                 reset_threshold: float = CONFUSION_ALERT_RESET_THRESHOLD,
+                 cooldown_seconds: int = CONFUSION_ALERT_COOLDOWN_SECONDS):
+        self.threshold = threshold
+        self.reset_threshold = min(reset_threshold, threshold)
+        self.cooldown = timedelta(seconds=cooldown_seconds)
+        # (student_id, project_id) -> [armed, last alert time]; only pairs that have alerted
+        self._pairs: Dict[Tuple[int, int], list] = {}
+        # Pairs alerted by evaluate but not yet confirmed -> their state before (None: untracked)
+        self._pending: Dict[Tuple[int, int], Optional[list]] = {}
+        self._lock = threading.Lock()
+
+    def evaluate(self, indices: Dict[Tuple[int, int], float],
+                 now: Optional[datetime] = None) -> Dict[Tuple[int, int], float]:
+        """
+        Return the pairs (and their index) that should alert now. They count as
+        alerted straight away, so concurrent calls don't alert twice; call confirm
+        once the alerts are delivered, or revert if they could not be.
+        """
+        now = now or datetime.utcnow()
+        alerts = {}
+        with self._lock:
+            for pair, index in indices.items():
+                state = self._pairs.get(pair)
+                if state is None:
+                    if index >= self.threshold:
+                        self._pending[pair] = None
+                        self._pairs[pair] = [False, now]
+                        alerts[pair] = index
+                    continue
+
+                armed, last_alert = state
+                if not armed:
+                    if index <= self.reset_threshold:
+                        if now - last_alert >= self.cooldown:
+                            # Recovered and quiet for a full cooldown: forget the pair
+                            del self._pairs[pair]
+                        else:
+                            state[0] = True
+                elif index >= self.threshold:
+                    # Within the cooldown the pair stays armed and alerts once it has passed
+                    if now - last_alert >= self.cooldown:
+                        self._pending[pair] = list(state)
+                        state[0], state[1] = False, now
+                        alerts[pair] = index
+                elif now - last_alert >= self.cooldown:
+                    del self._pairs[pair]
+        return alerts
+
+    def confirm(self, pairs: List[Tuple[int, int]]):
+        """The alerts for these pairs were delivered"""
+        with self._lock:
+            for pair in pairs:
+                self._pending.pop(pair, None)
+
+    def revert(self, pairs: List[Tuple[int, int]]):
+        """The alerts for these pairs were not delivered: restore their previous state"""
+        with self._lock:
+            for pair in pairs:
+                if pair not in self._pending:
+                    continue
+                previous = self._pending.pop(pair)
+                if previous is None:
+                    self._pairs.pop(pair, None)
+                else:
+                    self._pairs[pair] = previous
+
+    def reset(self):
+        with self._lock:
+            self._pairs.clear()
+            self._pending.clear()
+
+confusion_alert_state = ConfusionAlertState()
+
+def resolve_teachers(pairs: List[Tuple[int, int]], db: Session) -> Dict[Tuple[int, int], List[int]]:
+    """
+    Teachers to alert for each (student, project) pair: the teachers of the student's
+    classes that the project is assigned to, or the project's own teacher otherwise.
+    """
+    student_ids = {student_id for student_id, _ in pairs}
+    project_ids = {project_id for _, project_id in pairs}
+
+    rows = db.query(
+        models.ClassEnrollments.student_id,
+        models.ClassProjects.project_id,
+        models.Classes.teacher_id
+    ).join(
+        models.ClassProjects, models.ClassProjects.class_id == models.ClassEnrollments.class_id
+    ).join(
+        models.Classes, models.Classes.id == models.ClassEnrollments.class_id
+    ).filter(
+        models.ClassEnrollments.student_id.in_(student_ids),
+        models.ClassProjects.project_id.in_(project_ids)
+    ).distinct().all()
+
+    teachers = {pair: [] for pair in pairs}
+    for student_id, project_id, teacher_id in rows:
+        if (student_id, project_id) in teachers and teacher_id:
+            teachers[(student_id, project_id)].append(teacher_id)
+
+    project_teachers = dict(db.query(models.Projects.id, models.Projects.teacher_id).filter(
+        models.Projects.id.in_(project_ids)
+    ).all())
+    for (student_id, project_id), teacher_ids in teachers.items():
+        if not teacher_ids and project_teachers.get(project_id):
+            teacher_ids.append(project_teachers[project_id])
+    return teachers
+
+def dispatch_confusion_alerts(indices: Dict[Tuple[int, int], float], db: Session,
+                              now: Optional[datetime] = None) -> List[models.Notification]:
+    """
+    Run freshly computed confusion indices through the alert state and notify the
+    teachers of every pair that crossed the threshold, with a single commit.
+    """
+    if not CONFUSION_ALERTS_ENABLED or not indices:
+        return []
+    alerts = confusion_alert_state.evaluate(indices, now)
+    if not alerts:
+        return []
+
+    try:
+        notifications, notified = _notify_teachers(alerts, db)
+    except Exception:
+        confusion_alert_state.revert(list(alerts))
+        raise
+    confusion_alert_state.confirm(notified)
+    # Pairs with no teacher to tell have not really alerted; try again next time
+    confusion_alert_state.revert([pair for pair in alerts if pair not in notified])
+    return notifications
+
+def _notify_teachers(alerts: Dict[Tuple[int, int], float], db: Session):
+    """Insert and commit the notifications; returns them and the pairs they cover"""
+    teachers = resolve_teachers(list(alerts), db)
+    student_names = dict(db.query(models.Users.id, models.Users.name).filter(
+        models.Users.id.in_({student_id for student_id, _ in alerts})
+    ).all())
+    project_titles = dict(db.query(models.Projects.id, models.Projects.title).filter(
+        models.Projects.id.in_({project_id for _, project_id in alerts})
+    ).all())
+
+    notifications, notified = [], []
+    for (student_id, project_id), index in alerts.items():
+        student_name = student_names.get(student_id, f"Student {student_id}")
+        project_title = project_titles.get(project_id, f"project {project_id}")
+        for teacher_id in teachers[(student_id, project_id)]:
+            notifications.append(NotificationService.create_notification(
+                db=db,
+                user_id=teacher_id,
+                title="Student May Be Confused",
+                message=f"{student_name} shows a high confusion index ({index:.0f}) on {project_title}",
+                notification_type="confusion_alert",
+                meta_data={
+                    "student_id": student_id,
+                    "project_id": project_id,
+                    "confusion_index": round(index, 2)
+                },
+                commit=False
+            ))
+        if teachers[(student_id, project_id)]:
+            notified.append((student_id, project_id))
+    if notifications:
+        db.commit()
+    return notifications, notified
@@ -0,0 +1,196 @@
+"""
+In-memory sliding windows for live confusion detection.
+
+Each (student, project) pair keeps the last CONFUSION_WINDOW_SECONDS of engagement
+values in a ring buffer together with running sums of x, x², k, k² and k·x
+(k being the event's position in the window). Mean, standard deviation and the
+regression slope therefore update in O(1) as events arrive and expire, and a
+sorted copy of the values answers the low-engagement count with a binary search.
+The database is only read once, to warm the windows at startup.
+
+Windows are per process: with several workers each one sees the events it ingested.
+"""
+import os
+import threading
+from bisect import bisect_left, insort
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+import database
+import models
+
+load_dotenv()
+
+CONFUSION_WINDOW_ENABLED = os.getenv("CONFUSION_WINDOW_ENABLED", "true").lower() == "true"
+CONFUSION_WINDOW_SECONDS = int(os.getenv("CONFUSION_WINDOW_SECONDS", "3600"))
+
+# Rebase event positions once they grow this large to keep the integer sums small
+_REBASE_AT = 1 << 20
+# Sweep idle windows after this many observations
+_SWEEP_EVERY = 10000
+
+class ConfusionWindow:
+    __slots__ = ("events", "sorted_values", "sum_x", "sum_xx", "sum_k", "sum_kk", "sum_kx", "flags", "next_k")
+
+    def __init__(self):
+        self.events = deque()  # (timestamp, k, value, confusion_flag)
+        self.sorted_values = []
+        self.sum_x = 0.0
+        self.sum_xx = 0.0
+        self.sum_k = 0
+        self.sum_kk = 0
+        self.sum_kx = 0.0
+        self.flags = 0
+        self.next_k = 0
+
+    def add(self, timestamp: datetime, value: float, confusion_flag: bool = False):
+        k = self.next_k
+        self.next_k += 1
+        self.events.append((timestamp, k, value, confusion_flag))
+        insort(self.sorted_values, value)
+        self.sum_x += value
+        self.sum_xx += value * value
+        self.sum_k += k
+        self.sum_kk += k * k
+        self.sum_kx += k * value
+        self.flags += confusion_flag
+
+    def expire(self, cutoff: datetime):
+        """Drop events older than cutoff"""
+        events = self.events
+        while events and events[0][0] < cutoff:
+            _, k, value, confusion_flag = events.popleft()
+            del self.sorted_values[bisect_left(self.sorted_values, value)]
+            self.sum_x -= value
+            self.sum_xx -= value * value
+            self.sum_k -= k
+            self.sum_kk -= k * k
+            self.sum_kx -= k * value
+            self.flags -= confusion_flag
+        if not events:
+            self.__init__()
+        elif events[0][1] >= _REBASE_AT:
+            self._rebase(events[0][1])
+
+    def _rebase(self, base: int):
+        # Slope is invariant to shifting k, so renumber from the oldest event
+        n = len(self.events)
+        self.sum_kk -= 2 * base * self.sum_k - n * base * base
+        self.sum_k -= n * base
+        self.sum_kx -= base * self.sum_x
+        self.next_k -= base
+        self.events = deque((t, k - base, v, f) for t, k, v, f in self.events)
+
+    def confusion_index(self) -> float:
+        """Same indicators as engagement_tracking.calculate_confusion_index"""
+        n = len(self.events)
+        if n == 0:
+            return 0.0
+        
+        mean_value = self.sum_x / n
+        variance = self.sum_xx / n - mean_value * mean_value
+        # Cancellation leaves tiny positive variances for constant values
+        if n <= 1 or variance <= 1e-12 * max(1.0, mean_value * mean_value):
+            std_value = 0.0
+        else:
+            std_value = variance ** 0.5
+        
+        confusion_score = 0.0
+        
+        # Indicator 1: Low engagement
+        low_threshold = mean_value - 0.5 * std_value if std_value > 0 else mean_value * 0.7
+        low_engagement_count = bisect_left(self.sorted_values, low_threshold)
+        confusion_score += low_engagement_count / n * 30
+        
+        # Indicator 2: High variability
+        if std_value > 0 and mean_value > 0:
+            cv = std_value / mean_value
+            if cv > 0.5:
+                confusion_score += min(30, cv * 20)
+        
+        # Indicator 3: Decreasing trend (least-squares slope over position)
+        if n > 2:
+            sxx = n * self.sum_kk - self.sum_k * self.sum_k
+            if sxx > 0:
+                slope = (n * self.sum_kx - self.sum_k * self.sum_x) / sxx
+                if slope < 0:
+                    confusion_score += min(20, abs(slope) * 10)
+        
+        # Metadata-based confusion indicators
+        if self.flags > 0:
+            confusion_score += min(20, self.flags * 5)
+        
+        return min(100.0, confusion_score)
+
+class ConfusionWindowStore:
+    def __init__(self, window_seconds: int = CONFUSION_WINDOW_SECONDS):
+        self.window = timedelta(seconds=window_seconds)
+        self.ready = False
+        self._windows: Dict[Tuple[int, int], ConfusionWindow] = {}
+        self._lock = threading.Lock()
+        self._observations = 0
+
+    def observe(self, student_id: int, project_id: int, value: Optional[float], timestamp: datetime,
+                confusion_flag: bool = False):
+        with self._lock:
+            window = self._windows.get((student_id, project_id))
+            if window is None:
+                window = self._windows[(student_id, project_id)] = ConfusionWindow()
+            window.add(timestamp, value or 0.0, confusion_flag)
+            self._observations += 1
+            if self._observations % _SWEEP_EVERY == 0:
+                self._sweep(datetime.utcnow() - self.window)
+
+    def confusion_index(self, student_id: int, project_id: int, now: Optional[datetime] = None) -> float:
+        with self._lock:
+            window = self._windows.get((student_id, project_id))
+            if window is None:
+                return 0.0
+            window.expire((now or datetime.utcnow()) - self.window)
+            if not window.events:
+                del self._windows[(student_id, project_id)]
+                return 0.0
+            return window.confusion_index()
+
+    def sweep(self, now: Optional[datetime] = None):
+        """Expire old events everywhere and drop empty windows"""
+        with self._lock:
+            self._sweep((now or datetime.utcnow()) - self.window)
+
+    def _sweep(self, cutoff: datetime):
+        for key in list(self._windows):
+            window = self._windows[key]
+            window.expire(cutoff)
+            if not window.events:
+                del self._windows[key]
+
+    def warm(self, db):
+        """Load the last window of engagement logs from the database"""
+        rows = db.query(
+            models.EngagementLogs.student_id,
+            models.EngagementLogs.project_id,
+            models.EngagementLogs.value,
+            models.EngagementLogs.timestamp,
+            models.EngagementLogs.confusion_flag
+        ).filter(
+            models.EngagementLogs.project_id.isnot(None),
+            models.EngagementLogs.timestamp >= datetime.utcnow() - self.window
+        ).order_by(models.EngagementLogs.timestamp, models.EngagementLogs.id)
+        
+        with self._lock:
+            self._windows.clear()
+        for student_id, project_id, value, timestamp, confusion_flag in rows.yield_per(1000):
+            self.observe(student_id, project_id, value, timestamp, confusion_flag)
+        self.ready = True
+
+confusion_windows = ConfusionWindowStore()
+
+def warm_confusion_windows():
+    db = database.SessionLocal()
+    try:
+        confusion_windows.warm(db)
+    finally:
+        db.close()
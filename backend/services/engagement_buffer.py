@@ -0,0 +1,142 @@
+"""
+In-process write-behind buffer for engagement events.
+
+POST /student/engagement appends events here and returns immediately. A background
+task flushes them to EngagementLogs through log_engagement_batch every
+ENGAGEMENT_FLUSH_INTERVAL_MS milliseconds, or sooner once ENGAGEMENT_FLUSH_BATCH_SIZE
+events are waiting. The buffer holds at most ENGAGEMENT_BUFFER_MAX_EVENTS events;
+submissions beyond that are rejected so callers can back off. Pending events are
+flushed when the application shuts down.
+
+A batch whose insert fails is retried on the next flush, ahead of newer events, up
+to ENGAGEMENT_FLUSH_MAX_ATTEMPTS times; after that it is dropped and logged with
+its events so one bad batch cannot block the buffer. Failures in the analytics
+that run after the insert commits are not retried, since the events are stored.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+import database
+import schemas
+from services import engagement_tracking
+
+load_dotenv()
+
+ENGAGEMENT_WRITE_BEHIND = os.getenv("ENGAGEMENT_WRITE_BEHIND", "true").lower() == "true"
+ENGAGEMENT_BUFFER_MAX_EVENTS = int(os.getenv("ENGAGEMENT_BUFFER_MAX_EVENTS", "10000"))
+ENGAGEMENT_FLUSH_INTERVAL_MS = int(os.getenv("ENGAGEMENT_FLUSH_INTERVAL_MS", "500"))
+ENGAGEMENT_FLUSH_BATCH_SIZE = int(os.getenv("ENGAGEMENT_FLUSH_BATCH_SIZE", "500"))
+ENGAGEMENT_FLUSH_MAX_ATTEMPTS = int(os.getenv("ENGAGEMENT_FLUSH_MAX_ATTEMPTS", "5"))
+
+logger = logging.getLogger("amep.engagement_buffer")
+
+class EngagementBufferFull(Exception):
+    pass
+
+class EngagementWriteBuffer:
+    def __init__(self, max_events: int = ENGAGEMENT_BUFFER_MAX_EVENTS,
+                 flush_interval_ms: int = ENGAGEMENT_FLUSH_INTERVAL_MS,
+                 flush_batch_size: int = ENGAGEMENT_FLUSH_BATCH_SIZE,
+                 max_attempts: int = ENGAGEMENT_FLUSH_MAX_ATTEMPTS):
+        self.max_events = max_events
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_batch_size = flush_batch_size
+        self.max_attempts = max_attempts
+        self._events = deque()  # (EngagementLogCreate, acknowledged_at)
+        self._failed_batch: Optional[List[Tuple[schemas.EngagementLogCreate, datetime]]] = None
+        self._failed_attempts = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def __len__(self):
+        return len(self._events) + len(self._failed_batch or ())
+
+    def submit(self, event: schemas.EngagementLogCreate):
+        """Queue an event; raises EngagementBufferFull when the buffer is at capacity"""
+        if len(self) >= self.max_events:
+            raise EngagementBufferFull()
+        # Timestamp at acknowledgement, not at flush
+        self._events.append((event, datetime.utcnow()))
+        if len(self._events) >= self.flush_batch_size:
+            self._wakeup.set()
+
+    async def start(self):
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and flush everything still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flush_lock is not None:
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write buffered events to the database in batches"""
+        async with self._flush_lock:
+            while self._failed_batch or self._events:
+                if self._failed_batch:
+                    # Retry the same batch, so a partial retry never mixes in newer events
+                    batch, self._failed_batch = self._failed_batch, None
+                else:
+                    batch = [self._events.popleft() for _ in range(min(self.flush_batch_size, len(self._events)))]
+                try:
+                    await run_in_threadpool(self._write, batch)
+                except Exception:
+                    self._failed_attempts += 1
+                    if self._failed_attempts >= self.max_attempts:
+                        logger.exception(
+                            "Dropping %d engagement events after %d failed attempts: %s",
+                            len(batch), self._failed_attempts,
+                            json.dumps([event.dict() for event, _ in batch], default=str)
+                        )
+                        self._failed_attempts = 0
+                        continue
+                    logger.exception("Failed to flush %d engagement events; will retry", len(batch))
+                    self._failed_batch = batch
+                    return
+                self._failed_attempts = 0
+
+    def _write(self, batch: List[Tuple[schemas.EngagementLogCreate, datetime]]):
+        db = database.SessionLocal()
+        try:
+            engagement_tracking.log_engagement_batch(
+                [event for event, _ in batch], db, timestamps=[timestamp for _, timestamp in batch]
+            )
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+engagement_buffer = EngagementWriteBuffer()
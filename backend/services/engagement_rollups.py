@@ -0,0 +1,245 @@
+"""
+Hourly and daily engagement rollups.
+
+compact_engagement_logs folds raw EngagementLogs rows into per-student/per-project
+hourly and daily buckets (count, sum, min, max, confusion-flag count), tracking
+progress with a watermark on EngagementLogs.id. It also carries each student's
+recent-engagement moving average forward over the compacted logs
+(EngagementRollupTrend), which buckets cannot reproduce because it depends on
+event order. purge_engagement_logs then deletes
+compacted raw rows older than the retention period in chunks, so the raw table
+only holds recent events. Analytics over longer periods read the rollups.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+import models
+from services.engagement_tracking import ENGAGEMENT_TREND_ALPHA, ewma_step
+
+load_dotenv()
+
+# Raw logs older than this are deleted once compacted
+ENGAGEMENT_RAW_RETENTION_DAYS = int(os.getenv("ENGAGEMENT_RAW_RETENTION_DAYS", "30"))
+# Hourly rollups older than this are deleted; 0 keeps them (aggregate rebuilds need them)
+ENGAGEMENT_HOURLY_RETENTION_DAYS = int(os.getenv("ENGAGEMENT_HOURLY_RETENTION_DAYS", "0"))
+ENGAGEMENT_COMPACTION_CHUNK_SIZE = int(os.getenv("ENGAGEMENT_COMPACTION_CHUNK_SIZE", "5000"))
+# Only compact logs at least this old, so transactions still in flight aren't skipped
+ENGAGEMENT_COMPACTION_LAG_SECONDS = int(os.getenv("ENGAGEMENT_COMPACTION_LAG_SECONDS", "300"))
+
+ROLLUP_STATE_ID = 1
+
+def hour_bucket(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def day_bucket(timestamp: datetime) -> datetime:
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def get_rollup_watermark(db: Session) -> int:
+    """Highest EngagementLogs.id already folded into the rollups"""
+    state = db.get(models.EngagementRollupState, ROLLUP_STATE_ID)
+    return state.last_log_id if state else 0
+
+def _fold(buckets: Dict, key: Tuple, value: float, confusion_flag: bool):
+    bucket = buckets.get(key)
+    if bucket is None:
+        buckets[key] = [1, value, value, value, int(confusion_flag)]
+    else:
+        bucket[0] += 1
+        bucket[1] += value
+        bucket[2] = min(bucket[2], value)
+        bucket[3] = max(bucket[3], value)
+        bucket[4] += confusion_flag
+
+def _merge_buckets(db: Session, model, buckets: Dict):
+    """Add folded (count, sum, min, max, flags) buckets into a rollup table"""
+    if not buckets:
+        return
+    existing = db.query(model).filter(
+        model.student_id.in_({key[0] for key in buckets}),
+        model.bucket_start.in_({key[2] for key in buckets})
+    ).all()
+    rows = {(row.student_id, row.project_id, row.bucket_start): row for row in existing}
+
+    for key, (count, value_sum, value_min, value_max, flags) in buckets.items():
+        row = rows.get(key)
+        if row is None:
+            db.add(model(
+                student_id=key[0],
+                project_id=key[1],
+                bucket_start=key[2],
+                event_count=count,
+                value_sum=value_sum,
+                value_min=value_min,
+                value_max=value_max,
+                confusion_flag_count=flags
+            ))
+        else:
+            row.event_count += count
+            row.value_sum += value_sum
+            row.value_min = min(row.value_min, value_min)
+            row.value_max = max(row.value_max, value_max)
+            row.confusion_flag_count += flags
+
+def _fold_trends(db: Session, rows):
+    """Advance the students' moving averages over compacted rows, in id order"""
+    trends = {
+        trend.student_id: trend for trend in db.query(models.EngagementRollupTrend).filter(
+            models.EngagementRollupTrend.student_id.in_({row.student_id for row in rows})
+        ).all()
+    }
+    for row in rows:
+        trend = trends.get(row.student_id)
+        if trend is None:
+            trend = trends[row.student_id] = models.EngagementRollupTrend(student_id=row.student_id)
+            db.add(trend)
+        trend.recent_value_avg = ewma_step(trend.recent_value_avg, row.value or 0.0)
+        trend.trend_alpha = ENGAGEMENT_TREND_ALPHA
+
+def compact_engagement_logs(db: Session, chunk_size: int = ENGAGEMENT_COMPACTION_CHUNK_SIZE) -> int:
+    """
+    Fold raw engagement logs past the watermark into the hourly and daily rollups,
+    one chunk per transaction. Returns the number of logs compacted.
+    """
+    if db.get(models.EngagementRollupState, ROLLUP_STATE_ID) is None:
+        db.add(models.EngagementRollupState(id=ROLLUP_STATE_ID, last_log_id=0))
+        db.commit()
+
+    cutoff = datetime.utcnow() - timedelta(seconds=ENGAGEMENT_COMPACTION_LAG_SECONDS)
+    compacted = 0
+    while True:
+        watermark = get_rollup_watermark(db)
+        rows = db.query(
+            models.EngagementLogs.id,
+            models.EngagementLogs.student_id,
+            models.EngagementLogs.project_id,
+            models.EngagementLogs.value,
+            models.EngagementLogs.timestamp,
+            models.EngagementLogs.confusion_flag
+        ).filter(
+            models.EngagementLogs.id > watermark
+        ).order_by(models.EngagementLogs.id).limit(chunk_size).all()
+
+        # Stop at the first log that is too recent to compact safely
+        ready = []
+        for row in rows:
+            if row.timestamp >= cutoff:
+                break
+            ready.append(row)
+        if not ready:
+            db.rollback()
+            break
+
+        # Claim the chunk first: a concurrent compaction sees the watermark moved and stops
+        claimed = db.execute(
+            update(models.EngagementRollupState)
+            .where(
+                models.EngagementRollupState.id == ROLLUP_STATE_ID,
+                models.EngagementRollupState.last_log_id == watermark
+            )
+            .values(last_log_id=ready[-1].id, updated_at=datetime.utcnow())
+        ).rowcount
+        if not claimed:
+            db.rollback()
+            break
+
+        hourly, daily = {}, {}
+        for row in ready:
+            value = row.value or 0.0
+            _fold(hourly, (row.student_id, row.project_id, hour_bucket(row.timestamp)), value, row.confusion_flag)
+            _fold(daily, (row.student_id, row.project_id, day_bucket(row.timestamp)), value, row.confusion_flag)
+        _merge_buckets(db, models.EngagementRollupHourly, hourly)
+        _merge_buckets(db, models.EngagementRollupDaily, daily)
+        _fold_trends(db, ready)
+        db.commit()
+
+        compacted += len(ready)
+        if len(ready) < len(rows) or len(rows) < chunk_size:
+            break
+    return compacted
+
+def _delete_in_chunks(db: Session, model, *criteria, chunk_size: int) -> int:
+    deleted = 0
+    while True:
+        ids = [row[0] for row in db.query(model.id).filter(*criteria).limit(chunk_size).all()]
+        if not ids:
+            break
+        db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        deleted += len(ids)
+    return deleted
+
+def purge_engagement_logs(db: Session, retention_days: int = ENGAGEMENT_RAW_RETENTION_DAYS,
+                          hourly_retention_days: int = ENGAGEMENT_HOURLY_RETENTION_DAYS,
+                          chunk_size: int = ENGAGEMENT_COMPACTION_CHUNK_SIZE) -> Dict[str, int]:
+    """
+    Delete compacted raw logs older than the retention period (and old hourly
+    rollups when an hourly retention is set), chunk by chunk.
+    """
+    now = datetime.utcnow()
+    watermark = get_rollup_watermark(db)
+    result = {
+        "raw_logs": _delete_in_chunks(
+            db, models.EngagementLogs,
+            models.EngagementLogs.id <= watermark,
+            models.EngagementLogs.timestamp < now - timedelta(days=retention_days),
+            chunk_size=chunk_size
+        ),
+        "hourly_rollups": 0
+    }
+    if hourly_retention_days > 0:
+        result["hourly_rollups"] = _delete_in_chunks(
+            db, models.EngagementRollupHourly,
+            models.EngagementRollupHourly.bucket_start < now - timedelta(days=hourly_retention_days),
+            chunk_size=chunk_size
+        )
+    return result
+
+def get_engagement_summary(student_ids: List[int], db: Session, days: int = 7) -> Dict:
+    """
+    Engagement metrics over the last `days` days for a set of students, from the
+    daily rollups plus the raw logs not compacted yet.
+    """
+    if not student_ids:
+        return {"active_students": 0, "avg_daily_engagement": 0.0, "high_confusion_cases": 0}
+
+    since = day_bucket(datetime.utcnow()) - timedelta(days=days - 1)
+    rows = db.query(
+        models.EngagementRollupDaily.student_id,
+        models.EngagementRollupDaily.project_id,
+        models.EngagementRollupDaily.bucket_start,
+        models.EngagementRollupDaily.value_sum,
+        models.EngagementRollupDaily.confusion_flag_count
+    ).filter(
+        models.EngagementRollupDaily.student_id.in_(student_ids),
+        models.EngagementRollupDaily.bucket_start >= since
+    ).all()
+    # Recent events past the watermark are not in the rollups yet
+    raw = db.query(
+        models.EngagementLogs.student_id,
+        models.EngagementLogs.project_id,
+        models.EngagementLogs.timestamp,
+        models.EngagementLogs.value,
+        models.EngagementLogs.confusion_flag
+    ).filter(
+        models.EngagementLogs.id > get_rollup_watermark(db),
+        models.EngagementLogs.student_id.in_(student_ids),
+        models.EngagementLogs.timestamp >= since
+    ).all()
+
+    active_students = {row.student_id for row in rows} | {row.student_id for row in raw}
+    student_days = {(row.student_id, row.bucket_start) for row in rows}
+    student_days.update((row.student_id, day_bucket(row.timestamp)) for row in raw)
+    total_value = sum(row.value_sum for row in rows) + sum(row.value or 0.0 for row in raw)
+    confused_pairs = {(row.student_id, row.project_id) for row in rows if row.confusion_flag_count}
+    confused_pairs.update((row.student_id, row.project_id) for row in raw if row.confusion_flag)
+
+    return {
+        "active_students": len(active_students),
+        "avg_daily_engagement": round(total_value / len(student_days), 2) if student_days else 0.0,
+        "high_confusion_cases": len(confused_pairs)
+    }
@@ -1,25 +1,39 @@
+import logging
+import os
 import numpy as np
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
+from typing import Dict, Iterable, List, Optional, Tuple
 import schemas
 import models
 from datetime import datetime, timedelta
+from services.confusion_window import confusion_windows
+from services.confusion_alerts import dispatch_confusion_alerts
+
+logger = logging.getLogger("amep.engagement_tracking")
+
+# Weight of the newest value in the recent-engagement moving average used for trends
+ENGAGEMENT_TREND_ALPHA = float(os.getenv("ENGAGEMENT_TREND_ALPHA", "0.05"))
 
 def calculate_confusion_index(student_id: int, project_id: int, db: Session) -> float:
     """
     Calculate confusion index for a student working on a project using statistical analysis.
     """
     # Get recent engagement logs for this student and project
-    recent_logs = db.query(models.EngagementLogs).filter(
+    recent_logs = db.query(
+        models.EngagementLogs.value,
+        models.EngagementLogs.confusion_flag
+    ).filter(
         models.EngagementLogs.student_id == student_id,
         models.EngagementLogs.project_id == project_id,
         models.EngagementLogs.timestamp >= datetime.utcnow() - timedelta(hours=1)
-    ).all()
+    ).order_by(models.EngagementLogs.timestamp, models.EngagementLogs.id).all()
     
     if not recent_logs:
         return 0.0
     
     # Extract engagement values
-    values = [log.value for log in recent_logs]
+    values = [log.value or 0.0 for log in recent_logs]
     
     # Calculate statistical measures
     mean_value = np.mean(values)
@@ -53,31 +67,313 @@ def calculate_confusion_index(student_id: int, project_id: int, db: Session) ->
             confusion_score += min(20, abs(slope) * 10)
     
     # Metadata-based confusion indicators
-    high_confusion_indicators = 0
-    for log in recent_logs:
-        if log.metadata_json:
-            try:
-                metadata = json.loads(log.metadata_json)
-                if metadata.get("confusion_flag", False):
-                    high_confusion_indicators += 1
-            except:
-                pass
+    high_confusion_indicators = sum(1 for log in recent_logs if log.confusion_flag)
     
     if high_confusion_indicators > 0:
         confusion_score += min(20, high_confusion_indicators * 5)
     
     return min(100.0, confusion_score)
 
+def promoted_metadata_columns(metadata: Optional[dict]) -> dict:
+    """Values of the engagement metadata keys stored in their own indexed columns"""
+    metadata = metadata or {}
+    return {
+        "confusion_flag": bool(metadata.get("confusion_flag")),
+        "assignment_id": metadata.get("assignment_id"),
+        "action": metadata.get("action")
+    }
+
+def engagement_log_row(engagement: schemas.EngagementLogCreate) -> dict:
+    """Column values for an engagement event"""
+    row = engagement.dict(exclude={"metadata_json"})
+    metadata = engagement.metadata_json.dict(exclude_unset=True) if engagement.metadata_json else None
+    row.update(metadata_json=metadata, **promoted_metadata_columns(metadata))
+    return row
+
+def confusion_scores(group_starts: np.ndarray, values: np.ndarray, flags: np.ndarray) -> np.ndarray:
+    """
+    Vectorized confusion index for many (student, project) groups at once.
+    
+    values and flags hold every group's recent logs back to back, each group in
+    timestamp order; group_starts holds the offset of each group's first row.
+    Applies the same indicators as calculate_confusion_index with segment
+    reductions (np.add.reduceat) instead of per-group Python loops.
+    """
+    n = len(values)
+    counts = np.diff(np.append(group_starts, n))
+    group = np.repeat(np.arange(len(group_starts)), counts)
+    
+    # Mean and population standard deviation per group
+    mean = np.add.reduceat(values, group_starts) / counts
+    deviation = values - mean[group]
+    std = np.sqrt(np.add.reduceat(deviation * deviation, group_starts) / counts)
+    std[counts <= 1] = 0.0
+    
+    # Indicator 1: Low engagement
+    low_threshold = np.where(std > 0, mean - 0.5 * std, mean * 0.7)
+    low_engagement_ratio = np.add.reduceat((values < low_threshold[group]).astype(np.float64), group_starts) / counts
+    scores = low_engagement_ratio * 30
+    
+    # Indicator 2: High variability
+    cv = np.zeros_like(mean)
+    np.divide(std, mean, out=cv, where=(std > 0) & (mean > 0))
+    scores += np.where(cv > 0.5, np.minimum(30, cv * 20), 0.0)
+    
+    # Indicator 3: Decreasing trend (least-squares slope over position in the group)
+    position = np.arange(n) - group_starts[group]
+    centered_position = position - ((counts - 1) / 2)[group]
+    sxx = np.add.reduceat(centered_position * centered_position, group_starts)
+    sxy = np.add.reduceat(centered_position * deviation, group_starts)
+    slope = np.zeros_like(mean)
+    np.divide(sxy, sxx, out=slope, where=sxx > 0)
+    scores += np.where((counts > 2) & (slope < 0), np.minimum(20, -slope * 10), 0.0)
+    
+    # Metadata-based confusion indicators
+    flag_counts = np.add.reduceat(flags.astype(np.float64), group_starts)
+    scores += np.where(flag_counts > 0, np.minimum(20, flag_counts * 5), 0.0)
+    
+    return np.minimum(100.0, scores)
+
+def calculate_confusion_indices(pairs: Iterable[Tuple[int, int]], db: Session) -> Dict[Tuple[int, int], float]:
+    """
+    Calculate the confusion index for many (student_id, project_id) pairs with one
+    query. Results match calculate_confusion_index for each pair.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return {}
+    
+    rows = db.query(
+        models.EngagementLogs.student_id,
+        models.EngagementLogs.project_id,
+        models.EngagementLogs.value,
+        models.EngagementLogs.confusion_flag
+    ).filter(
+        models.EngagementLogs.student_id.in_({student_id for student_id, _ in pairs}),
+        models.EngagementLogs.project_id.in_({project_id for _, project_id in pairs}),
+        models.EngagementLogs.timestamp >= datetime.utcnow() - timedelta(hours=1)
+    ).order_by(
+        models.EngagementLogs.student_id,
+        models.EngagementLogs.project_id,
+        models.EngagementLogs.timestamp,
+        models.EngagementLogs.id
+    ).all()
+    # The IN filters select a cross product; keep only the requested pairs
+    rows = [row for row in rows if (row[0], row[1]) in pairs]
+    
+    results = {pair: 0.0 for pair in pairs}
+    if not rows:
+        return results
+    
+    students = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    projects = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    values = np.fromiter((row[2] or 0.0 for row in rows), dtype=np.float64, count=len(rows))
+    flags = np.fromiter((row[3] for row in rows), dtype=bool, count=len(rows))
+    
+    # Rows are sorted by (student, project): groups start where either key changes
+    key_changes = (students[1:] != students[:-1]) | (projects[1:] != projects[:-1])
+    group_starts = np.concatenate(([0], np.flatnonzero(key_changes) + 1))
+    
+    scores = confusion_scores(group_starts, values, flags)
+    for start, score in zip(group_starts, scores):
+        results[(int(students[start]), int(projects[start]))] = float(score)
+    return results
+
+def live_confusion_indices(pairs: Iterable[Tuple[int, int]], db: Session) -> Dict[Tuple[int, int], float]:
+    """
+    Confusion indices from the in-memory sliding windows, falling back to the
+    database when the windows have not been warmed (e.g. in scripts).
+    """
+    if confusion_windows.ready:
+        return {pair: confusion_windows.confusion_index(*pair) for pair in set(pairs)}
+    return calculate_confusion_indices(pairs, db)
+
+def calculate_class_confusion_indices(class_id: int, db: Session) -> List[Dict]:
+    """
+    Confusion index of every enrolled student on every project assigned to the class,
+    most confused first.
+    """
+    student_ids = [row[0] for row in db.query(models.ClassEnrollments.student_id).filter(
+        models.ClassEnrollments.class_id == class_id
+    ).all()]
+    project_ids = [row[0] for row in db.query(models.ClassProjects.project_id).filter(
+        models.ClassProjects.class_id == class_id
+    ).all()]
+    
+    indices = calculate_confusion_indices(
+        [(student_id, project_id) for student_id in student_ids for project_id in project_ids], db
+    )
+    results = [
+        {"student_id": student_id, "project_id": project_id, "confusion_index": round(index, 2)}
+        for (student_id, project_id), index in indices.items()
+    ]
+    results.sort(key=lambda x: x["confusion_index"], reverse=True)
+    return results
+
+def new_engagement_aggregate(student_id: int) -> models.EngagementAggregates:
+    return models.EngagementAggregates(
+        student_id=student_id,
+        event_count=0,
+        value_sum=0.0,
+        hour_counts=[0] * 24,
+        active_day_bitmap=b"",
+        active_days=0,
+        first_timestamp=None,
+        last_timestamp=None,
+        recent_value_avg=None
+    )
+
+def ewma_step(average: Optional[float], value: float, alpha: float = ENGAGEMENT_TREND_ALPHA) -> float:
+    """One step of the recent-engagement moving average (the first value starts it)"""
+    return value if average is None else average + alpha * (value - average)
+
+def ewma_bucket(average: Optional[float], count: int, mean: float, alpha: float = ENGAGEMENT_TREND_ALPHA) -> float:
+    """`count` moving-average steps towards a constant value, in closed form"""
+    if average is None:
+        average, count = mean, count - 1
+    return mean + (1 - alpha) ** count * (average - mean)
+
+def fold_engagement_event(aggregate: models.EngagementAggregates, value: Optional[float], timestamp: datetime):
+    """
+    Add one engagement event to a student's aggregate in O(1).
+    """
+    value = value or 0.0
+    
+    # Hour-of-day histogram (reassigned so the JSON column is marked dirty)
+    hour_counts = list(aggregate.hour_counts or [0] * 24)
+    hour_counts[timestamp.hour] += 1
+    aggregate.hour_counts = hour_counts
+    
+    # Active-day bitmap anchored at the first active day
+    bitmap = int.from_bytes(aggregate.active_day_bitmap or b"", "little")
+    if aggregate.first_timestamp is None:
+        aggregate.first_timestamp = timestamp
+    elif timestamp < aggregate.first_timestamp:
+        # Out-of-order event before the current anchor: shift existing days up
+        bitmap <<= (aggregate.first_timestamp.date() - timestamp.date()).days
+        aggregate.first_timestamp = timestamp
+    day_bit = 1 << (timestamp.date() - aggregate.first_timestamp.date()).days
+    if not bitmap & day_bit:
+        bitmap |= day_bit
+        aggregate.active_days = (aggregate.active_days or 0) + 1
+    aggregate.active_day_bitmap = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    
+    if aggregate.last_timestamp is None or timestamp > aggregate.last_timestamp:
+        aggregate.last_timestamp = timestamp
+    
+    # Running sums and the recent moving average
+    aggregate.event_count = (aggregate.event_count or 0) + 1
+    aggregate.value_sum = (aggregate.value_sum or 0.0) + value
+    aggregate.recent_value_avg = ewma_step(aggregate.recent_value_avg, value)
+
+def update_engagement_aggregate(student_id: int, events: Iterable[tuple], db: Session) -> models.EngagementAggregates:
+    """
+    Fold (value, timestamp) events into the student's aggregate. The events must
+    already be flushed to EngagementLogs: a student without an aggregate gets one
+    built from their full history instead.
+    """
+    aggregate = db.query(models.EngagementAggregates).filter(
+        models.EngagementAggregates.student_id == student_id
+    ).with_for_update().first()
+    
+    if aggregate is None:
+        return rebuild_engagement_aggregates(db, student_ids=[student_id])[0]
+    
+    for value, timestamp in events:
+        fold_engagement_event(aggregate, value, timestamp)
+    return aggregate
+
+def fold_engagement_bucket(aggregate: models.EngagementAggregates, count: int, value_sum: float, bucket_start: datetime):
+    """
+    Add an hourly rollup bucket to a student's aggregate, treating its events as
+    `count` events of the bucket's mean value. Counts, sums, hours and days are
+    exact; the moving average is only approximate, so rebuilds replace it with the
+    student's EngagementRollupTrend when there is one.
+    """
+    if not count:
+        return
+    mean = value_sum / count
+    ewma = aggregate.recent_value_avg
+    fold_engagement_event(aggregate, mean, bucket_start)
+    aggregate.event_count += count - 1
+    aggregate.value_sum += value_sum - mean
+    hour_counts = list(aggregate.hour_counts)
+    hour_counts[bucket_start.hour] += count - 1
+    aggregate.hour_counts = hour_counts
+    aggregate.recent_value_avg = ewma_bucket(ewma, count, mean)
+
+def rebuild_engagement_aggregates(db: Session, student_ids: Optional[List[int]] = None) -> List[models.EngagementAggregates]:
+    """
+    Recompute aggregates from the hourly rollups plus the raw logs not yet compacted
+    (for backfills and repairs). Rebuilds every student with engagement history
+    when student_ids is None. Raw logs are replayed in id order, the order they
+    were folded in incrementally, so a rebuild matches the incremental aggregate.
+    """
+    from services.engagement_rollups import get_rollup_watermark
+    
+    watermark = get_rollup_watermark(db)
+    aggregates = {student_id: new_engagement_aggregate(student_id) for student_id in (student_ids or [])}
+    
+    def aggregate_for(student_id):
+        if student_id not in aggregates:
+            aggregates[student_id] = new_engagement_aggregate(student_id)
+        return aggregates[student_id]
+    
+    rollups = db.query(
+        models.EngagementRollupHourly.student_id,
+        models.EngagementRollupHourly.event_count,
+        models.EngagementRollupHourly.value_sum,
+        models.EngagementRollupHourly.bucket_start
+    ).order_by(
+        models.EngagementRollupHourly.student_id,
+        models.EngagementRollupHourly.bucket_start
+    )
+    raw = db.query(
+        models.EngagementLogs.student_id,
+        models.EngagementLogs.value,
+        models.EngagementLogs.timestamp
+    ).filter(
+        models.EngagementLogs.id > watermark
+    ).order_by(
+        models.EngagementLogs.student_id,
+        models.EngagementLogs.id
+    )
+    trends = db.query(models.EngagementRollupTrend.student_id, models.EngagementRollupTrend.recent_value_avg).filter(
+        models.EngagementRollupTrend.trend_alpha == ENGAGEMENT_TREND_ALPHA
+    )
+    if student_ids is not None:
+        rollups = rollups.filter(models.EngagementRollupHourly.student_id.in_(student_ids))
+        raw = raw.filter(models.EngagementLogs.student_id.in_(student_ids))
+        trends = trends.filter(models.EngagementRollupTrend.student_id.in_(student_ids))
+    
+    for student_id, count, value_sum, bucket_start in rollups.yield_per(1000):
+        fold_engagement_bucket(aggregate_for(student_id), count, value_sum, bucket_start)
+    # The exact moving average over the compacted logs, kept by the compaction
+    for student_id, recent_value_avg in trends.all():
+        if student_id in aggregates and recent_value_avg is not None:
+            aggregates[student_id].recent_value_avg = recent_value_avg
+    for student_id, value, timestamp in raw.yield_per(1000):
+        fold_engagement_event(aggregate_for(student_id), value, timestamp)
+    
+    existing = db.query(models.EngagementAggregates)
+    if student_ids is not None:
+        existing = existing.filter(models.EngagementAggregates.student_id.in_(student_ids))
+    existing.delete(synchronize_session=False)
+    
+    rebuilt = list(aggregates.values())
+    db.add_all(rebuilt)
+    db.flush()
+    return rebuilt
+
 def detect_engagement_patterns(student_id: int, db: Session) -> dict:
     """
-    Detect patterns in student engagement over time.
+    Detect patterns in student engagement over time from the student's aggregate.
     """
-    # Get all engagement logs for this student
-    all_logs = db.query(models.EngagementLogs).filter(
-        models.EngagementLogs.student_id == student_id
-    ).order_by(models.EngagementLogs.timestamp).all()
+    aggregate = db.query(models.EngagementAggregates).filter(
+        models.EngagementAggregates.student_id == student_id
+    ).first()
     
-    if not all_logs:
+    if not aggregate or not aggregate.event_count:
         return {
             "activity_level": "inactive",
             "consistency": 0.0,
@@ -85,31 +381,20 @@ def detect_engagement_patterns(student_id: int, db: Session) -> dict:
             "engagement_trend": "stable"
         }
     
-    # Group by hour of day
-    hourly_activity = {}
-    for log in all_logs:
-        hour = log.timestamp.hour
-        if hour not in hourly_activity:
-            hourly_activity[hour] = 0
-        hourly_activity[hour] += 1
-    
     # Find peak hours (top 3)
-    sorted_hours = sorted(hourly_activity.items(), key=lambda x: x[1], reverse=True)
+    hourly_activity = [(hour, count) for hour, count in enumerate(aggregate.hour_counts) if count]
+    sorted_hours = sorted(hourly_activity, key=lambda x: x[1], reverse=True)
     peak_hours = [hour for hour, count in sorted_hours[:3]]
     
     # Calculate consistency (ratio of active days to total days)
-    if len(all_logs) > 1:
-        first_day = all_logs[0].timestamp.date()
-        last_day = all_logs[-1].timestamp.date()
-        total_days = (last_day - first_day).days + 1
-        active_days = len(set(log.timestamp.date() for log in all_logs))
-        consistency = active_days / total_days if total_days > 0 else 0
+    if aggregate.event_count > 1:
+        total_days = (aggregate.last_timestamp.date() - aggregate.first_timestamp.date()).days + 1
+        consistency = aggregate.active_days / total_days if total_days > 0 else 0
     else:
         consistency = 1.0
     
     # Determine activity level
-    total_engagement = sum(log.value for log in all_logs)
-    avg_daily_engagement = total_engagement / len(set(log.timestamp.date() for log in all_logs)) if all_logs else 0
+    avg_daily_engagement = aggregate.value_sum / aggregate.active_days if aggregate.active_days else 0
     
     if avg_daily_engagement > 50:
         activity_level = "high"
@@ -119,15 +404,15 @@ def detect_engagement_patterns(student_id: int, db: Session) -> dict:
         activity_level = "low"
     
     # Determine engagement trend
-    if len(all_logs) > 5:
-        # Compare first half to second half
-        mid_point = len(all_logs) // 2
-        first_half_avg = np.mean([log.value for log in all_logs[:mid_point]])
-        second_half_avg = np.mean([log.value for log in all_logs[mid_point:]])
+    if aggregate.event_count > 5:
+        # Compare recent engagement to the lifetime average. The lifetime average sits
+        # between the older and newer halves, so the bands are half as wide as a
+        # first-half/second-half comparison would use.
+        lifetime_avg = aggregate.value_sum / aggregate.event_count
         
-        if second_half_avg > first_half_avg * 1.2:
+        if aggregate.recent_value_avg > lifetime_avg * 1.1:
             trend = "increasing"
-        elif second_half_avg < first_half_avg * 0.8:
+        elif aggregate.recent_value_avg < lifetime_avg * 0.9:
             trend = "decreasing"
         else:
             trend = "stable"
@@ -146,15 +431,25 @@ def log_engagement(engagement: schemas.EngagementLogCreate, db: Session):
     Log student engagement with advanced analytics and confusion detection.
     """
     # Create engagement log entry
-    db_engagement = models.EngagementLogs(**engagement.dict())
+    db_engagement = models.EngagementLogs(**engagement_log_row(engagement))
     db.add(db_engagement)
+    db.flush()
+    
+    # Keep the student's engagement aggregate current in the same transaction
+    update_engagement_aggregate(engagement.student_id, [(db_engagement.value, db_engagement.timestamp)], db)
     db.commit()
     db.refresh(db_engagement)
     
     # Calculate confusion index
     confusion_index = 0.0
     if engagement.project_id:
-        confusion_index = calculate_confusion_index(engagement.student_id, engagement.project_id, db)
+        confusion_windows.observe(
+            engagement.student_id, engagement.project_id, db_engagement.value,
+            db_engagement.timestamp, db_engagement.confusion_flag
+        )
+        pair = (engagement.student_id, engagement.project_id)
+        confusion_index = live_confusion_indices([pair], db)[pair]
+        dispatch_confusion_alerts({pair: confusion_index}, db)
     
     # Detect engagement patterns
     patterns = detect_engagement_patterns(engagement.student_id, db)
@@ -165,8 +460,63 @@ def log_engagement(engagement: schemas.EngagementLogCreate, db: Session):
     print(f"Confusion Index: {confusion_index:.2f}")
     print(f"Engagement Patterns: {patterns}")
     
-    # In a real implementation, this would:
-    # 1. Trigger real-time alerts for teachers if confusion index is high
-    # 2. Adjust difficulty of content based on engagement patterns
-    # 3. Award XP based on engagement quality and duration
-    # 4. Update student profiles with engagement insights
\ No newline at end of file
+    # In a real implementation, this would also:
+    # 1. Adjust difficulty of content based on engagement patterns
+    # 2. Award XP based on engagement quality and duration
+    # 3. Update student profiles with engagement insights
+
+def log_engagement_batch(events: List[schemas.EngagementLogCreate], db: Session,
+                         timestamps: Optional[List[datetime]] = None) -> Dict:
+    """
+    Log many engagement events with one bulk insert in a single transaction, then run
+    the confusion analysis once per (student, project) and pattern detection once per student.
+    Events are stamped with the current time unless timestamps are given.
+    The events are stored once committed: a failure in the analytics afterwards is
+    logged and reported as analytics_failed rather than raised, so callers never
+    retry (and double count) events that were already written.
+    """
+    if timestamps is None:
+        timestamps = [datetime.utcnow()] * len(events)
+    rows = [{**engagement_log_row(event), "timestamp": timestamp} for event, timestamp in zip(events, timestamps)]
+    db.execute(insert(models.EngagementLogs), rows)
+    
+    # Fold the events into each student's aggregate
+    events_by_student = {}
+    for row in rows:
+        events_by_student.setdefault(row["student_id"], []).append((row["value"], row["timestamp"]))
+    for student_id, student_events in events_by_student.items():
+        update_engagement_aggregate(student_id, student_events, db)
+    db.commit()
+    
+    print(f"Logged {len(rows)} engagement events for {len(events_by_student)} student(s)")
+    
+    # Run the analytics once per affected (student, project) and student
+    try:
+        pairs = set()
+        for row in rows:
+            if row["project_id"]:
+                pairs.add((row["student_id"], row["project_id"]))
+                confusion_windows.observe(
+                    row["student_id"], row["project_id"], row["value"],
+                    row["timestamp"], row["confusion_flag"]
+                )
+        confusion_indices = live_confusion_indices(pairs, db)
+        # One transaction for every teacher alert raised by the batch
+        dispatch_confusion_alerts(confusion_indices, db)
+        patterns = {
+            student_id: detect_engagement_patterns(student_id, db) for student_id in events_by_student
+        }
+    except Exception:
+        db.rollback()
+        logger.exception("Engagement analytics failed for %d stored events", len(rows))
+        return {"logged": len(rows), "confusion_indices": {}, "patterns": {}, "analytics_failed": True}
+    
+    for (student_id, project_id), confusion_index in confusion_indices.items():
+        print(f"Confusion Index: Student {student_id}, Project {project_id}: {confusion_index:.2f}")
+    
+    return {
+        "logged": len(rows),
+        "confusion_indices": confusion_indices,
+        "patterns": patterns,
+        "analytics_failed": False
+    }
@@ -0,0 +1,80 @@
+"""
+Bulk grading of an assignment's submissions.
+
+Scores are written to student_assignments with one set-based UPDATE (a CASE
+over student ids) per GRADES_CHUNK_SIZE students, and mastery is updated for
+every newly graded student in one batch. Everything is committed once.
+
+A submission that was already graded has already been counted in its
+student's mastery. Regrading it therefore replays that student's graded
+history in the assignment's concept (recompute_mastery) instead of applying a
+second BKT step.
+"""
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from sqlalchemy import case, func, update
+from sqlalchemy.orm import Session
+
+import models
+from services.adaptive_learning import recompute_mastery, update_mastery_scores
+
+# Students per UPDATE statement (two bound parameters each, well below SQLite's limit)
+GRADES_CHUNK_SIZE = 500
+
+def grade_assignment(db: Session, assignment: models.Assignments, grades: List[Tuple[int, float]]) -> Dict:
+    """
+    Record (student_id, score) grades for an assignment and update mastery.
+    Students the assignment was never given to are skipped and reported.
+    """
+    scores = dict(grades)
+    statuses = dict(db.query(models.StudentAssignments.student_id, models.StudentAssignments.status).filter(
+        models.StudentAssignments.assignment_id == assignment.id,
+        models.StudentAssignments.student_id.in_(scores)
+    ).all())
+    missing = sorted(set(scores) - set(statuses))
+    regraded = sorted(student_id for student_id, status in statuses.items() if status == models.AssignmentStatus.GRADED)
+
+    student_ids = sorted(statuses)
+    now = datetime.utcnow()
+    for i in range(0, len(student_ids), GRADES_CHUNK_SIZE):
+        chunk = student_ids[i:i + GRADES_CHUNK_SIZE]
+        db.execute(
+            update(models.StudentAssignments).where(
+                models.StudentAssignments.assignment_id == assignment.id,
+                models.StudentAssignments.student_id.in_(chunk)
+            ).values(
+                score=case({student_id: scores[student_id] for student_id in chunk},
+                           value=models.StudentAssignments.student_id),
+                status=models.AssignmentStatus.GRADED,
+                # Graded work without a submission counts as handed in now, so
+                # mastery replays and decay have a time to go by
+                submitted_at=func.coalesce(models.StudentAssignments.submitted_at, now)
+            ).execution_options(synchronize_session=False)
+        )
+
+    mastery_updates = 0
+    if assignment.concept_id is not None and student_ids:
+        if regraded:
+            mastery_updates += len(recompute_mastery(
+                db, student_ids=regraded, cause="regrade", assignment_id=assignment.id,
+                concept_ids=[assignment.concept_id]
+            ))
+        regraded_set = set(regraded)
+        first_grades = [
+            (student_id, assignment.concept_id, scores[student_id])
+            for student_id in student_ids if student_id not in regraded_set
+        ]
+        mastery_updates += len(update_mastery_scores(
+            first_grades, db, cause="grade", assignment_id=assignment.id, commit=False
+        ))
+    # Grades and mastery changes land together
+    db.commit()
+
+    return {
+        "assignment_id": assignment.id,
+        "graded": len(student_ids),
+        "regraded": len(regraded),
+        "missing_student_ids": missing,
+        "mastery_updates": mastery_updates,
+    }
@@ -0,0 +1,44 @@
+"""
+Forgetting-curve decay of mastery, applied when mastery is read.
+
+Stored mastery scores are the scores as of their last practice. The effective
+score decays exponentially with the time since then:
+
+    effective = stored * exp(-decay_rate * days since last practice)
+
+with each concept's decay_rate (per day), or MASTERY_DECAY_RATE for concepts
+without one. Nothing is rewritten in the database; scores without a
+last-practiced time don't decay.
+"""
+import os
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Default forgetting rate per day (0.01 halves mastery in about 70 days)
+MASTERY_DECAY_RATE = float(os.getenv("MASTERY_DECAY_RATE", "0.01"))
+
+SECONDS_PER_DAY = 86400.0
+
+def resolve_decay_rate(concept_rate: Optional[float]) -> float:
+    return MASTERY_DECAY_RATE if concept_rate is None else concept_rate
+
+def effective_mastery(score: Optional[float], last_practiced_at: Optional[datetime],
+                      decay_rate: float, now: Optional[datetime] = None) -> Optional[float]:
+    """A stored mastery score decayed to now"""
+    if score is None or last_practiced_at is None or decay_rate <= 0:
+        return score
+    days = max(0.0, ((now or datetime.utcnow()) - last_practiced_at).total_seconds() / SECONDS_PER_DAY)
+    return score * float(np.exp(-decay_rate * days))
+
+def decay_factors(elapsed_days: np.ndarray, decay_rates: np.ndarray) -> np.ndarray:
+    """
+    Elementwise decay multipliers (broadcasting, e.g. students x concepts elapsed
+    days against per-concept rates); NaN elapsed days (never practiced) give 1
+    """
+    factors = np.exp(-decay_rates * np.maximum(elapsed_days, 0))
+    return np.where(np.isnan(elapsed_days), 1, factors)
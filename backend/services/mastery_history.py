@@ -0,0 +1,182 @@
+"""
+Mastery history: an append-only event log plus periodic snapshots.
+
+Every change to a StudentMastery score also appends a MasteryEvents row with the
+score before and after. Events carry absolute scores, so applying one twice is
+harmless. snapshot_mastery.py periodically stores each active student's
+current scores as a MasterySnapshots row, remembering the last event they
+include.
+
+mastery_at answers "what were this student's scores at time T" without
+replaying submissions. It starts from the latest snapshot taken at or before T
+and applies the later events up to T. If there is no such snapshot, it starts
+from the earliest later one and undoes events back to T using their before
+scores.
+"""
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+
+load_dotenv()
+
+# Students need at least this many new events before they get a new snapshot
+MASTERY_SNAPSHOT_MIN_EVENTS = int(os.getenv("MASTERY_SNAPSHOT_MIN_EVENTS", "20"))
+MASTERY_SNAPSHOT_CHUNK_SIZE = int(os.getenv("MASTERY_SNAPSHOT_CHUNK_SIZE", "500"))  # students per query
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Convert an offset-aware time to naive UTC, as event and snapshot times are stored"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def record_mastery_event(db: Session, student_id: int, concept_id: int, before: Optional[float],
+                         after: float, cause: str, assignment_id: Optional[int] = None):
+    """Append one mastery change; committed with the caller's transaction"""
+    db.add(models.MasteryEvents(
+        student_id=student_id,
+        concept_id=concept_id,
+        mastery_before=before,
+        mastery_after=after,
+        cause=cause,
+        assignment_id=assignment_id,
+        created_at=datetime.utcnow()
+    ))
+
+def record_mastery_events(db: Session, events: List[Dict]):
+    """Append many mastery changes (dicts of MasteryEvents columns) in bulk"""
+    if not events:
+        return
+    now = datetime.utcnow()
+    db.bulk_insert_mappings(models.MasteryEvents, [{"created_at": now, **event} for event in events])
+
+def _snapshot_scores(snapshot: models.MasterySnapshots) -> Dict[int, float]:
+    return {int(concept_id): score for concept_id, score in snapshot.scores.items()}
+
+def take_mastery_snapshots(db: Session, student_ids: Optional[List[int]] = None,
+                           min_events: int = MASTERY_SNAPSHOT_MIN_EVENTS,
+                           now: Optional[datetime] = None) -> int:
+    """
+    Snapshot the current scores of every student with no snapshot yet, or with
+    at least min_events events since their latest one. The caller commits.
+    """
+    now = now or datetime.utcnow()
+    latest_snapshot = db.query(
+        models.MasterySnapshots.student_id,
+        func.max(models.MasterySnapshots.last_event_id).label("last_event_id")
+    ).group_by(models.MasterySnapshots.student_id).subquery()
+
+    # New events per student since their latest snapshot
+    pending_query = db.query(
+        models.MasteryEvents.student_id,
+        func.count(models.MasteryEvents.id),
+        func.max(models.MasteryEvents.id)
+    ).outerjoin(
+        latest_snapshot, latest_snapshot.c.student_id == models.MasteryEvents.student_id
+    ).filter(
+        models.MasteryEvents.id > func.coalesce(latest_snapshot.c.last_event_id, 0)
+    ).group_by(models.MasteryEvents.student_id)
+    # Students with scores but no snapshot at all (e.g. scores from before the log)
+    unsnapshotted_query = db.query(models.StudentMastery.student_id).outerjoin(
+        latest_snapshot, latest_snapshot.c.student_id == models.StudentMastery.student_id
+    ).filter(latest_snapshot.c.student_id.is_(None)).distinct()
+    if student_ids is not None:
+        pending_query = pending_query.filter(models.MasteryEvents.student_id.in_(student_ids))
+        unsnapshotted_query = unsnapshotted_query.filter(models.StudentMastery.student_id.in_(student_ids))
+
+    pending = {student_id: (count, last_id) for student_id, count, last_id in pending_query.all()}
+    last_event_ids = {student_id: last_id for student_id, (count, last_id) in pending.items() if count >= min_events}
+    for (student_id,) in unsnapshotted_query.all():
+        last_event_ids[student_id] = pending.get(student_id, (0, 0))[1]
+
+    students = sorted(last_event_ids)
+    for i in range(0, len(students), MASTERY_SNAPSHOT_CHUNK_SIZE):
+        chunk = students[i:i + MASTERY_SNAPSHOT_CHUNK_SIZE]
+        scores = {student_id: {} for student_id in chunk}
+        # Read the scores and the last event they include in one statement, so an
+        # event committed in between cannot end up in the scores but after last_event_id
+        latest_event = db.query(
+            models.MasteryEvents.student_id.label("student_id"),
+            func.max(models.MasteryEvents.id).label("last_event_id")
+        ).filter(models.MasteryEvents.student_id.in_(chunk)).group_by(models.MasteryEvents.student_id).subquery()
+        for student_id, concept_id, score, last_event_id in db.query(
+            models.StudentMastery.student_id, models.StudentMastery.concept_id,
+            models.StudentMastery.mastery_score, latest_event.c.last_event_id
+        ).outerjoin(
+            latest_event, latest_event.c.student_id == models.StudentMastery.student_id
+        ).filter(models.StudentMastery.student_id.in_(chunk)).all():
+            scores[student_id][str(concept_id)] = score
+            if last_event_id is not None:
+                last_event_ids[student_id] = last_event_id
+        db.bulk_insert_mappings(models.MasterySnapshots, [
+            {"student_id": student_id, "taken_at": now, "last_event_id": last_event_ids[student_id],
+             "scores": scores[student_id]}
+            for student_id in chunk
+        ])
+    return len(students)
+
+def mastery_at(db: Session, student_id: int, at: datetime) -> Dict[int, float]:
+    """A student's mastery score per concept as of the given time"""
+    at = naive_utc(at)
+    base = db.query(models.MasterySnapshots).filter(
+        models.MasterySnapshots.student_id == student_id,
+        models.MasterySnapshots.taken_at <= at
+    ).order_by(models.MasterySnapshots.taken_at.desc(), models.MasterySnapshots.id.desc()).first()
+
+    if base is not None:
+        # Roll forward from the snapshot
+        scores = _snapshot_scores(base)
+        events = db.query(models.MasteryEvents.concept_id, models.MasteryEvents.mastery_after).filter(
+            models.MasteryEvents.student_id == student_id,
+            models.MasteryEvents.id > base.last_event_id,
+            models.MasteryEvents.created_at <= at
+        ).order_by(models.MasteryEvents.id).all()
+        for concept_id, after in events:
+            scores[concept_id] = after
+        return scores
+
+    later = db.query(models.MasterySnapshots).filter(
+        models.MasterySnapshots.student_id == student_id
+    ).order_by(models.MasterySnapshots.taken_at, models.MasterySnapshots.id).first()
+    if later is None:
+        # No snapshots yet: replay the whole log
+        scores = {}
+        events = db.query(models.MasteryEvents.concept_id, models.MasteryEvents.mastery_after).filter(
+            models.MasteryEvents.student_id == student_id,
+            models.MasteryEvents.created_at <= at
+        ).order_by(models.MasteryEvents.id).all()
+        for concept_id, after in events:
+            scores[concept_id] = after
+        return scores
+
+    # Roll back from the earliest snapshot, newest event first
+    scores = _snapshot_scores(later)
+    events = db.query(models.MasteryEvents.concept_id, models.MasteryEvents.mastery_before).filter(
+        models.MasteryEvents.student_id == student_id,
+        models.MasteryEvents.id <= later.last_event_id,
+        models.MasteryEvents.created_at > at
+    ).order_by(models.MasteryEvents.id.desc()).all()
+    for concept_id, before in events:
+        if before is None:
+            scores.pop(concept_id, None)
+        else:
+            scores[concept_id] = before
+    return scores
+
+def mastery_timeline(db: Session, student_id: int, concept_id: Optional[int] = None,
+                     since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[models.MasteryEvents]:
+    """A student's mastery events in order, e.g. for progress charts"""
+    since, until = naive_utc(since), naive_utc(until)
+    query = db.query(models.MasteryEvents).filter(models.MasteryEvents.student_id == student_id)
+    if concept_id is not None:
+        query = query.filter(models.MasteryEvents.concept_id == concept_id)
+    if since is not None:
+        query = query.filter(models.MasteryEvents.created_at >= since)
+    if until is not None:
+        query = query.filter(models.MasteryEvents.created_at <= until)
+    return query.order_by(models.MasteryEvents.id).all()
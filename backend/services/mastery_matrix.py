@@ -0,0 +1,241 @@
+"""
+Dense students x concepts mastery matrices per class.
+
+Each ClassMasteryMatrix holds a float32 array (NaN where a student has no
+mastery record for a concept) with id -> row/column maps, built with a single
+query over the class's enrollments, plus when each cell was last practiced.
+Class-level statistics (averages, percentiles, weakest concepts, histograms)
+are NumPy reductions over the scores decayed to the time of the request.
+
+Matrices are cached per class. update_mastery_score patches the cells of the
+student in every cached class; enrollment changes and bulk mastery recomputes
+drop the affected matrices once they are committed, and the TTL bounds how long
+changes made by other processes take to show up.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+import models
+from services.cache_invalidation import PendingChanges
+from services.concept_graph import ConceptGraph, concept_graph
+from services.mastery_decay import SECONDS_PER_DAY, decay_factors, resolve_decay_rate
+
+load_dotenv()
+
+MASTERY_MATRIX_TTL_SECONDS = float(os.getenv("MASTERY_MATRIX_TTL_SECONDS", "300"))
+MASTERY_MATRIX_MAX_CLASSES = int(os.getenv("MASTERY_MATRIX_MAX_CLASSES", "256"))
+
+EPOCH = datetime(1970, 1, 1)
+
+HISTOGRAM_BINS = np.array([0, 20, 40, 60, 80, 100], dtype=np.float32)
+WEAKEST_CONCEPTS = 3
+
+class ClassMasteryMatrix:
+    def __init__(self, class_id: int, student_ids: List[int], concept_ids: List[int], graph: ConceptGraph):
+        self.class_id = class_id
+        self.graph = graph
+        self.student_ids = np.array(student_ids, dtype=np.int64)
+        self.concept_ids = np.array(concept_ids, dtype=np.int64)
+        self.student_rows: Dict[int, int] = {student_id: i for i, student_id in enumerate(student_ids)}
+        self.concept_columns: Dict[int, int] = {concept_id: j for j, concept_id in enumerate(concept_ids)}
+        self.scores = np.full((len(student_ids), len(concept_ids)), np.nan, dtype=np.float32)
+        # Last practice as seconds since the epoch (NaN: unknown, no decay)
+        self.practiced = np.full((len(student_ids), len(concept_ids)), np.nan, dtype=np.float64)
+        self.decay_rates = np.array([self._decay_rate(concept_id) for concept_id in concept_ids], dtype=np.float64)
+        self.built_at = time.monotonic()
+
+    def _decay_rate(self, concept_id: int) -> float:
+        node = self.graph.nodes.get(concept_id)
+        return resolve_decay_rate(node.decay_rate if node else None)
+
+    def _add_concept(self, concept_id: int) -> int:
+        column = len(self.concept_ids)
+        self.concept_ids = np.append(self.concept_ids, concept_id)
+        self.concept_columns[concept_id] = column
+        self.decay_rates = np.append(self.decay_rates, self._decay_rate(concept_id))
+        self.scores = np.hstack((self.scores, np.full((len(self.student_ids), 1), np.nan, dtype=np.float32)))
+        self.practiced = np.hstack((self.practiced, np.full((len(self.student_ids), 1), np.nan)))
+        return column
+
+    def set(self, student_id: int, concept_id: int, score: float, practiced_at: Optional[datetime] = None):
+        row = self.student_rows.get(student_id)
+        if row is None:
+            return
+        column = self.concept_columns.get(concept_id)
+        if column is None:
+            column = self._add_concept(concept_id)
+        self.scores[row, column] = score
+        self.practiced[row, column] = _epoch_seconds(practiced_at)
+
+    def effective_scores(self, now: Optional[datetime] = None) -> np.ndarray:
+        """Scores decayed from their last practice to now, for the whole class at once"""
+        elapsed_days = (_epoch_seconds(now or datetime.utcnow()) - self.practiced) / SECONDS_PER_DAY
+        return (self.scores * decay_factors(elapsed_days, self.decay_rates)).astype(np.float32)
+
+    def summary(self, now: Optional[datetime] = None) -> Dict:
+        """Class statistics per concept and per student, on decayed scores"""
+        effective = self.effective_scores(now)
+        assessed = ~np.isnan(effective)
+        concept_counts = assessed.sum(axis=0)
+        student_counts = assessed.sum(axis=1)
+        totals = np.where(assessed, effective, 0).sum(axis=0, dtype=np.float64)
+        student_totals = np.where(assessed, effective, 0).sum(axis=1, dtype=np.float64)
+
+        # Only concepts at least one student has a score for
+        columns = np.flatnonzero(concept_counts)
+        scores = effective[:, columns]
+        averages = totals[columns] / concept_counts[columns]
+        percentiles = np.nanpercentile(scores, [25, 50, 75], axis=0) if len(columns) else np.empty((3, 0))
+
+        # Histogram per concept: bin every cell, then count (column, bin) pairs at once
+        bins = len(HISTOGRAM_BINS) - 1
+        cells = assessed[:, columns]
+        bin_index = np.clip(np.searchsorted(HISTOGRAM_BINS, scores[cells], side="right") - 1, 0, bins - 1)
+        column_index = np.nonzero(cells)[1]
+        histograms = np.bincount(column_index * bins + bin_index, minlength=len(columns) * bins).reshape(-1, bins)
+
+        concepts = []
+        for k, column in enumerate(columns.tolist()):
+            concept_id = int(self.concept_ids[column])
+            node = self.graph.nodes.get(concept_id)
+            concepts.append({
+                "concept_id": concept_id,
+                "concept_name": node.name if node else "Unknown",
+                "average": round(float(averages[k]), 2),
+                "p25": round(float(percentiles[0, k]), 2),
+                "median": round(float(percentiles[1, k]), 2),
+                "p75": round(float(percentiles[2, k]), 2),
+                "students_assessed": int(concept_counts[column]),
+                "histogram": histograms[k].tolist()
+            })
+
+        weakest = np.argsort(averages, kind="stable")[:WEAKEST_CONCEPTS]
+        students = [
+            {
+                "student_id": int(self.student_ids[i]),
+                "average": round(float(student_totals[i] / student_counts[i]), 2) if student_counts[i] else None,
+                "concepts_assessed": int(student_counts[i])
+            }
+            for i in range(len(self.student_ids))
+        ]
+        return {
+            "class_id": self.class_id,
+            "student_count": len(self.student_ids),
+            "average_mastery": round(float(totals.sum() / assessed.sum()), 2) if assessed.any() else None,
+            "histogram_bins": HISTOGRAM_BINS.tolist(),
+            "concepts": concepts,
+            "weakest_concepts": [concepts[k]["concept_id"] for k in weakest.tolist()],
+            "students": students
+        }
+
+def _epoch_seconds(value: Optional[datetime]) -> float:
+    # Naive UTC datetimes, as stored
+    return np.nan if value is None else (value - EPOCH).total_seconds()
+
+def build_class_mastery_matrix(class_id: int, db: Session) -> ClassMasteryMatrix:
+    graph = concept_graph.get(db)
+    # Every enrolled student, with their mastery records if any
+    rows = db.query(
+        models.ClassEnrollments.student_id,
+        models.StudentMastery.concept_id,
+        models.StudentMastery.mastery_score,
+        models.StudentMastery.last_practiced_at
+    ).outerjoin(
+        models.StudentMastery, models.StudentMastery.student_id == models.ClassEnrollments.student_id
+    ).filter(
+        models.ClassEnrollments.class_id == class_id
+    ).order_by(models.ClassEnrollments.student_id).all()
+
+    student_ids = list(dict.fromkeys(student_id for student_id, _, _, _ in rows))
+    concept_ids = list(graph.order)
+    known = set(concept_ids)
+    concept_ids.extend(sorted({concept_id for _, concept_id, _, _ in rows if concept_id is not None} - known))
+
+    matrix = ClassMasteryMatrix(class_id, student_ids, concept_ids, graph)
+    cells = [row for row in rows if row[1] is not None]
+    if cells:
+        student_index = np.fromiter((matrix.student_rows[s] for s, _, _, _ in cells), dtype=np.int64, count=len(cells))
+        concept_index = np.fromiter((matrix.concept_columns[c] for _, c, _, _ in cells), dtype=np.int64, count=len(cells))
+        matrix.scores[student_index, concept_index] = np.fromiter(
+            (np.nan if score is None else score for _, _, score, _ in cells), dtype=np.float32, count=len(cells)
+        )
+        matrix.practiced[student_index, concept_index] = np.fromiter(
+            (_epoch_seconds(at) for _, _, _, at in cells), dtype=np.float64, count=len(cells)
+        )
+    return matrix
+
+class MasteryMatrixCache:
+    def __init__(self, max_classes: int = MASTERY_MATRIX_MAX_CLASSES, ttl: float = MASTERY_MATRIX_TTL_SECONDS):
+        self.max_classes = max_classes
+        self.ttl = ttl
+        self._matrices = OrderedDict()  # class_id -> ClassMasteryMatrix
+        self._lock = threading.Lock()
+
+    def get(self, class_id: int, db: Session) -> ClassMasteryMatrix:
+        graph = concept_graph.get(db)
+        with self._lock:
+            matrix = self._matrices.get(class_id)
+            if matrix is not None and matrix.graph is graph and time.monotonic() - matrix.built_at < self.ttl:
+                self._matrices.move_to_end(class_id)
+                return matrix
+        matrix = build_class_mastery_matrix(class_id, db)
+        with self._lock:
+            self._matrices[class_id] = matrix
+            self._matrices.move_to_end(class_id)
+            while len(self._matrices) > self.max_classes:
+                self._matrices.popitem(last=False)
+        return matrix
+
+    def summary(self, class_id: int, db: Session) -> Dict:
+        matrix = self.get(class_id, db)
+        # Patches write into the array in place
+        with self._lock:
+            return matrix.summary()
+
+    def patch(self, student_id: int, concept_id: int, score: float, practiced_at: Optional[datetime] = None):
+        """Write one student's new mastery into every cached class they are in"""
+        with self._lock:
+            for matrix in self._matrices.values():
+                matrix.set(student_id, concept_id, score, practiced_at)
+
+    def invalidate(self, class_ids: Optional[List[int]] = None):
+        """Drop the given classes, or every matrix when class_ids is None"""
+        with self._lock:
+            if class_ids is None:
+                self._matrices.clear()
+                return
+            for class_id in class_ids:
+                self._matrices.pop(class_id, None)
+
+mastery_matrices = MasteryMatrixCache()
+
+def _merge_class_ids(pending: Optional[set], class_ids: Optional[set]) -> Optional[set]:
+    return None if pending is None or class_ids is None else pending | class_ids
+
+def _collect_changed_enrollments(session):
+    class_ids = {
+        obj.class_id for obj in list(session.new) + list(session.deleted)
+        if isinstance(obj, models.ClassEnrollments)
+    }
+    return class_ids or None
+
+matrix_invalidations = PendingChanges(
+    "mastery_matrix_invalidations",
+    apply=lambda class_ids: mastery_matrices.invalidate(None if class_ids is None else list(class_ids)),
+    merge=_merge_class_ids, collect=_collect_changed_enrollments
+)
+
+def invalidate_matrices_after_commit(db: Session, class_ids: Optional[List[int]] = None):
+    """
+    Drop the given classes' matrices, or every matrix when class_ids is None, once
+    db's transaction commits, so no request can cache the rows from before it
+    """
+    matrix_invalidations.defer(db, None if class_ids is None else set(class_ids))
@@ -12,10 +12,12 @@ class NotificationService:
         title: str,
         message: str,
         notification_type: str,
-        meta_data: Dict[str, Any] = None
+        meta_data: Dict[str, Any] = None,
+        commit: bool = True
     ) -> models.Notification:
         """
-        Create a new notification for a user
+        Create a new notification for a user. With commit=False the notification is
+        only added to the session, so many can be inserted in one transaction.
         """
         notification = models.Notification(
             user_id=user_id,
@@ -27,8 +29,9 @@ class NotificationService:
             created_at=datetime.utcnow()
         )
         db.add(notification)
-        db.commit()
-        db.refresh(notification)
+        if commit:
+            db.commit()
+            db.refresh(notification)
         return notification
 
     @staticmethod
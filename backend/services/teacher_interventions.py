@@ -1,7 +1,11 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict
 import schemas
 import models
+from services.engagement_rollups import get_engagement_summary
+from services.mastery_matrix import mastery_matrices
 
 def detect_struggling_students(teacher_id: int, db: Session) -> List[Dict]:
     """
@@ -17,24 +21,36 @@ def detect_struggling_students(teacher_id: int, db: Session) -> List[Dict]:
     # Return empty list for now
     return []
 
+async def get_interventions(teacher_id: int, db: AsyncSession) -> List[models.TeacherInterventions]:
+    """
+    Get the interventions a teacher has recorded.
+    """
+    result = await db.execute(select(models.TeacherInterventions).where(
+        models.TeacherInterventions.teacher_id == teacher_id
+    ))
+    return result.scalars().all()
+
 def get_class_dashboard(teacher_id: int, db: Session) -> Dict:
     """
     Get class-wide dashboard with mastery, engagement, soft skills, and leaderboard data.
     Returns empty data structures for a new teacher with no classes.
     """
-    # In a real implementation, this would:
-    # 1. Aggregate mastery data for all students
-    # 2. Compile engagement metrics
-    # 3. Summarize soft skill assessments
-    # 4. Generate leaderboard
+    # In a real implementation, this would also:
+    # 1. Summarize soft skill assessments
+    # 2. Generate leaderboard
+    
+    class_ids = [class_id for (class_id,) in db.query(models.Classes.id).filter(models.Classes.teacher_id == teacher_id)]
+    student_ids = [
+        student_id for (student_id,) in db.query(models.ClassEnrollments.student_id).join(
+            models.Classes, models.Classes.id == models.ClassEnrollments.class_id
+        ).filter(models.Classes.teacher_id == teacher_id).distinct()
+    ]
     
     dashboard = {
-        "class_mastery_summary": {},
-        "engagement_metrics": {
-            "active_students": 0,
-            "avg_daily_engagement": 0.0,
-            "high_confusion_cases": 0
-        },
+        # Per class, from the cached students x concepts mastery matrices
+        "class_mastery_summary": {class_id: mastery_matrices.summary(class_id, db) for class_id in class_ids},
+        # Last 7 days, from the daily engagement rollups plus logs not compacted yet
+        "engagement_metrics": get_engagement_summary(student_ids, db),
         "soft_skill_summary": {},
         "leaderboard": [],
         "struggling_students": []
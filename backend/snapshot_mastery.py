@@ -0,0 +1,18 @@
+from database import SessionLocal
+from services.mastery_history import take_mastery_snapshots
+
+def snapshot():
+    db = SessionLocal()
+    try:
+        taken = take_mastery_snapshots(db)
+        db.commit()
+        print(f"Took mastery snapshots for {taken} student(s).")
+    except Exception as e:
+        db.rollback()
+        print(f"Error: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    # Run periodically (e.g. nightly from cron) so point-in-time mastery queries replay few events
+    snapshot()
@@ -0,0 +1,66 @@
+"""
+Adaptive assignment selection: weakest unmastered concepts first, then concepts
+the student is ready for, never more than ADAPTIVE_ASSIGNMENT_LIMIT.
+"""
+from datetime import datetime
+
+import models
+from services import adaptive_learning
+
+def _concept(db, name, *prerequisites):
+    concept = models.Concepts(name=name, description=name)
+    db.add(concept)
+    db.flush()
+    for prerequisite in prerequisites:
+        db.add(models.ConceptPrerequisites(concept_id=concept.id, prerequisite_id=prerequisite.id))
+    return concept
+
+def _assignments(db, concept, difficulties):
+    for difficulty in difficulties:
+        db.add(models.Assignments(
+            title=f"{concept.name} {difficulty}", description="", concept_id=concept.id, difficulty_level=difficulty
+        ))
+
+def _mastery(db, student_id, concept, score):
+    db.add(models.StudentMastery(
+        student_id=student_id, concept_id=concept.id, mastery_score=score, last_practiced_at=datetime.utcnow()
+    ))
+
+def _selected(db, student_id):
+    return [
+        (assignment.title, assignment.difficulty_level)
+        for assignment in adaptive_learning.get_adaptive_assignments(student_id, db)
+    ]
+
+def test_weak_concepts_then_unpracticed_ready_concepts(db):
+    basics = _concept(db, "Basics")
+    algebra = _concept(db, "Algebra", basics)
+    calculus = _concept(db, "Calculus", algebra)
+    geometry = _concept(db, "Geometry")
+    for concept in (basics, algebra, calculus, geometry):
+        _assignments(db, concept, [1, 2, 3, 4, 5])
+    _mastery(db, 1, basics, 90.0)
+    _mastery(db, 1, geometry, 30.0)
+    db.commit()
+
+    # Basics is mastered; Calculus still needs Algebra
+    assert _selected(db, 1) == [("Geometry 2", 2), ("Algebra 1", 1)]
+
+def test_new_students_get_concepts_without_prerequisites(db):
+    basics = _concept(db, "Basics")
+    _concept(db, "Algebra", basics)
+    _assignments(db, basics, [1, 3])
+    db.commit()
+
+    assert _selected(db, 1) == [("Basics 1", 1)]
+
+def test_selection_stops_at_the_limit(db):
+    concepts = [_concept(db, f"Topic {i}") for i in range(adaptive_learning.ADAPTIVE_ASSIGNMENT_LIMIT + 3)]
+    for i, concept in enumerate(concepts):
+        _assignments(db, concept, [1])
+        _mastery(db, 1, concept, float(i))
+    db.commit()
+
+    selected = _selected(db, 1)
+    assert len(selected) == adaptive_learning.ADAPTIVE_ASSIGNMENT_LIMIT
+    assert selected[0] == ("Topic 0 1", 1)
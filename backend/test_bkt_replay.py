@@ -0,0 +1,104 @@
+"""
+The vectorized BKT replay must give the same mastery as stepping the scalar
+BayesianKnowledgeTracer through each response history one by one.
+"""
+import math
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import models
+from services import adaptive_learning
+from services.adaptive_learning import BatchKnowledgeTracer, BayesianKnowledgeTracer
+
+def _scalar_replay(tracer, responses, prior=None):
+    mastery = tracer.initial_mastery(responses[0]) if prior is None else prior
+    for correct in responses:
+        mastery = tracer.update_mastery(mastery, correct)
+    return mastery
+
+def _histories(rng, groups):
+    # Lengths vary so the replay loop has groups dropping out at every step
+    return [[rng.random() < 0.6 for _ in range(rng.randint(1, 12))] for _ in range(groups)]
+
+def _layout(histories):
+    group_starts = np.cumsum([0] + [len(history) for history in histories[:-1]])
+    correct = np.concatenate([np.array(history, dtype=bool) for history in histories])
+    return group_starts, correct
+
+def test_replay_matches_scalar_tracer_with_per_group_parameters():
+    rng = random.Random(7)
+    histories = _histories(rng, 200)
+    tracers = [
+        BayesianKnowledgeTracer(
+            init_prior=rng.uniform(0.05, 0.95), learn_rate=rng.uniform(0.0, 0.5),
+            guess_rate=rng.uniform(0.0, 0.4), slip_rate=rng.uniform(0.0, 0.4)
+        )
+        for _ in histories
+    ]
+    batch = BatchKnowledgeTracer(
+        init_prior=[t.init_prior for t in tracers], learn_rate=[t.learn_rate for t in tracers],
+        guess_rate=[t.guess_rate for t in tracers], slip_rate=[t.slip_rate for t in tracers]
+    )
+    group_starts, correct = _layout(histories)
+
+    replayed = batch.replay(group_starts, correct)
+    for i, history in enumerate(histories):
+        assert math.isclose(replayed[i], _scalar_replay(tracers[i], history), rel_tol=1e-12)
+
+    priors = np.array([t.init_prior for t in tracers])
+    replayed = batch.replay(group_starts, correct, prior=priors)
+    for i, history in enumerate(histories):
+        assert math.isclose(replayed[i], _scalar_replay(tracers[i], history, prior=priors[i]), rel_tol=1e-12)
+
+def test_update_matches_scalar_tracer_when_the_evidence_is_impossible():
+    # Zero guess/slip rates make some responses impossible; both keep the prior mastery
+    for slip, guess in [(0.0, 0.0), (0.0, 0.2), (0.2, 0.0)]:
+        scalar = BayesianKnowledgeTracer(learn_rate=0.3, guess_rate=guess, slip_rate=slip)
+        batch = BatchKnowledgeTracer(learn_rate=0.3, guess_rate=guess, slip_rate=slip)
+        for prev in (0.0, 0.4, 1.0):
+            for correct in (True, False):
+                updated = batch.update(np.array([prev]), np.array([correct]))[0]
+                assert math.isclose(updated, scalar.update_mastery(prev, correct), abs_tol=1e-15)
+
+def test_recompute_mastery_matches_scalar_updates(db):
+    rng = random.Random(11)
+    concepts = [models.Concepts(name=f"c{i}", description="") for i in range(3)]
+    db.add_all(concepts)
+    db.flush()
+    # One concept with fitted parameters, the others on the defaults
+    db.add(models.BKTParameters(
+        concept_id=concepts[0].id, init_prior=0.35, learn_rate=0.15, guess_rate=0.2, slip_rate=0.05
+    ))
+    assignments = [
+        models.Assignments(title=f"a{i}", description="", concept_id=concepts[i % 3].id, difficulty_level=1)
+        for i in range(18)
+    ]
+    db.add_all(assignments)
+    db.flush()
+
+    start = datetime.utcnow() - timedelta(days=30)
+    expected_history = {}
+    for student_id in range(1, 9):
+        for i, assignment in enumerate(rng.sample(assignments, rng.randint(1, len(assignments)))):
+            score = rng.choice([20.0, 55.0, 69.9, 70.0, 85.0, 100.0])
+            db.add(models.StudentAssignments(
+                student_id=student_id, assignment_id=assignment.id, status=models.AssignmentStatus.GRADED,
+                score=score, submitted_at=start + timedelta(hours=i)
+            ))
+            expected_history.setdefault((student_id, assignment.concept_id), []).append(
+                score >= adaptive_learning.MASTERY_CORRECT_THRESHOLD
+            )
+    db.commit()
+
+    results = adaptive_learning.recompute_mastery(db)
+    db.commit()
+
+    assert set(results) == set(expected_history)
+    for (student_id, concept_id), history in expected_history.items():
+        tracer = adaptive_learning.concept_tracers.get(concept_id, db)
+        expected = _scalar_replay(tracer, history) * 100
+        stored = db.get(models.StudentMastery, (student_id, concept_id))
+        assert math.isclose(results[(student_id, concept_id)], expected, rel_tol=1e-12)
+        assert math.isclose(stored.mastery_score, expected, rel_tol=1e-12)
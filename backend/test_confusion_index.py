@@ -0,0 +1,57 @@
+"""
+The vectorized confusion index over many (student, project) pairs must match
+calculate_confusion_index pair by pair.
+"""
+import math
+import random
+from datetime import datetime, timedelta
+
+import models
+from services import engagement_tracking
+
+def _log(db, student_id, project_id, value, timestamp, confusion_flag=False):
+    db.add(models.EngagementLogs(
+        student_id=student_id, project_id=project_id, engagement_type=models.EngagementType.PROJECT_WORK,
+        value=value, timestamp=timestamp, confusion_flag=confusion_flag
+    ))
+
+def _seed(db, now):
+    rng = random.Random(3)
+    histories = {
+        (1, 1): [5.0],  # a single log has no spread or trend
+        (1, 2): [4.0, 2.0],  # two logs have no trend
+        (2, 1): [3.0] * 6,  # constant values
+        (2, 2): [0.0] * 4,  # all zero
+        (3, 1): [float(v) for v in range(12, 0, -1)],  # steadily decreasing
+        (3, 2): [None, 1.0, None, 9.0],  # missing values count as zero
+    }
+    for student_id in range(4, 12):
+        for project_id in (1, 2, 3):
+            histories[(student_id, project_id)] = [
+                rng.uniform(0, 40) for _ in range(rng.randint(1, 25))
+            ]
+    for (student_id, project_id), values in histories.items():
+        start = now - timedelta(minutes=50)
+        for i, value in enumerate(values):
+            _log(db, student_id, project_id, value, start + timedelta(seconds=30 * i), rng.random() < 0.15)
+        # Older than the hour both versions look back over
+        _log(db, student_id, project_id, 100.0, now - timedelta(hours=2), True)
+    db.commit()
+    return list(histories)
+
+def test_vectorized_confusion_matches_scalar(db):
+    pairs = _seed(db, datetime.utcnow())
+    # (1, 3) and (3, 3) are never logged; (4, 3) is logged but not requested
+    requested = [pair for pair in pairs if pair != (4, 3)] + [(1, 3), (3, 3)]
+
+    batch = engagement_tracking.calculate_confusion_indices(requested, db)
+
+    assert set(batch) == set(requested)
+    for student_id, project_id in requested:
+        scalar = engagement_tracking.calculate_confusion_index(student_id, project_id, db)
+        assert math.isclose(batch[(student_id, project_id)], scalar, rel_tol=1e-9, abs_tol=1e-9), (student_id, project_id)
+    assert batch[(1, 3)] == 0.0
+    assert batch[(3, 1)] > 0.0
+
+def test_vectorized_confusion_of_no_pairs(db):
+    assert engagement_tracking.calculate_confusion_indices([], db) == {}
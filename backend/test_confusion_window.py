@@ -0,0 +1,93 @@
+"""
+The in-memory sliding windows must give the same confusion index as computing
+it from scratch over the events still inside the window, as events arrive,
+expire and get renumbered.
+"""
+import math
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import models
+from services import confusion_window, engagement_tracking
+from services.confusion_window import ConfusionWindowStore
+
+def _from_scratch(events):
+    if not events:
+        return 0.0
+    values = np.array([value for _, value, _ in events], dtype=np.float64)
+    flags = np.array([flag for _, _, flag in events], dtype=bool)
+    return float(engagement_tracking.confusion_scores(np.array([0]), values, flags)[0])
+
+def _assert_close(actual, expected):
+    assert math.isclose(actual, expected, rel_tol=1e-6, abs_tol=1e-6), (actual, expected)
+
+def _stream(store, rng, start, count, window_seconds):
+    events = []
+    timestamp = start
+    for _ in range(count):
+        # Irregular gaps, so each new event expires anywhere from none to several old ones
+        timestamp += timedelta(seconds=rng.randint(1, 90))
+        event = (timestamp, rng.uniform(0, 40), rng.random() < 0.1)
+        store.observe(1, 1, event[1], timestamp, event[2])
+        events.append(event)
+        now = timestamp + timedelta(seconds=1)
+        live = [e for e in events if e[0] >= now - timedelta(seconds=window_seconds)]
+        yield store.confusion_index(1, 1, now=now), _from_scratch(live)
+
+def test_window_matches_recomputation_as_events_expire():
+    rng = random.Random(5)
+    store = ConfusionWindowStore(window_seconds=1800)
+    for live, expected in _stream(store, rng, datetime(2026, 1, 1), 400, 1800):
+        _assert_close(live, expected)
+
+def test_window_matches_recomputation_across_rebases(monkeypatch):
+    # Renumber positions every few events instead of every million
+    monkeypatch.setattr(confusion_window, "_REBASE_AT", 8)
+    rng = random.Random(6)
+    store = ConfusionWindowStore(window_seconds=600)
+    for live, expected in _stream(store, rng, datetime(2026, 1, 1), 300, 600):
+        _assert_close(live, expected)
+
+def test_constant_values_have_no_spread():
+    store = ConfusionWindowStore(window_seconds=3600)
+    start = datetime(2026, 1, 1)
+    for i in range(50):
+        store.observe(1, 1, 0.1, start + timedelta(seconds=i))
+    _assert_close(store.confusion_index(1, 1, now=start + timedelta(minutes=1)), 0.0)
+
+def test_expired_windows_are_dropped():
+    store = ConfusionWindowStore(window_seconds=60)
+    start = datetime(2026, 1, 1)
+    store.observe(1, 1, 5.0, start, True)
+    store.observe(2, 1, 5.0, start + timedelta(seconds=50))
+    store.sweep(now=start + timedelta(seconds=90))
+    assert list(store._windows) == [(2, 1)]
+    assert store.confusion_index(1, 1, now=start + timedelta(seconds=90)) == 0.0
+
+def test_warmed_windows_match_the_database(db):
+    rng = random.Random(8)
+    now = datetime.utcnow()
+    for student_id in (1, 2, 3):
+        for project_id in (1, 2):
+            for i in range(rng.randint(1, 30)):
+                db.add(models.EngagementLogs(
+                    student_id=student_id, project_id=project_id, engagement_type=models.EngagementType.PROJECT_WORK,
+                    value=rng.uniform(0, 40), timestamp=now - timedelta(minutes=55) + timedelta(seconds=60 * i),
+                    confusion_flag=rng.random() < 0.1
+                ))
+            db.add(models.EngagementLogs(
+                student_id=student_id, project_id=project_id, engagement_type=models.EngagementType.PROJECT_WORK,
+                value=90.0, timestamp=now - timedelta(hours=3)
+            ))
+    db.commit()
+
+    store = ConfusionWindowStore(window_seconds=3600)
+    store.warm(db)
+    for student_id in (1, 2, 3):
+        for project_id in (1, 2):
+            _assert_close(
+                store.confusion_index(student_id, project_id),
+                engagement_tracking.calculate_confusion_index(student_id, project_id, db)
+            )
@@ -0,0 +1,81 @@
+"""
+Rebuilding engagement aggregates from rollups and raw logs must give the same
+aggregate as folding the events in one by one.
+"""
+import math
+import random
+from datetime import datetime, timedelta
+
+import models
+import schemas
+from services import engagement_tracking
+from services.engagement_rollups import compact_engagement_logs, purge_engagement_logs
+
+def _log_events(db, student_ids, start, count, seed, step=timedelta(minutes=37)):
+    rng = random.Random(seed)
+    events, timestamps = [], []
+    for i in range(count):
+        events.append(schemas.EngagementLogCreate(
+            student_id=rng.choice(student_ids),
+            project_id=None,
+            engagement_type=schemas.EngagementType.PROJECT_WORK,
+            value=rng.choice([0.0, 1.5, 5.0, 12.0, 40.0]),
+            metadata_json=None
+        ))
+        timestamps.append(start + step * i)
+    for i in range(0, count, 25):
+        engagement_tracking.log_engagement_batch(events[i:i + 25], db, timestamps=timestamps[i:i + 25])
+
+def _snapshot(db, student_id):
+    aggregate = db.get(models.EngagementAggregates, student_id)
+    db.refresh(aggregate)
+    return {
+        "event_count": aggregate.event_count,
+        "value_sum": aggregate.value_sum,
+        "hour_counts": list(aggregate.hour_counts),
+        "active_days": aggregate.active_days,
+        "first_day": aggregate.first_timestamp.date(),
+        "last_day": aggregate.last_timestamp.date(),
+        "recent_value_avg": aggregate.recent_value_avg,
+        "patterns": engagement_tracking.detect_engagement_patterns(student_id, db),
+    }
+
+def _assert_same(rebuilt, incremental):
+    for key in ("event_count", "hour_counts", "active_days", "first_day", "last_day", "patterns"):
+        assert rebuilt[key] == incremental[key], key
+    assert math.isclose(rebuilt["value_sum"], incremental["value_sum"], rel_tol=1e-9)
+    assert math.isclose(rebuilt["recent_value_avg"], incremental["recent_value_avg"], rel_tol=1e-9)
+
+def _students(db, count):
+    users = [
+        models.Users(name=f"s{i}", email=f"s{i}@example.com", password_hash="x", role=models.UserRole.STUDENT)
+        for i in range(count)
+    ]
+    db.add_all(users)
+    db.commit()
+    return [user.id for user in users]
+
+def test_rebuild_from_raw_logs_matches_incremental(db):
+    student_ids = _students(db, 3)
+    _log_events(db, student_ids, datetime.utcnow() - timedelta(days=5), 200, seed=1)
+    incremental = {student_id: _snapshot(db, student_id) for student_id in student_ids}
+
+    engagement_tracking.rebuild_engagement_aggregates(db)
+    db.commit()
+    for student_id in student_ids:
+        _assert_same(_snapshot(db, student_id), incremental[student_id])
+
+def test_rebuild_after_compaction_matches_incremental(db):
+    student_ids = _students(db, 3)
+    now = datetime.utcnow()
+    # Old enough to compact and purge, then a recent tail that stays raw
+    _log_events(db, student_ids, now - timedelta(days=60), 300, seed=2)
+    _log_events(db, student_ids, now - timedelta(seconds=60), 5, seed=3, step=timedelta(seconds=1))
+    incremental = {student_id: _snapshot(db, student_id) for student_id in student_ids}
+
+    assert compact_engagement_logs(db, chunk_size=40) == 300
+    assert purge_engagement_logs(db, retention_days=30)["raw_logs"] > 0
+    engagement_tracking.rebuild_engagement_aggregates(db)
+    db.commit()
+    for student_id in student_ids:
+        _assert_same(_snapshot(db, student_id), incremental[student_id])
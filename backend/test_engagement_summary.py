@@ -0,0 +1,35 @@
+"""
+The teacher dashboard's engagement summary covers compacted and not-yet-compacted logs.
+"""
+from datetime import datetime, timedelta
+
+import models
+from services.engagement_rollups import compact_engagement_logs, get_engagement_summary
+
+def _log(db, student_id, timestamp, value, confusion_flag=False):
+    db.add(models.EngagementLogs(
+        student_id=student_id, project_id=None, engagement_type=models.EngagementType.PROJECT_WORK,
+        value=value, timestamp=timestamp, confusion_flag=confusion_flag
+    ))
+
+def test_summary_includes_logs_past_the_watermark(db):
+    now = datetime.utcnow()
+    _log(db, 1, now - timedelta(days=2), 10.0)
+    _log(db, 1, now - timedelta(days=2, hours=1), 20.0)
+    db.commit()
+    compact_engagement_logs(db)
+
+    # Logged after the last compaction
+    _log(db, 1, now - timedelta(days=1), 6.0)
+    _log(db, 2, now - timedelta(days=1), 4.0, confusion_flag=True)
+    db.commit()
+
+    summary = get_engagement_summary([1, 2], db)
+    assert summary["active_students"] == 2
+    # Student 1 on two days, student 2 on one
+    assert summary["avg_daily_engagement"] == round(40.0 / 3, 2)
+    assert summary["high_confusion_cases"] == 1
+
+    # Compacting them changes nothing
+    assert compact_engagement_logs(db) == 2
+    assert get_engagement_summary([1, 2], db) == summary
@@ -1,5 +1,7 @@
 from database import SessionLocal
 import models
+# Registers the listener that invalidates cached principals when a role change commits
+import principal_cache
 
 def set_teacher_role(email: str):
     db = SessionLocal()
@@ -7,6 +9,7 @@ def set_teacher_role(email: str):
         user = db.query(models.Users).filter(models.Users.email == email).first()
         if user:
             user.role = models.UserRole.TEACHER
+            # The commit touches the principal cache stamp, so running API workers drop the old role
             db.commit()
             print(f"Success: User '{email}' has been updated to role 'teacher'.")
         else: